@@ -1,272 +1,171 @@
-import streamlit as st
-import pandas as pd
 import sqlite3
 
-
-# Create a connection to the SQLite database
-conn = sqlite3.connect('new_patient_data.db')
-c = conn.cursor()
-
-# Create a table to store patient data
-c.execute('''CREATE TABLE IF NOT EXISTS patients (
-                patient_id INTEGER PRIMARY KEY,
-                name TEXT,
-                age INTEGER,
-                sex TEXT,
-                weight REAL,
-                height REAL,
-                waist_hip_ratio REAL,
-                body_fat_percentage REAL,
-                bmi REAL,
-                bmr REAL,
-                lean_body_mass REAL,
-                body_fat_mass REAL,
-                muscle_mass REAL,
-                visceral_fat_level REAL,
-                body_water_percentage REAL,
-                bone_mineral_content REAL,
-                resting_metabolic_rate REAL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )''')
-
-# Commit changes and close the connection
-conn.commit()
-conn.close()
-
-
-
-# Function to insert patient data into the database
-def insert_patient_data(name, age, sex, weight, height, waist_hip_ratio, body_fat_percentage,
-                         bmi, bmr, lean_body_mass, body_fat_mass, muscle_mass,
-                         visceral_fat_level, body_water_percentage, bone_mineral_content, resting_metabolic_rate):
-    # Function implementation
-
-    conn = sqlite3.connect('new_patient_data.db')  # Connect to the new database
-    c = conn.cursor()
-    c.execute('''INSERT INTO patients (
-                    name, age, sex, weight, height, waist_hip_ratio, body_fat_percentage,
-                    bmi, bmr, lean_body_mass, body_fat_mass, muscle_mass, visceral_fat_level,
-                    body_water_percentage, bone_mineral_content, resting_metabolic_rate)
-                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-              (name, age, sex, weight, height, waist_hip_ratio, body_fat_percentage,
-               bmi, bmr, lean_body_mass, body_fat_mass, muscle_mass, visceral_fat_level,
-               body_water_percentage, bone_mineral_content, resting_metabolic_rate))
-    conn.commit()
-    conn.close()
-
-# Function to fetch patient data for the current user
-def fetch_patient_data(name):
-    conn = sqlite3.connect('new_patient_data.db')  # Connect to the new database
-    c = conn.cursor()
-    c.execute('''SELECT * FROM patients WHERE name = ?''', (name,))
-    data = c.fetchall()
-    conn.close()
-    return data
-
-
-# Define normal ranges for each parameter
-normal_ranges = {
-    'BMI': (18.5, 24.9),
-    'BMR': (1200, 2500),  # Updated range based on Harris-Benedict equation
-    'Lean Body Mass': (50, 90),
-    'Body Fat Mass': (10, 30),
-    'Waist-to-Hip Ratio': (0.8, 0.85),  # Updated to commonly accepted range
-    'Muscle Mass': (40, 60),
-    'Visceral Fat Level': (1, 12),  # Updated to commonly accepted range
-    'Body Water Percentage': (45, 60),
-    'Bone Mineral Content': (1.5, 3.5),
-    'Resting Metabolic Rate (RMR)': (1200, 2500)  # Updated range based on Harris-Benedict equation
-}
-
-# Define findings for each result
-findings = {
-    'BMI': {
-        'Underweight': 'Your BMI indicates that you are underweight. This may suggest a higher risk of certain health issues such as nutritional deficiencies and osteoporosis.',
-        'Normal weight': 'Your BMI falls within the normal range. This indicates a healthy weight for your height.',
-        'Overweight': 'Your BMI indicates that you are overweight. This may increase your risk of developing various health problems such as heart disease and type 2 diabetes.',
-        'Obesity': 'Your BMI indicates that you are obese. Obesity is associated with an increased risk of several serious health conditions, including heart disease, stroke, type 2 diabetes, and certain cancers.'
-    },
-    'BMR': {
-        'Low': 'Your BMR is lower than normal, which may indicate a slower metabolism. This could be due to various factors such as age, sex, muscle mass, and hormonal imbalances.',
-        'Normal': 'Your BMR falls within the normal range. This suggests that your metabolism is functioning adequately to support basic bodily functions.',
-        'High': 'Your BMR is higher than normal, which may indicate a faster metabolism. Factors such as genetics, physical activity level, and muscle mass can influence your metabolic rate.'
-    },
-    'Lean Body Mass': {
-        'Low': 'Your lean body mass is lower than normal. Lean body mass includes muscles, bones, organs, and water. Increasing muscle mass through resistance training and consuming adequate protein can help improve lean body mass.',
-        'Normal': 'Your lean body mass falls within the normal range. This suggests that you have an appropriate amount of muscle, bone, and other lean tissues for your height and weight.',
-        'High': 'Your lean body mass is higher than normal. Having a higher lean body mass can indicate greater strength, endurance, and overall fitness. However, it\'s important to maintain a balance between muscle mass and body fat.'
-    },
-    'Body Fat Mass': {
-        'Low': 'Your body fat mass is lower than normal. While a low body fat percentage may be desirable for some athletes, it can also indicate inadequate energy reserves and potential health risks. Ensure that you are consuming enough calories and nutrients to support your body\'s needs.',
-        'Normal': 'Your body fat mass falls within the normal range. This suggests a healthy balance between lean tissues and stored fat.',
-        'High': 'Your body fat mass is higher than normal. Excess body fat can increase the risk of various health conditions such as heart disease, diabetes, and certain cancers. Consider adopting a balanced diet and regular exercise routine to reduce body fat.'
-    },
-    'Waist-to-Hip Ratio': {
-        'Normal': 'Your waist-to-hip ratio falls within the normal range. This indicates a healthy distribution of body fat, which may lower the risk of obesity-related health issues such as heart disease and diabetes.'
-    },
-    'Muscle Mass': {
-        'Low': 'Your muscle mass is lower than normal. Adequate muscle mass is essential for strength, mobility, and overall health. Consider incorporating resistance training exercises and consuming sufficient protein to support muscle growth and maintenance.',
-        'Normal': 'Your muscle mass falls within the normal range. This suggests good muscle development and overall physical fitness.',
-        'High': 'Your muscle mass is higher than normal. Having greater muscle mass can enhance metabolism, strength, and functional capacity. Continue with your current exercise routine to maintain muscle health.'
-    },
-    'Visceral Fat Level': {
-        'Low': 'Your visceral fat level is lower than normal. Visceral fat surrounds organs and can contribute to various health problems when elevated. Maintaining a healthy weight, engaging in regular physical activity, and consuming a balanced diet can help prevent visceral fat accumulation.',
-        'Normal': 'Your visceral fat level falls within the normal range. This suggests a healthy distribution of fat within the body, which may lower the risk of metabolic disorders and cardiovascular disease.',
-        'High': 'Your visceral fat level is higher than normal. Excess visceral fat is associated with an increased risk of metabolic syndrome, heart disease, and type 2 diabetes. Focus on lifestyle modifications such as dietary changes and increased physical activity to reduce visceral fat levels.'
-    },
-    'Body Water Percentage': {
-        'Low': 'Your body water percentage is lower than normal. Adequate hydration is essential for various bodily functions, including temperature regulation, digestion, and nutrient transport. Increase your water intake and consume hydrating foods to maintain optimal hydration levels.',
-        'Normal': 'Your body water percentage falls within the normal range. This suggests adequate hydration, which is crucial for overall health and well-being.',
-        'High': 'Your body water percentage is higher than normal. While hydration is important, excessive water retention may indicate underlying health issues such as kidney dysfunction or hormonal imbalances. Consult with a healthcare professional for further evaluation.'
-    },
-    'Bone Mineral Content': {
-        'Low': 'Your bone mineral content is lower than normal. Adequate bone mineral density is essential for skeletal health and reducing the risk of fractures and osteoporosis. Ensure adequate intake of calcium, vitamin D, and engage in weight-bearing exercises to promote bone health.',
-        'Normal': 'Your bone mineral content falls within the normal range. This suggests good bone density and overall skeletal health. Maintain a balanced diet and engage in regular physical activity to support bone health.',
-        'High': 'Your bone mineral content is higher than normal. While higher bone density is generally beneficial for skeletal strength, excessively high bone mineral content may indicate underlying health conditions such as hyperparathyroidism or certain cancers. Further evaluation may be warranted.'
-    },
-    'Resting Metabolic Rate (RMR)': {
-        'Low': 'Your RMR is lower than normal, which may indicate a slower metabolism. A lower metabolic rate can make it more challenging to maintain or lose weight. Factors such as age, sex, body composition, and medical conditions can influence RMR.',
-        'Normal': 'Your RMR falls within the normal range. This suggests that your metabolism is functioning adequately to support basic bodily functions at rest. Regular physical activity and dietary choices can influence metabolic rate.',
-        'High': 'Your RMR is higher than normal, which may indicate a faster metabolism. A higher metabolic rate can lead to increased calorie burning and easier weight maintenance. Factors such as genetics, muscle mass, and thyroid function can influence RMR.'
-    }
-}
-
-def plot_progressions(data):
-    # Extracting data for plotting
-    weight_data = [entry[4] for entry in data]  # Extracting weight from data
-    body_fat_percentage_data = [entry[7] for entry in data]  # Extracting body fat percentage from data
-    muscle_mass_data = [calculate_muscle_mass(entry[4], entry[7]) for entry in data]  # Calculating muscle mass from weight and body fat percentage
+import streamlit as st
+import pandas as pd
+from datetime import timedelta
+
+import metrics
+from charts import minmax_downsample
+from classification import classify_results, METRIC_COLUMNS
+from core import (calculate_bmi, calculate_ideal_weight, calculate_weight_difference, calculate_total_body_water,
+                  calculate_bmr, calculate_lean_body_mass, calculate_body_fat_mass, calculate_waist_to_hip_ratio,
+                  calculate_muscle_mass, calculate_visceral_fat_level, calculate_body_water_percentage,
+                  calculate_bone_mineral_content, calculate_rmr, calculate_calorie_intake)
+from importer import import_scans, IMPORT_FORMATS
+from exporter import export_to_file, EXPORT_FORMATS
+from database import (insert_patient_data, fetch_patient_history, fetch_patient_trend, fetch_progression_series,
+                      fetch_cohort_percentiles, search_patients, register_patient, history_version,
+                      history_cache_stats, HISTORY_COLUMNS)
+
+
+@st.fragment
+@metrics.rerun('analyzer.chart')
+def plot_progressions(name, trend, history):
+    # Time axis over the patient's whole history; narrowing the range refetches that window at full resolution
+    first_scan = pd.Timestamp(trend['first_scan_at']).to_pydatetime()
+    last_scan = pd.Timestamp(trend['last_scan_at']).to_pydatetime()
+    start, end = first_scan, last_scan
+    if last_scan - first_scan >= timedelta(days=1):
+        start, end = st.slider('Date range:', min_value=first_scan, max_value=last_scan,
+                               value=(first_scan, last_scan), format='YYYY-MM-DD')
+
+    charts = history.setdefault('charts', {})
+    if (start, end) not in charts:
+        if len(charts) >= 8:
+            charts.clear()
+        with metrics.span('analyzer.db.progression_series'):
+            series = fetch_progression_series(name, start.strftime('%Y-%m-%d %H:%M:%S'), end.strftime('%Y-%m-%d %H:%M:%S'))
+        chart_df = pd.DataFrame(series, columns=['Date', 'Weight', 'Body Fat Percentage', 'Muscle Mass'])
+        chart_df['Date'] = pd.to_datetime(chart_df['Date'], format='ISO8601')
+        charts[(start, end)] = (len(chart_df), minmax_downsample(chart_df.set_index('Date')))
+    point_count, chart_df = charts[(start, end)]
 
     # Plotting
-    st.line_chart({"Weight": weight_data, "Body Fat Percentage": body_fat_percentage_data, "Muscle Mass": muscle_mass_data})
-
-
-# Calculate BMI
-def calculate_bmi(weight, height):
-    return weight / (height ** 2)
-
-# Calculate weight status based on BMI
-def calculate_weight_status(bmi):
-    if bmi < 18.5:
-        return "Underweight"
-    elif 18.5 <= bmi < 25:
-        return "Normal"
-    elif 25 <= bmi < 30:
-        return "Overweight"
-    else:
-        return "Obese"
-
-# Calculate Ideal Weight
-def calculate_ideal_weight(height, sex):
-    if sex == 'Male':
-        return 50 + 0.91 * (height - 152.4)
-    else:
-        return 45.5 + 0.91 * (height - 152.4)
-
-# Calculate Weight Difference
-def calculate_weight_difference(current_weight, ideal_weight):
-    difference = current_weight - ideal_weight
-    status = "Normal" if difference == 0 else "Underweight" if difference < 0 else "Overweight"
-    return status, abs(difference)
-
-# Calculate Total Body Water (TBW)
-def calculate_total_body_water(weight, height, age, sex):
-    if sex == 'Male':
-        tbw = 2.447 - 0.09156 * age + 0.1074 * height + 0.3362 * weight
-    else:
-        tbw = -2.097 + 0.1069 * height + 0.2466 * weight
-    return tbw
-
-
-# Calculate BMR (Basal Metabolic Rate) using Harris-Benedict equation
-def calculate_bmr(weight, height, age, sex):
-    if sex == 'Male':
-        bmr = 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
-    else:
-        bmr = 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
-    return bmr
-
-# Calculate Lean Body Mass
-def calculate_lean_body_mass(weight, body_fat_percentage):
-    return weight * (1 - body_fat_percentage / 100)
-
-# Calculate Body Fat Mass
-def calculate_body_fat_mass(weight, body_fat_percentage):
-    return weight * (body_fat_percentage / 100)
-
-# Calculate Waist-to-Hip Ratio
-def calculate_waist_to_hip_ratio(waist_to_hip_ratio):
-    return waist_to_hip_ratio
-
-# Calculate Muscle Mass
-def calculate_muscle_mass(weight, body_fat_percentage):
-    lean_body_mass = calculate_lean_body_mass(weight, body_fat_percentage)
-    return lean_body_mass * 0.85
-
-# Calculate Visceral Fat Level
-def calculate_visceral_fat_level(waist_hip_ratio, sex):
-    if sex == 'Male':
-        visceral_fat_level = 10 * waist_hip_ratio - 5
-    else:
-        visceral_fat_level = 10 * waist_hip_ratio - 6
-    return visceral_fat_level
-
-# Calculate Body Water Percentage
-def calculate_body_water_percentage(weight, body_fat_percentage, sex):
-    if sex == 'Male':
-        lean_body_mass = weight * (1 - body_fat_percentage / 100)
-        body_water_percentage = 60 + 0.1 * (lean_body_mass - 50)
-    else:
-        lean_body_mass = weight * (1 - body_fat_percentage / 100)
-        body_water_percentage = 50 + 0.1 * (lean_body_mass - 45)
-    return body_water_percentage
-
-# Calculate Bone Mineral Content
-def calculate_bone_mineral_content(weight):
-    return weight * 0.03
-
-# Calculate Resting Metabolic Rate (RMR)
-def calculate_rmr(weight, height, age, sex):
-    return calculate_bmr(weight, height, age, sex)
-
-# Calculate Ideal Weight
-def calculate_ideal_weight(height, sex):
-    if sex == 'Male':
-        return 50 + 0.91 * (height - 152.4)
-    else:
-        return 45.5 + 0.91 * (height - 152.4)
-
-def calculate_calorie_intake(weight, height, age, sex, activity, goal_weight, rate_of_change):
-    # Define activity level multipliers
-    activity_multipliers = {'Sedentary': 1.2, 'Lightly active': 1.375, 'Moderately active': 1.55, 'Very active': 1.725}
-
-    # Calculate BMR (Basal Metabolic Rate) based on sex
-    if sex == 'Male':
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-    else:
-        bmr = 10 * weight + 6.25 * height - 5 * age - 161
+    st.line_chart(chart_df)
+    if len(chart_df) < point_count:
+        st.caption(f'Showing {len(chart_df)} of {point_count} scans; narrow the date range for more detail.')
+
+
+# Summarize a patient's progress from the incrementally maintained trend store
+def show_progress_summary(trend):
+    labels = {'weight': ('Weight', 'kg'), 'body_fat_percentage': ('Body Fat Percentage', '%'),
+              'muscle_mass': ('Muscle Mass', 'kg'), 'bmi': ('BMI', '')}
+    st.write('## Progress Summary')
+    st.caption(f"{trend['scan_count']} scans from {trend['first_scan_at']} to {trend['last_scan_at']}")
+    for column, (metric, (label, unit)) in zip(st.columns(len(labels)), labels.items()):
+        values = trend['metrics'][metric]
+        if values['latest'] is None:
+            continue
+        column.metric(label, f"{values['latest']:.1f} {unit}".rstrip(),
+                      delta=f"{values['delta']:+.1f} {unit}".rstrip() if values['delta'] is not None else None)
+        if values['rolling_mean'] is not None:
+            column.caption(f"Rolling mean: {values['rolling_mean']:.1f} {unit}".rstrip())
+        if values['weekly_change'] is not None:
+            column.caption(f"Last change: {values['weekly_change']:+.2f} {unit}/week")
+        if values['overall_weekly_change'] is not None:
+            column.caption(f"Since first scan: {values['overall_weekly_change']:+.2f} {unit}/week")
+
+
+# Load the next page of a patient's history into the session. Starts over when the patient changes
+# or when any session has saved a new scan for them since the pages were loaded.
+def load_patient_history(name):
+    history = st.session_state.get('patient_history')
+    if history is None or history['name'] != name or history['version'] != history_version(name):
+        history = {'name': name, 'version': history_version(name), 'rows': [], 'cursor': None, 'exhausted': False}
+        st.session_state['patient_history'] = history
+    if not history['exhausted']:
+        rows, cursor = fetch_patient_history(name, history['cursor'])
+        history['rows'].extend(rows)
+        history['cursor'] = cursor
+        history['exhausted'] = cursor is None
+        history['data_df'] = pd.DataFrame(history['rows'], columns=HISTORY_COLUMNS)
+    return history
+
+
+# Units shown next to each result
+result_units = {
+    'BMI': 'kg', 'Lean Body Mass': 'kg', 'Body Fat Mass': 'kg', 'Muscle Mass': 'kg', 'Bone Mineral Content': 'kg',
+    'Ideal Weight': 'kg', 'Weight Difference': 'kg', 'Total Body Water': 'kg', 'Min Calorie Intake': 'kg',
+    'Max Calorie Intake': 'kg', 'BMR': 'kcal/day', 'RMR': 'kcal/day', 'Body Water Percentage': '%',
+}
 
-    # Adjust BMR based on activity level
-    bmr *= activity_multipliers[activity]
 
-    # Calculate calorie intake based on goal (assuming 0.45 kg of weight loss/gain per week equals 500 kcal deficit/surplus per day)
-    if goal_weight > weight:
-        min_calorie_intake = bmr + (rate_of_change * 500)
-        max_calorie_intake = bmr + ((rate_of_change + 0.45) * 500)
-    elif goal_weight < weight:
-        min_calorie_intake = bmr - ((-rate_of_change + 0.45) * 500)
-        max_calorie_intake = bmr - (-rate_of_change * 500)
+# One row per classified result: value, unit, normal range, status, finding, position in the range
+# and percentile among the saved scans of the patient's cohort (`percentiles`, keyed by patients column)
+def result_rows(body_composition_results, classification, percentiles):
+    rows = []
+    for result, value in body_composition_results.items():
+        classified = classification.get(result)
+        if classified is None:
+            continue
+        cohort = percentiles.get(METRIC_COLUMNS.get(result))
+        low, high = classified['low'], classified['high']
+        # Position within the normal range; a range open at the bottom starts at 0
+        lower = low if low is not None else 0
+        rows.append({
+            'Metric': result,
+            'Result': value,
+            'Unit': result_units.get(result, ''),
+            'Normal Range': f'{low:g} - {high:g}' if low is not None else f'up to {high:g}',
+            'Status': classified['status'],
+            'Finding': classified['finding'],
+            'Position': max(0, min(1, (value - lower) / (high - lower))),
+            'Percentile': cohort['percentile'] if cohort else None,
+            'Cohort': f"{cohort['cohort']} (n={cohort['size']:,})" if cohort else '',
+        })
+    return rows
+
+
+# A section per metric: heading, result, status, finding and a gauge (five elements each)
+def show_results_detailed(rows):
+    for row in rows:
+        st.markdown(f"### {row['Metric']}")
+        st.markdown(f"Result: {row['Result']} {row['Unit']} (Normal Range: {row['Normal Range']} {row['Unit']})")
+        if row['Percentile'] is not None:
+            st.markdown(f"Status: {row['Status']} - percentile {row['Percentile']:.0f} among {row['Cohort']}")
+        else:
+            st.markdown(f"Status: {row['Status']}")
+        st.markdown(f"Finding: {row['Finding']}")
+        st.progress(row['Position'])
+        st.markdown("---")
+
+
+# The whole panel as one table, sent to the browser as a single element; the gauges become a progress column
+def show_results_compact(rows):
+    st.dataframe(pd.DataFrame(rows), hide_index=True, column_config={
+        'Result': st.column_config.NumberColumn(format='%.2f'),
+        'Finding': st.column_config.TextColumn(width='large'),
+        'Position': st.column_config.ProgressColumn('Position in Normal Range', min_value=0, max_value=1, format=' '),
+        'Percentile': st.column_config.NumberColumn(format='%.0f', help='Percentile among saved scans of the cohort'),
+    })
+
+
+# Hidden page (open the app with ?diagnostics=1): section timings recorded by every session of this process
+def show_diagnostics():
+    st.title('GeBody - Diagnostics')
+    spans = metrics.snapshot()
+    if not spans:
+        st.info('No timings recorded yet.')
     else:
-        min_calorie_intake = bmr - 500
-        max_calorie_intake = bmr + 500
-
-    return min_calorie_intake, max_calorie_intake
-
-
-def main():
-    st.title('GeBody - Body Composition Analyzer')
-
-    name = st.text_input('Enter patient name:')
+        timings = pd.DataFrame(spans).set_index('span')
+        columns = ['last', 'mean', 'p50', 'p95', 'p99', 'max']
+        timings[columns] = (timings[columns] * 1000).round(2)
+        st.caption(f'Milliseconds; percentiles over the last {metrics.ROLLING_WINDOW} runs of each span.')
+        st.dataframe(timings[['count'] + columns])
+    st.download_button('Download Prometheus metrics', data=metrics.prometheus_text(), file_name='gebody.prom',
+                       mime='text/plain')
+    if metrics.METRICS_FILE:
+        st.caption(f'Written to {metrics.METRICS_FILE} every {metrics.METRICS_INTERVAL:g}s.')
+    if metrics.METRICS_PORT:
+        st.caption(f'Served at http://127.0.0.1:{metrics.METRICS_PORT}/metrics.')
+    st.button('Reset timings', on_click=metrics.reset)
+
+
+# Measurements, results and saving. A fragment: editing a field or pressing Calculate reruns only this
+# view, not the rest of the page.
+@st.fragment
+@metrics.rerun('analyzer.calculate_view')
+def calculate_view(name):
     age = st.number_input('Enter age:', min_value=0, max_value=150, value=30)
     sex = st.radio('Select sex:', ('Male', 'Female'))
     weight = st.number_input('Enter weight (kg):', min_value=0.0, value=70.0)
@@ -296,15 +195,14 @@ def main():
     else:
         goal_action = "Maintain weight"
 
-    # Calculate calorie intake based on the goal action
-    min_calorie_intake, max_calorie_intake = calculate_calorie_intake(weight, height, age, sex, activity, goal_weight, rate_of_change)
+    compact_results = st.checkbox('Compact results', value=True,
+                                  help='Show the results as one table instead of a section per metric')
+    if st.button('Calculate'):
+        # Calculate calorie intake based on the goal action
+        min_calorie_intake, max_calorie_intake = calculate_calorie_intake(weight, height, age, sex, activity, goal_weight, rate_of_change)
 
-
-    action = st.selectbox('Choose an action:', ['Calculate', 'Show Data'])
-
-    if action == "Calculate":
-        if st.button('Calculate'):
-            # Perform calculations
+        # Perform calculations
+        with metrics.span('analyzer.calculate'):
             bmi = calculate_bmi(weight, height / 100)  # Convert height to meters
             ideal_weight = calculate_ideal_weight(height, sex)
             weight_status, weight_difference = calculate_weight_difference(weight, ideal_weight)
@@ -319,109 +217,200 @@ def main():
             rmr = calculate_rmr(weight, height, age, sex)
             total_body_water = calculate_total_body_water(weight, height, age, sex)
 
+        with metrics.span('analyzer.db.insert_patient_data'):
             insert_patient_data(name, age, sex, weight, height, waist_hip_ratio, body_fat_percentage,
                                 bmi, bmr, lean_body_mass, body_fat_mass, muscle_mass,
                                 visceral_fat_level, body_water_percentage, bone_mineral_content, rmr)
-            st.success('Patient data saved successfully!')
-
-            # Grouping results into categories
-            body_composition_results = {
-                'BMI': bmi,
-                'BMR': bmr,
-                'Lean Body Mass': lean_body_mass,
-                'Body Fat Mass': body_fat_mass,
-                'Waist-to-Hip Ratio': waist_to_hip_ratio,
-                'Muscle Mass': muscle_mass,
-                'Visceral Fat Level': visceral_fat_level,
-                'Body Water Percentage': body_water_percentage,
-                'Bone Mineral Content': bone_mineral_content,
-                'Resting Metabolic Rate (RMR)': rmr,
-                'Ideal Weight': ideal_weight,
-                'Weight Status': weight_status,
-                'Weight Difference': weight_difference,
-                'Total Body Water': total_body_water,
-                'Min Calorie Intake': min_calorie_intake,
-                'Max Calorie Intake': max_calorie_intake,
-                'Dietary Recommendations': []  # Placeholder for dietary recommendations
-            }
-
-            # Generate recommendations based on other parameters
-            if body_fat_percentage:
-                if body_fat_percentage < 10:
-                    body_composition_results['Dietary Recommendations'].append("Your body fat percentage is extremely low. It's important to maintain a healthy level of body fat to support bodily functions. Consider consulting a healthcare professional for personalized advice.")
-                elif body_fat_percentage > 30:
-                    body_composition_results['Dietary Recommendations'].append("Your body fat percentage is higher than normal. Consider incorporating more physical activity and dietary changes to reduce body fat levels.")
+        st.success('Patient data saved successfully!')
+
+        # Grouping results into categories
+        body_composition_results = {
+            'BMI': bmi,
+            'BMR': bmr,
+            'Lean Body Mass': lean_body_mass,
+            'Body Fat Mass': body_fat_mass,
+            'Waist-to-Hip Ratio': waist_to_hip_ratio,
+            'Muscle Mass': muscle_mass,
+            'Visceral Fat Level': visceral_fat_level,
+            'Body Water Percentage': body_water_percentage,
+            'Bone Mineral Content': bone_mineral_content,
+            'Resting Metabolic Rate (RMR)': rmr,
+            'Ideal Weight': ideal_weight,
+            'Weight Status': weight_status,
+            'Weight Difference': weight_difference,
+            'Total Body Water': total_body_water,
+            'Min Calorie Intake': min_calorie_intake,
+            'Max Calorie Intake': max_calorie_intake,
+            'Dietary Recommendations': []  # Placeholder for dietary recommendations
+        }
+
+        # Generate recommendations based on other parameters
+        if body_fat_percentage:
+            if body_fat_percentage < 10:
+                body_composition_results['Dietary Recommendations'].append("Your body fat percentage is extremely low. It's important to maintain a healthy level of body fat to support bodily functions. Consider consulting a healthcare professional for personalized advice.")
+            elif body_fat_percentage > 30:
+                body_composition_results['Dietary Recommendations'].append("Your body fat percentage is higher than normal. Consider incorporating more physical activity and dietary changes to reduce body fat levels.")
+            else:
+                body_composition_results['Dietary Recommendations'].append("Your body fat percentage falls within the normal range. Keep up the good work with your diet and exercise routine.")
+
+        if waist_hip_ratio:
+            if sex == 'Male':
+                if waist_hip_ratio > 0.9:
+                    body_composition_results['Dietary Recommendations'].append("Your waist-to-hip ratio indicates higher abdominal fat. Consider incorporating more cardiovascular exercises and reducing calorie intake to target abdominal fat.")
                 else:
-                    body_composition_results['Dietary Recommendations'].append("Your body fat percentage falls within the normal range. Keep up the good work with your diet and exercise routine.")
-
-            if waist_hip_ratio:
-                if sex == 'Male':
-                    if waist_hip_ratio > 0.9:
-                        body_composition_results['Dietary Recommendations'].append("Your waist-to-hip ratio indicates higher abdominal fat. Consider incorporating more cardiovascular exercises and reducing calorie intake to target abdominal fat.")
-                    else:
-                        body_composition_results['Dietary Recommendations'].append("Your waist-to-hip ratio falls within the normal range. Keep up the good work with your fitness routine.")
+                    body_composition_results['Dietary Recommendations'].append("Your waist-to-hip ratio falls within the normal range. Keep up the good work with your fitness routine.")
+            else:
+                if waist_hip_ratio > 0.85:
+                    body_composition_results['Dietary Recommendations'].append("Your waist-to-hip ratio indicates higher abdominal fat. Consider incorporating more cardiovascular exercises and reducing calorie intake to target abdominal fat.")
                 else:
-                    if waist_hip_ratio > 0.85:
-                        body_composition_results['Dietary Recommendations'].append("Your waist-to-hip ratio indicates higher abdominal fat. Consider incorporating more cardiovascular exercises and reducing calorie intake to target abdominal fat.")
-                    else:
-                        body_composition_results['Dietary Recommendations'].append("Your waist-to-hip ratio falls within the normal range. Keep up the good work with your fitness routine.")
-
-            # Displaying results in a collapsible box
-            with st.expander("Results", expanded=True):
-                for result, value in body_composition_results.items():
-                    unit = ""
-                    if result in ["BMI", "Lean Body Mass", "Body Fat Mass", "Muscle Mass", "Bone Mineral Content", "Ideal Weight", "Weight Difference", "Total Body Water", "Min Calorie Intake", "Max Calorie Intake"]:
-                        unit = "kg"
-                    elif result in ["BMR", "RMR"]:
-                        unit = "kcal/day"
-                    elif result == "Body Water Percentage":
-                        unit = "%"
-                    elif result == "Waist-to-Hip Ratio":
-                        unit = ""
-                    elif result == "Dietary Recommendations":
-                        continue  # Skip displaying dietary recommendations here
-                    normal_range = normal_ranges.get(result)
-                    if normal_range is not None:
-                        # Calculate status based on predefined thresholds
-                        status = ""
-                        if result in findings:
-                            for ind, description in findings[result].items():
-                                if normal_range[0] <= value <= normal_range[1]:
-                                    status = ind
-                                    break
-
-                        progress_value = max(0, min(1, (value - normal_range[0]) / (normal_range[1] - normal_range[0])))
-                        color = 'green' if status == 'Normal' else 'red'
-                        st.markdown(f'### {result}')
-                        st.markdown(f'Result: {value} {unit} (Normal Range: {normal_range[0]} - {normal_range[1]} {unit})')
-                        st.markdown(f"Status: {status}")
-                        st.markdown(f"Finding: {findings[result].get(status, 'No finding available')}")
-                        st.progress(progress_value)
-                        st.markdown("---")
-
-            # Display dietary recommendations separately
-            st.write('## Dietary Recommendations')
-            for recommendation in body_composition_results['Dietary Recommendations']:
-                st.write(recommendation)
-            # Display calorie intake for weight management
-            st.write('### Calorie Intake for Weight Management')
-            st.markdown(f'Minimum Calorie Intake: {min_calorie_intake} kcal/day')
-            st.markdown(f'Maximum Calorie Intake: {max_calorie_intake} kcal/day')
-
-    elif action == "Show Data":
-        data = fetch_patient_data(name)
-        if data:
-            st.write('## Patient Data')
-            headers = ["ID", "Name", "Age", "Sex", "Weight", "Height", "Waist-to-Hip Ratio", "Body Fat Percentage"]
-            data_df = pd.DataFrame(data)
-            st.dataframe(data_df)
-            # Plot progressions if data is available
+                    body_composition_results['Dietary Recommendations'].append("Your waist-to-hip ratio falls within the normal range. Keep up the good work with your fitness routine.")
+
+        # Classify every metric against the sex- and age-specific reference ranges in one pass
+        with metrics.span('analyzer.classify'):
+            classification = classify_results(body_composition_results, sex, age)
+        with metrics.span('analyzer.db.cohort_percentiles'):
+            percentiles = fetch_cohort_percentiles({METRIC_COLUMNS[result]: body_composition_results[result]
+                                                    for result in METRIC_COLUMNS}, sex, age)
+
+        # Displaying results in a collapsible box
+        with metrics.span('analyzer.render_results'), st.expander("Results", expanded=True):
+            rows = result_rows(body_composition_results, classification, percentiles)
+            if compact_results:
+                show_results_compact(rows)
+            else:
+                show_results_detailed(rows)
+
+        # Display dietary recommendations separately
+        st.write('## Dietary Recommendations')
+        for recommendation in body_composition_results['Dietary Recommendations']:
+            st.write(recommendation)
+        # Display calorie intake for weight management
+        st.write('### Calorie Intake for Weight Management')
+        st.markdown(f'Minimum Calorie Intake: {min_calorie_intake} kcal/day')
+        st.markdown(f'Maximum Calorie Intake: {max_calorie_intake} kcal/day')
+
+
+# Patient history with its own fragments: loading older scans, moving the chart's date range or picking
+# export dates reruns only that part. The trend summary is fetched once per history version.
+def show_data_view(name):
+    history = st.session_state.get('patient_history')
+    if history is None or history['name'] != name or history['version'] != history_version(name):
+        with metrics.span('analyzer.db.patient_history'):
+            history = load_patient_history(name)
+    if history['rows']:
+        if 'trend' not in history:
+            with metrics.span('analyzer.db.patient_trend'):
+                history['trend'] = fetch_patient_trend(name)
+        trend = history['trend']
+        if trend is not None:
+            show_progress_summary(trend)
+        show_history_table(name)
+        # Plot progressions if data is available
+        if trend is not None:
             st.write('## Progressions Over Time')
-            plot_progressions(data)
+            plot_progressions(name, trend, history)
+        show_export(name)
+    else:
+        st.warning('No data found for this patient.')
+    cache_stats = history_cache_stats()
+    st.caption(f"History cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+               f"{cache_stats['invalidations']} invalidations, {cache_stats['patients']} patients cached")
+
+
+@st.fragment
+@metrics.rerun('analyzer.history_table')
+def show_history_table(name):
+    history = st.session_state['patient_history']
+    st.write('## Patient Data')
+    headers = ["ID", "Date", "Age", "Sex", "Weight", "Height", "Waist-to-Hip Ratio", "Body Fat Percentage"]
+    data_df = history['data_df']
+    st.dataframe(data_df.rename(columns=dict(zip(HISTORY_COLUMNS, headers))), hide_index=True)
+    if not history['exhausted']:
+        st.button('Load older scans', on_click=load_patient_history, args=(name,))
+
+
+# Export the full history (not just the loaded pages), generated when a button is clicked
+@st.fragment
+@metrics.rerun('analyzer.export_view')
+def show_export(name):
+    st.write('## Export')
+    date_range = st.date_input('Scan dates to export (leave empty for all):', value=[])
+    start, end = (date_range + (None, None))[:2] if isinstance(date_range, tuple) else (None, None)
+    for column, file_format in zip(st.columns(len(EXPORT_FORMATS)), EXPORT_FORMATS):
+        column.download_button(f'Download {file_format.upper()}',
+                               data=lambda file_format=file_format: export_to_file(file_format, name, start, end),
+                               file_name=f'{name}.{file_format}', on_click='ignore')
+
+
+@st.fragment
+@metrics.rerun('analyzer.import_view')
+def import_view():
+    uploaded_file = st.file_uploader('Upload a device export (CSV or Parquet):', type=list(IMPORT_FORMATS))
+    if uploaded_file is not None and st.button('Import'):
+        status = st.empty()
+        try:
+            result = import_scans(uploaded_file, progress=lambda rows: status.text(f'Imported {rows} rows...'))
+        except (ValueError, sqlite3.Error) as exc:
+            st.error(f'Import failed: {exc}')
         else:
-            st.warning('No data found for this patient.')
+            status.success(f"Imported {result['rows']} rows in {result['seconds']:.2f}s ({result['rows_per_second']:,.0f} rows/s)")
+
+
+# Registers a namesake of the typed name when the patient selectbox's last option is chosen, and selects them
+def register_namesake(query, options):
+    if options[st.session_state['patient_choice']] is None:
+        name = register_patient(query)
+        st.session_state['namesake'] = name
+        st.session_state['patient_choice'] = name
+
+
+# Resolve the typed name to a registered patient. Registered patients whose name has words starting
+# with the typed words are offered as the name is typed; a name that is not registered yet is kept
+# as typed (the first save registers it), and a registered one can be split off into a namesake.
+def select_patient(query):
+    if not query:
+        return query
+    with metrics.span('analyzer.db.search_patients'):
+        matches = {match['name']: match for match in search_patients(query)}
+    namesake = st.session_state.get('namesake')
+    if namesake and namesake not in matches and namesake.startswith(query):
+        matches[namesake] = None  # Just registered, not yet among the top matches
+    registered = query in matches
+    if not matches:
+        return query
+    # Option label -> patient name (None: register a namesake); the typed name first
+    options = {query if registered else f'{query} (new patient)': query}
+    options.update((name, name) for name in matches)
+    if registered:
+        options[f'Register another patient named {query}'] = None
+    name = options[st.selectbox('Patient:', list(options), key='patient_choice',
+                                on_change=register_namesake, args=(query, options))]
+    match = matches.get(name)
+    if match is not None and match['scan_count']:
+        st.caption(f"{match['scan_count']} scans, last on {match['last_scan_at']}")
+    return name
+
+
+def main():
+    if st.query_params.get('diagnostics'):
+        show_diagnostics()
+        return
+
+    st.title('GeBody - Body Composition Analyzer')
+
+    # Only the patient and the action are shared by every view; each view reruns on its own (see st.fragment)
+    name = select_patient(st.text_input('Enter patient name:'))
+    action = st.selectbox('Choose an action:', ['Calculate', 'Show Data', 'Import Data'])
+
+    if action == "Calculate":
+        calculate_view(name)
+    elif action == "Show Data":
+        show_data_view(name)
+    elif action == "Import Data":
+        import_view()
 
 
 if __name__ == '__main__':
-    main()
+    with metrics.rerun('analyzer.rerun'):
+        main()
 
@@ -1,72 +1,7 @@
 import streamlit as st
 
-def calculate_bmi(weight, height):
-    return weight / ((height / 100) ** 2)
-
-def calculate_ideal_weight(height, gender):
-    if gender == "Male":
-        return 50 + 0.91 * (height - 152.4)
-    elif gender == "Female":
-        return 45.5 + 0.91 * (height - 152.4)
-    else:
-        return None
-
-def calculate_ideal_body_weight(height, gender):
-    if gender == "Male":
-        return 50 + 0.91 * (height - 152.4)
-    elif gender == "Female":
-        return 45.5 + 0.91 * (height - 152.4)
-    else:
-        return None
-
-def calculate_body_fat_percentage(weight, body_fat_mass):
-    return (body_fat_mass / weight) * 100
-
-def calculate_bmr(weight, height, age, gender):
-    if gender == "Male":
-        return 10 * weight + 6.25 * height - 5 * age + 5
-    elif gender == "Female":
-        return 10 * weight + 6.25 * height - 5 * age - 161
-    else:
-        return None
-
-def calculate_tdee(bmr, activity_level):
-    activity_factors = {
-        "Sedentary": 1.2,
-        "Lightly active": 1.375,
-        "Moderately active": 1.55,
-        "Very active": 1.725,
-        "Extra active": 1.9
-    }
-    return bmr * activity_factors[activity_level]
-
-def calculate_calorie_intake(tdee, goals, weight, ideal_weight):
-    if "Fitness" in goals:
-        if weight < ideal_weight:
-            goals.append("Weight gain")
-        elif weight > ideal_weight:
-            goals.append("Weight loss")
-    if "Weight loss" in goals:
-        if "Rapid Weight Loss" in goals:
-            return tdee - 1000  # Subtract 1000 kcal/day for rapid weight loss
-        else:
-            return tdee - 500
-    elif "Weight gain" in goals:
-        return tdee + 500
-    elif "Fitness" in goals:
-        return tdee  # No calorie adjustment for fitness goal, treat it as Ideal Weight
-    else:
-        return tdee
-
-def calculate_tbw(weight, height, age, gender):
-    if gender == "Male":
-        k = 2.447 - 0.09516 * age + 0.1074 * height + 0.3362 * weight
-    elif gender == "Female":
-        k = -2.097 + 0.1069 * height + 0.2466 * weight
-    else:
-        return None
-    
-    return 0.3669 * k - 0.0906 * weight + 0.1074 * height + 0.2466 * weight
+from core import (calculate_bmi, calculate_bmr_mifflin, calculate_goal_calorie_intake, calculate_ideal_weight,
+                  calculate_tdee, calculate_total_body_water)
 
 def user_input_page():
     st.title("Ai Calorie Calculator")
@@ -91,14 +26,17 @@ def user_input_page():
     waist_to_hip_ratio = st.sidebar.number_input("Enter your waist-to-hip ratio", min_value=0.0, step=0.01)
     lean_body_mass = st.sidebar.number_input("Enter your lean body mass (kg)", min_value=0.0, step=0.1)
 
+    # The sex-specific formulas need Male or Female
+    sex_known = gender in ("Male", "Female")
+
     # Calculate BMI
-    bmi = calculate_bmi(weight, height)
+    bmi = calculate_bmi(weight, height / 100)  # Convert height to meters
 
     # Calculate total body water (TBW)
-    tbw = calculate_tbw(weight, height, age, gender)
+    tbw = calculate_total_body_water(weight, height, age, gender) if sex_known else None
 
     # Calculate ideal weight
-    ideal_weight = calculate_ideal_weight(height, gender)
+    ideal_weight = calculate_ideal_weight(height, gender) if sex_known else None
 
     # Calculate ideal body weight
     if gender == "Male":
@@ -118,11 +56,11 @@ def user_input_page():
     body_fat_mass = weight * (body_fat_percentage / 100)
 
     # Calculate BMR
-    bmr = calculate_bmr(weight, height, age, gender)
+    bmr = calculate_bmr_mifflin(weight, height, age, gender) if sex_known else None
 
     # Calculate TDEE
     activity_level = st.selectbox("Select your activity level", options=["Sedentary", "Lightly active", "Moderately active", "Very active", "Extra active"])
-    tdee = calculate_tdee(bmr, activity_level)
+    tdee = calculate_tdee(bmr, activity_level) if bmr is not None else None
 
     # Dietary goals selection
     st.sidebar.subheader("Select your dietary goals:")
@@ -145,7 +83,7 @@ def user_input_page():
         goals.append("Rapid Weight Loss")
 
     # Calculate calorie intake
-    calorie_intake = calculate_calorie_intake(tdee, goals, weight, ideal_weight)
+    calorie_intake = calculate_goal_calorie_intake(tdee, goals, weight, ideal_weight) if tdee is not None else None
 
     # Submit button
 if st.button("Submit"):
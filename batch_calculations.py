@@ -0,0 +1,144 @@
+import numpy as np
+
+from core import ACTIVITY_MULTIPLIERS
+
+
+# Raw measurement columns expected by the batch engine
+INPUT_COLUMNS = ['age', 'sex', 'weight', 'height', 'waist_hip_ratio', 'body_fat_percentage']
+
+# Derived metrics produced by calculate_body_composition_batch, stored columns first
+DERIVED_COLUMNS = ['bmi', 'bmr', 'lean_body_mass', 'body_fat_mass', 'muscle_mass',
+                   'visceral_fat_level', 'body_water_percentage', 'bone_mineral_content',
+                   'resting_metabolic_rate', 'ideal_weight', 'weight_status',
+                   'weight_difference', 'total_body_water']
+
+
+def _as_float_array(values):
+    return np.asarray(values, dtype=float)
+
+
+# True where the patient is male; every other value takes the female branch like the scalar functions
+def _is_male(sex):
+    return np.asarray(sex, dtype=object) == 'Male'
+
+
+# Vectorized counterparts of the calculate_* functions in core.py.
+# Each one mirrors the scalar arithmetic operation by operation so results are bit-identical.
+def calculate_bmi_batch(weight, height):
+    height = _as_float_array(height)
+    return _as_float_array(weight) / (height * height)
+
+
+def calculate_ideal_weight_batch(height, sex):
+    height = _as_float_array(height)
+    return np.where(_is_male(sex), 50 + 0.91 * (height - 152.4), 45.5 + 0.91 * (height - 152.4))
+
+
+def calculate_weight_difference_batch(current_weight, ideal_weight):
+    difference = _as_float_array(current_weight) - _as_float_array(ideal_weight)
+    status = np.where(difference == 0, 'Normal', np.where(difference < 0, 'Underweight', 'Overweight'))
+    return status.astype(object), np.abs(difference)
+
+
+def calculate_total_body_water_batch(weight, height, age, sex):
+    weight = _as_float_array(weight)
+    height = _as_float_array(height)
+    age = _as_float_array(age)
+    return np.where(_is_male(sex),
+                    2.447 - 0.09156 * age + 0.1074 * height + 0.3362 * weight,
+                    -2.097 + 0.1069 * height + 0.2466 * weight)
+
+
+def calculate_bmr_batch(weight, height, age, sex):
+    weight = _as_float_array(weight)
+    height = _as_float_array(height)
+    age = _as_float_array(age)
+    return np.where(_is_male(sex),
+                    88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age),
+                    447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age))
+
+
+def calculate_lean_body_mass_batch(weight, body_fat_percentage):
+    return _as_float_array(weight) * (1 - _as_float_array(body_fat_percentage) / 100)
+
+
+def calculate_body_fat_mass_batch(weight, body_fat_percentage):
+    return _as_float_array(weight) * (_as_float_array(body_fat_percentage) / 100)
+
+
+def calculate_muscle_mass_batch(weight, body_fat_percentage):
+    return calculate_lean_body_mass_batch(weight, body_fat_percentage) * 0.85
+
+
+def calculate_visceral_fat_level_batch(waist_hip_ratio, sex):
+    waist_hip_ratio = _as_float_array(waist_hip_ratio)
+    return np.where(_is_male(sex), 10 * waist_hip_ratio - 5, 10 * waist_hip_ratio - 6)
+
+
+def calculate_body_water_percentage_batch(weight, body_fat_percentage, sex):
+    lean_body_mass = calculate_lean_body_mass_batch(weight, body_fat_percentage)
+    return np.where(_is_male(sex), 60 + 0.1 * (lean_body_mass - 50), 50 + 0.1 * (lean_body_mass - 45))
+
+
+def calculate_bone_mineral_content_batch(weight):
+    return _as_float_array(weight) * 0.03
+
+
+def calculate_rmr_batch(weight, height, age, sex):
+    return calculate_bmr_batch(weight, height, age, sex)
+
+
+# Daily (min, max) calorie intake per patient, matching calculate_calorie_intake in core.py
+def calculate_calorie_intake_batch(weight, height, age, sex, activity, goal_weight, rate_of_change):
+    weight = _as_float_array(weight)
+    height = _as_float_array(height)
+    age = _as_float_array(age)
+    goal_weight = _as_float_array(goal_weight)
+    rate_of_change = _as_float_array(rate_of_change)
+    activity = np.asarray(activity, dtype=object)
+    unknown = set(activity.tolist()) - set(ACTIVITY_MULTIPLIERS)
+    if unknown:
+        raise ValueError(f"Unknown activity level: {', '.join(map(str, sorted(unknown)))}")
+    bmr = np.where(_is_male(sex), 10 * weight + 6.25 * height - 5 * age + 5, 10 * weight + 6.25 * height - 5 * age - 161)
+    bmr = bmr * np.array([ACTIVITY_MULTIPLIERS[level] for level in activity.tolist()], dtype=float)
+    gain, lose = goal_weight > weight, goal_weight < weight
+    min_calorie_intake = np.where(gain, bmr + (rate_of_change * 500),
+                                  np.where(lose, bmr - ((-rate_of_change + 0.45) * 500), bmr - 500))
+    max_calorie_intake = np.where(gain, bmr + ((rate_of_change + 0.45) * 500),
+                                  np.where(lose, bmr - (-rate_of_change * 500), bmr + 500))
+    return min_calorie_intake, max_calorie_intake
+
+
+# Compute every derived metric for a cohort in one vectorized pass.
+# Inputs are array-likes of equal length with height in cm, as entered in the analyzer.
+def calculate_body_composition_batch(age, sex, weight, height, waist_hip_ratio, body_fat_percentage):
+    ideal_weight = calculate_ideal_weight_batch(height, sex)
+    weight_status, weight_difference = calculate_weight_difference_batch(weight, ideal_weight)
+    bmr = calculate_bmr_batch(weight, height, age, sex)
+    return {
+        'bmi': calculate_bmi_batch(weight, _as_float_array(height) / 100),  # Convert height to meters
+        'bmr': bmr,
+        'lean_body_mass': calculate_lean_body_mass_batch(weight, body_fat_percentage),
+        'body_fat_mass': calculate_body_fat_mass_batch(weight, body_fat_percentage),
+        'muscle_mass': calculate_muscle_mass_batch(weight, body_fat_percentage),
+        'visceral_fat_level': calculate_visceral_fat_level_batch(waist_hip_ratio, sex),
+        'body_water_percentage': calculate_body_water_percentage_batch(weight, body_fat_percentage, sex),
+        'bone_mineral_content': calculate_bone_mineral_content_batch(weight),
+        'resting_metabolic_rate': bmr,
+        'ideal_weight': ideal_weight,
+        'weight_status': weight_status,
+        'weight_difference': weight_difference,
+        'total_body_water': calculate_total_body_water_batch(weight, height, age, sex),
+    }
+
+
+# DataFrame front-end: returns a copy of df with the derived metric columns filled in
+def calculate_body_composition_frame(df):
+    missing = [column for column in INPUT_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing input columns: {', '.join(missing)}")
+    results = calculate_body_composition_batch(*(df[column].to_numpy() for column in INPUT_COLUMNS))
+    result_df = df.copy()
+    for column in DERIVED_COLUMNS:
+        result_df[column] = results[column]
+    return result_df
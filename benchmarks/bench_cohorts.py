@@ -0,0 +1,118 @@
+# Cohort percentile sketches (cohorts.py): accuracy, lookup cost and what they add to inserts.
+#
+# Loads generated scans, then for sampled patients compares cohorts.read_percentiles against the
+# exact percentile rank computed with COUNT(*) over the same stratum, and times:
+#   - the sketch lookup vs the exact per-metric COUNT(*) queries it replaces
+#   - a fold of every row into empty sketches (cohorts.update_cohorts from a zero watermark)
+#   - insert_patient_data with and without the sketch update folded into its transaction
+#
+#   python benchmarks/bench_cohorts.py --rows 200000
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import cohorts  # noqa: E402
+import database  # noqa: E402
+import datagen  # noqa: E402
+
+SCANS_PER_PATIENT = 20
+
+
+def exact_percentiles(conn, values, sex, age):
+    band = cohorts.age_band(age)
+    index = [cohorts.age_band(bound) for bound in cohorts.AGE_BANDS].index(band)
+    lower = cohorts.AGE_BANDS[index]
+    upper = cohorts.AGE_BANDS[index + 1] if index + 1 < len(cohorts.AGE_BANDS) else 1000
+    results = {}
+    for metric, value in values.items():
+        below, same, total = conn.execute(f'''SELECT SUM({metric} < ?), SUM({metric} = ?), COUNT(*) FROM patients
+                                              WHERE sex = ? AND age >= ? AND age < ? AND {metric} IS NOT NULL''',
+                                          (value, value, sex, lower, upper)).fetchone()
+        results[metric] = 100 * (below + same / 2) / total
+    return results
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cohort percentile sketches: accuracy and cost')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--samples', type=int, default=100)
+    parser.add_argument('--inserts', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    columns, rows = datagen.patient_rows(args.rows, max(1, args.rows // SCANS_PER_PATIENT), args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, 'cohorts.db')
+        start = time.perf_counter()
+        database.insert_patient_rows(rows, columns)
+        print(f'bulk insert of {args.rows} rows (sketches folded in): {time.perf_counter() - start:.2f}s')
+
+        conn = sqlite3.connect(database.DB_PATH, isolation_level=None)
+        conn.execute('BEGIN')
+        conn.execute('DELETE FROM cohort_buckets')
+        conn.execute('UPDATE cohort_state SET last_patient_id = 0')
+        start = time.perf_counter()
+        cohorts.update_cohorts(conn)
+        print(f'backfill of all sketches: {time.perf_counter() - start:.2f}s')
+        conn.execute('COMMIT')
+        sketches, largest = conn.execute('''SELECT COUNT(*), MAX(buckets) FROM (
+                                              SELECT COUNT(*) AS buckets FROM cohort_buckets
+                                              GROUP BY sex, age_band, metric)''').fetchone()
+        print(f'{sketches} sketches, largest {largest} buckets')
+
+        rng = random.Random(args.seed)
+        samples = [rows[rng.randrange(len(rows))] for _ in range(args.samples)]
+        metric_positions = [(metric, columns.index(metric)) for metric in cohorts.COHORT_METRICS]
+        queries = [({metric: row[i] for metric, i in metric_positions}, row[columns.index('sex')],
+                    int(row[columns.index('age')])) for row in samples]
+        errors = []
+        for values, sex, age in queries:
+            approximate = cohorts.read_percentiles(conn, values, sex, age)
+            exact = exact_percentiles(conn, values, sex, age)
+            errors += [abs(approximate[metric]['percentile'] - exact[metric]) for metric in exact]
+        errors.sort()
+        print(f'percentile error (points): median={statistics.median(errors):.3f}  '
+              f'p99={errors[int(len(errors) * 0.99)]:.3f}  max={errors[-1]:.3f}')
+
+        sketch_lookup = timed(lambda: [cohorts.read_percentiles(conn, *query) for query in queries], 3) / len(queries)
+        exact_lookup = timed(lambda: [exact_percentiles(conn, *query) for query in queries[:10]], 1) / 10
+        print(f'lookup, all metrics: sketch {sketch_lookup * 1e3:.3f} ms  exact COUNT(*) {exact_lookup * 1e3:.1f} ms')
+        conn.close()
+
+        row = rows[0]
+
+        def insert_all():
+            for _ in range(args.inserts):
+                database.insert_patient_data(*row[:len(database.PATIENT_COLUMNS)])
+
+        with_sketches = timed(insert_all, 3) / args.inserts
+        update_cohorts = cohorts.update_cohorts
+        cohorts.update_cohorts = lambda conn: None
+        try:
+            without_sketches = timed(insert_all, 3) / args.inserts
+        finally:
+            cohorts.update_cohorts = update_cohorts
+        print(f'insert_patient_data: {with_sketches * 1e3:.3f} ms with sketch update, '
+              f'{without_sketches * 1e3:.3f} ms without')
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# Insert and fetch latency of the patient store under concurrent sessions.
+#
+# Each worker thread plays one Streamlit session: it alternates "Calculate" (one insert)
+# and "Show Data" (one fetch) for its own patient. The legacy mode reproduces the old
+# connect-per-call code path on a rollback-journal database; the pooled mode goes through
+# database.py (shared WAL connections); the write-behind mode queues the inserts for the
+# background group-commit writer (GEBODY_DB_WRITE_BEHIND).
+#
+#   python benchmarks/bench_db_concurrency.py --sessions 8 --operations 200
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import migrations  # noqa: E402
+
+ROW = (35, 'Female', 64.0, 165.0, 0.8, 27.0, 23.5, 1400.0, 46.7, 17.3, 39.7, 2.0, 50.2, 1.9, 1400.0)
+
+
+def legacy_insert(path, name):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute(f'''INSERT INTO patients ({', '.join(database.PATIENT_COLUMNS)})
+                  VALUES ({', '.join('?' * len(database.PATIENT_COLUMNS))})''', (name,) + ROW)
+    conn.commit()
+    conn.close()
+
+
+def legacy_fetch(path, name):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('''SELECT * FROM patients WHERE name = ?''', (name,))
+    data = c.fetchall()
+    conn.close()
+    return data
+
+
+def run_sessions(insert, fetch, sessions, operations):
+    latencies = {'insert': [], 'fetch': []}
+    errors = []
+    lock = threading.Lock()
+
+    def session(index):
+        name = f'patient-{index}'
+        local = {'insert': [], 'fetch': []}
+        for _ in range(operations):
+            for kind, call in (('insert', insert), ('fetch', fetch)):
+                start = time.perf_counter()
+                try:
+                    call(name)
+                except sqlite3.OperationalError as exc:
+                    errors.append(str(exc))
+                    continue
+                local[kind].append(time.perf_counter() - start)
+        with lock:
+            for kind in local:
+                latencies[kind].extend(local[kind])
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(label, latencies, errors, elapsed):
+    print(f'{label}: {elapsed:.2f}s wall, {len(errors)} errors')
+    for kind, values in latencies.items():
+        if not values:
+            continue
+        values.sort()
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+        print(f'  {kind:6s} n={len(values):5d}  mean={statistics.mean(values) * 1e3:7.2f} ms  '
+              f'p50={values[len(values) // 2] * 1e3:7.2f} ms  p99={p99 * 1e3:7.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Patient store latency under concurrent sessions')
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--operations', type=int, default=200)
+    parser.add_argument('--seed-rows', type=int, default=10000, help='rows of other patients loaded first')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        pooled_path = os.path.join(tmp, 'pooled.db')
+        queued_path = os.path.join(tmp, 'queued.db')
+        seed = [(f'seed-{i}',) + ROW for i in range(args.seed_rows)]
+        for path in (legacy_path, pooled_path, queued_path):
+            conn = sqlite3.connect(path)
+            migrations.migrate(conn)
+            conn.executemany(f'''INSERT INTO patients ({', '.join(database.PATIENT_COLUMNS)})
+                                 VALUES ({', '.join('?' * len(database.PATIENT_COLUMNS))})''', seed)
+            conn.commit()
+            conn.close()
+
+        summarize('legacy connect-per-call', *run_sessions(
+            lambda name: legacy_insert(legacy_path, name), lambda name: legacy_fetch(legacy_path, name),
+            args.sessions, args.operations))
+
+        database.DB_PATH = pooled_path
+        summarize('pooled WAL', *run_sessions(
+            lambda name: database.insert_patient_data(name, *ROW), database.fetch_patient_data,
+            args.sessions, args.operations))
+
+        # Inserts queued for the group-commit writer; the final flush is included in the wall time
+        database.DB_PATH = queued_path
+        database.WRITE_BEHIND = True
+        latencies, errors, elapsed = run_sessions(
+            lambda name: database.insert_patient_data(name, *ROW), database.fetch_patient_data,
+            args.sessions, args.operations)
+        start = time.perf_counter()
+        database.flush_writers()
+        summarize('pooled WAL, write-behind', latencies, errors, elapsed + time.perf_counter() - start)
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
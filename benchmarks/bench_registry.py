@@ -0,0 +1,107 @@
+# Patient search over the registry (registry.search) against a LIKE scan of the patients table.
+#
+# Generates --patients patients with first/last names drawn from small pools (so prefixes are shared
+# by thousands of patients, as real names are), saves --scans-per-patient scans each, and times:
+#   - migrations 6 and 7 on that database (registry built from the names, scans and trends linked)
+#   - registry.search for one- to full-length prefixes and two-word queries
+#   - the same matches with SELECT DISTINCT name ... LIKE 'prefix%' over the patients table
+#
+#   python benchmarks/bench_registry.py --patients 200000
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations  # noqa: E402
+import registry  # noqa: E402
+
+FIRST_NAMES = ('Ahmed', 'Mohamed', 'Mahmoud', 'Mona', 'Mariam', 'Sara', 'Salma', 'Omar', 'Amr', 'Aya', 'Nour',
+               'Hassan', 'Hana', 'Youssef', 'Yasmin', 'Khaled', 'Karim', 'Laila', 'Ali', 'Alia', 'أحمد', 'محمد',
+               'منى', 'مريم', 'سارة', 'عمر', 'نور', 'حسن', 'يوسف', 'خالد', 'ليلى', 'علي')
+LAST_NAMES = ('Abdelrahman', 'Elsayed', 'Farouk', 'Gamal', 'Hamdy', 'Ibrahim', 'Kamal', 'Mansour', 'Nabil',
+              'Osman', 'Ragab', 'Saleh', 'Tawfik', 'Wahba', 'Zaki', 'عبد الرحمن', 'السيد', 'فاروق', 'جمال',
+              'إبراهيم', 'كمال', 'منصور', 'نبيل', 'عثمان', 'صالح', 'زكي')
+
+
+def patient_names(n, seed):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < n:
+        names.add(f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} {rng.randrange(10000)}')
+    return sorted(names)
+
+
+def timed(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Registry prefix search vs LIKE over patient names')
+    parser.add_argument('--patients', type=int, default=200000)
+    parser.add_argument('--scans-per-patient', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    names = patient_names(args.patients, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'registry.db')
+        conn = sqlite3.connect(path, isolation_level=None)
+        conn.execute('PRAGMA user_version = 5')
+        columns = ', '.join(f'{name} {sql_type}' for name, sql_type in migrations._PATIENTS_V1_COLUMNS)
+        conn.execute(f'CREATE TABLE patients ({columns})')
+        conn.execute('CREATE INDEX idx_patients_name_created_at ON patients (name, created_at)')
+        conn.execute('''CREATE TABLE patient_trends (name TEXT PRIMARY KEY, scan_count INTEGER NOT NULL,
+                            first_scan_at TIMESTAMP, previous_scan_at TIMESTAMP, last_scan_at TIMESTAMP,
+                            last_patient_id INTEGER, state TEXT NOT NULL)''')
+        conn.execute('BEGIN')
+        conn.executemany("INSERT INTO patients (name, age, sex, weight, height) VALUES (?, 40, 'Female', 70, 170)",
+                         ((name,) for name in names for _ in range(args.scans_per_patient)))
+        conn.executemany('''INSERT INTO patient_trends (name, scan_count, last_scan_at, state)
+                            VALUES (?, ?, CURRENT_TIMESTAMP, '{}')''',
+                         ((name, args.scans_per_patient) for name in names))
+        conn.execute('COMMIT')
+
+        start = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        migrations._create_registry(conn)
+        migrations._key_trends_by_registry(conn)
+        conn.execute('COMMIT')
+        print(f'{args.patients} patients, {args.patients * args.scans_per_patient} scans: '
+              f'migrations 6 and 7 took {time.perf_counter() - start:.2f}s')
+
+        rng = random.Random(args.seed + 1)
+        samples = rng.sample(names, 5)
+        queries = [('1 letter', name[:1]) for name in samples] + [('3 letters', name[:3]) for name in samples]
+        queries += [('full first name', name.split()[0]) for name in samples]
+        queries += [('two words', ' '.join(word[:3] for word in name.split()[:2])) for name in samples]
+        queries += [('exact name', name) for name in samples]
+        print(f"{'query':18s} {'search (ms)':>12s} {'LIKE scan (ms)':>15s} {'matches':>8s}")
+        for label in dict.fromkeys(label for label, _ in queries):
+            search_times, like_times, found = [], [], []
+            for _, query in (item for item in queries if item[0] == label):
+                seconds, matches = timed(lambda: registry.search(conn, query), args.repeat)
+                search_times.append(seconds)
+                found.append(len(matches))
+                like = query.replace('%', '').replace('_', '') + '%'
+                seconds, _ = timed(lambda: conn.execute(f'SELECT DISTINCT name FROM patients WHERE name LIKE ? '
+                                                        f'LIMIT {registry.SEARCH_LIMIT}', (like,)).fetchall(), 1)
+                like_times.append(seconds)
+            print(f'{label:18s} {statistics.median(search_times) * 1e3:12.3f} '
+                  f'{statistics.median(like_times) * 1e3:15.1f} {min(found):8d}')
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+# Rerun latency of the analyzer and meal planner pages as the browser sees it.
+#
+# Starts `streamlit run` headless on a temporary database holding one patient with a long history,
+# then drives the app over its websocket the way the frontend does: every interaction sends a rerun
+# request with all widget states, plus the fragment id when the widget lives in an st.fragment.
+# Each interaction is timed from the request to the script_finished message.
+#
+#   python benchmarks/bench_reruns.py --runs 10
+#   python benchmarks/bench_reruns.py --root /path/to/other/checkout   # same scenarios, other tree
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datagen  # noqa: E402
+
+PATIENT = 'patient-0'
+SCANS = 2000
+
+# Widget state field per element type
+VALUE_FIELDS = {'text_input': 'string_value', 'number_input': 'double_value', 'selectbox': 'string_value',
+                'radio': 'string_value', 'checkbox': 'bool_value', 'slider': 'double_array_value'}
+
+
+class Session:
+    def __init__(self, ws):
+        self.ws = ws
+        self.page_script_hash = ''
+        self.pages = {}  # url path -> page script hash
+        self.widgets = {}  # label -> (element type, proto, fragment id)
+        self.states = {}  # widget id -> WidgetState
+
+    async def rerun(self, trigger=None, fragment_id=''):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        msg = BackMsg()
+        msg.rerun_script.page_script_hash = self.page_script_hash
+        msg.rerun_script.fragment_id = fragment_id
+        msg.rerun_script.widget_states.widgets.extend(self.states.values())
+        if trigger is not None:
+            msg.rerun_script.widget_states.widgets.append(WidgetState(id=trigger, trigger_value=True))
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        deltas = 0
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.ws.recv())
+            kind = forward.WhichOneof('type')
+            if kind == 'navigation':
+                self.pages = {page.url_pathname: page.page_script_hash for page in forward.navigation.app_pages}
+            elif kind == 'new_session':
+                self.page_script_hash = self.page_script_hash or forward.new_session.page_script_hash
+            elif kind == 'delta':
+                deltas += 1
+                if forward.delta.WhichOneof('type') == 'new_element':
+                    element = forward.delta.new_element
+                    element_type = element.WhichOneof('type')
+                    proto = getattr(element, element_type)
+                    if getattr(proto, 'id', '').startswith('$$ID'):
+                        self.widgets[proto.label] = (element_type, proto, forward.delta.fragment_id)
+            elif kind == 'script_finished':
+                return time.perf_counter() - start, deltas
+
+    def _widget(self, label):
+        return self.widgets[label]
+
+    # Change a widget's value and rerun what it belongs to: its fragment, or the whole script
+    async def set(self, label, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        element_type, proto, fragment_id = self._widget(label)
+        state = WidgetState(id=proto.id)
+        field = VALUE_FIELDS[element_type]
+        if field == 'double_array_value':
+            state.double_array_value.data.extend(value)
+        else:
+            setattr(state, field, value)
+        self.states[proto.id] = state
+        return await self.rerun(fragment_id=fragment_id)
+
+    async def click(self, label):
+        _, proto, fragment_id = self._widget(label)
+        return await self.rerun(trigger=proto.id, fragment_id=fragment_id)
+
+    async def open_page(self, path):
+        self.page_script_hash = self.pages[path]
+        self.widgets, self.states = {}, {}
+        return await self.rerun()
+
+
+async def analyzer_scenarios(session, runs):
+    await session.rerun()
+    await session.set('Enter patient name:', PATIENT)
+    await session.set('Choose an action:', 'Show Data')
+    _, slider, _ = session._widget('Date range:')
+    low, high = slider.min, slider.max
+    yield 'show_data.date_range', [await session.set('Date range:', [low + (high - low) * (i % 2 + 1) / 4, high])
+                                   for i in range(runs)]
+    yield 'show_data.load_older', [await session.click('Load older scans') for _ in range(runs)]
+    await session.set('Choose an action:', 'Calculate')
+    yield 'calculate.edit_age', [await session.set('Enter age:', 30.0 + i % 2 + 1) for i in range(runs)]
+    yield 'calculate.press', [await session.click('Calculate') for _ in range(runs)]
+
+
+async def meal_planner_scenarios(session, runs):
+    await session.rerun()
+    await session.open_page('meal_planner')
+    yield 'meals.caseload_days', [await session.set('عدد الأيام', 7.0 + i % 2 + 1) for i in range(runs)]
+    yield 'meals.generate', [await session.click('إنشاء الوجبات') for _ in range(runs)]
+
+
+async def run_scenarios(port, runs):
+    import websockets
+
+    results = []
+    for scenarios in (analyzer_scenarios, meal_planner_scenarios):
+        async with websockets.connect(f'ws://127.0.0.1:{port}/_stcore/stream', subprotocols=['streamlit'],
+                                      max_size=None) as ws:
+            async for name, timings in scenarios(Session(ws), runs):
+                results.append((name, timings))
+    return results
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_app(root, db_path, port):
+    env = dict(os.environ, GEBODY_DB_PATH=db_path, PYTHONPATH=root)
+    process = subprocess.Popen([sys.executable, '-m', 'streamlit', 'run', os.path.join(root, 'GeBody.py'),
+                                '--server.headless', 'true', '--server.port', str(port),
+                                '--server.enableXsrfProtection', 'false', '--server.fileWatcherType', 'none',
+                                '--browser.gatherUsageStats', 'false'],
+                               cwd=root, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/_stcore/health', timeout=1)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('streamlit did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rerun latency of the Streamlit pages over the websocket')
+    parser.add_argument('--runs', type=int, default=10, help='interactions per scenario')
+    parser.add_argument('--root', default=ROOT, help='checkout whose GeBody.py is served')
+    args = parser.parse_args()
+
+    import database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, 'reruns.db')
+        columns, rows = datagen.patient_rows(SCANS, 1)
+        database.insert_patient_rows(rows, columns)
+        database.close_pools()
+        port = free_port()
+        process = start_app(os.path.abspath(args.root), database.DB_PATH, port)
+        try:
+            results = asyncio.run(run_scenarios(port, args.runs))
+        finally:
+            process.terminate()
+            process.wait()
+    for name, timings in results:
+        latencies = sorted(seconds for seconds, _ in timings)
+        print(f'{name:22s} p50={statistics.median(latencies) * 1e3:8.1f} ms  max={latencies[-1] * 1e3:8.1f} ms  '
+              f'deltas={statistics.median(deltas for _, deltas in timings):4.0f}')
+
+
+if __name__ == '__main__':
+    main()
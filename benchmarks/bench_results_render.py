@@ -0,0 +1,66 @@
+# Render cost of the analyzer's results panel in its detailed and compact modes.
+#
+# Runs GeBody.py headless (streamlit.testing AppTest), presses Calculate --runs times per mode and
+# reports the server-side time of the 'analyzer.render_results' span, the number of elements
+# (one websocket delta each) in the results expander and their size as ForwardMsg payloads.
+#
+#   python benchmarks/bench_results_render.py --runs 20
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import metrics  # noqa: E402
+
+
+def payload_bytes(elements):
+    from streamlit.proto.Element_pb2 import Element
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    # Element is a oneof over the element protos; find the field each proto type goes in
+    fields = {field.message_type: field.name for field in Element.DESCRIPTOR.fields if field.message_type}
+    total = 0
+    for index, element in enumerate(elements):
+        msg = ForwardMsg()
+        msg.metadata.delta_path[:] = [0, 9, 0, index]
+        getattr(msg.delta.new_element, fields[element.proto.DESCRIPTOR]).CopyFrom(element.proto)
+        total += msg.ByteSize()
+    return total
+
+
+def measure(compact, runs):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT, 'GeBody.py'), default_timeout=60)
+    app.run()
+    app.text_input[0].input('render-benchmark').run()
+    app.checkbox[0].set_value(compact).run()
+    app.button[0].click().run()  # Warm-up: imports, first table conversion
+    metrics.reset()
+    for _ in range(runs):
+        app.button[0].click().run()
+    elements = list(app.expander[0].children.values())
+    timing = next(row for row in metrics.snapshot() if row['span'] == 'analyzer.render_results')
+    return timing, len(elements), payload_bytes(elements)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Results panel render time and payload, detailed vs compact')
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['GEBODY_DB_PATH'] = os.path.join(tmp, 'render.db')
+        for label, compact in (('detailed', False), ('compact', True)):
+            timing, deltas, size = measure(compact, args.runs)
+            print(f"{label:9s} render p50={timing['p50'] * 1e3:6.2f} ms  p95={timing['p95'] * 1e3:6.2f} ms  "
+                  f"deltas={deltas:3d}  payload={size:6d} bytes")
+        import database
+        database.close_pools()
+
+
+if __name__ == '__main__':
+    main()
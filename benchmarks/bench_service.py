@@ -0,0 +1,111 @@
+# Load-test baseline for service.py: requests per second and latency percentiles.
+#
+# Starts the service in a subprocess, then keeps --connections keep-alive connections busy
+# until --requests requests have completed. Single mode posts one scan per request; with
+# --batch-size N each request posts N scans to the batch endpoint.
+#
+#   python benchmarks/bench_service.py --connections 64 --requests 20000
+#   python benchmarks/bench_service.py --batch-size 500 --requests 1000
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCAN = {'age': 35, 'sex': 'Female', 'weight': 64.0, 'height': 165.0, 'waist_hip_ratio': 0.8,
+        'body_fat_percentage': 27.0}
+
+
+def build_request(host, port, path, body):
+    body = json.dumps(body).encode()
+    head = (f'POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n\r\n')
+    return head.encode() + body
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = 0
+    for line in head.split(b'\r\n'):
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':', 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def connection(host, port, request, counter, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while counter['left'] > 0:
+            counter['left'] -= 1
+            start = time.perf_counter()
+            writer.write(request)
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, request, connections, requests):
+    counter = {'left': requests}
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(host, port, request, counter, latencies, errors) for _ in range(connections)))
+    return latencies, errors, time.perf_counter() - start
+
+
+async def wait_until_up(host, port, timeout=15):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the batch calculation service')
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--batch-size', type=int, default=0, help='scans per request (0: single endpoint)')
+    parser.add_argument('--workers', type=int, default=1, help='service worker processes')
+    parser.add_argument('--port', type=int, default=8611)
+    args = parser.parse_args()
+
+    host = '127.0.0.1'
+    if args.batch_size:
+        request = build_request(host, args.port, '/v1/body-composition/batch', {'scans': [SCAN] * args.batch_size})
+    else:
+        request = build_request(host, args.port, '/v1/body-composition', SCAN)
+
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'service.py'), '--host', host,
+                               '--port', str(args.port), '--workers', str(args.workers)])
+    try:
+        asyncio.run(wait_until_up(host, args.port))
+        asyncio.run(run_load(host, args.port, request, args.connections, min(args.requests, 200)))  # Warm-up
+        latencies, errors, elapsed = asyncio.run(run_load(host, args.port, request, args.connections, args.requests))
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    scans = len(latencies) * max(args.batch_size, 1)
+    print(f'{len(latencies)} requests over {args.connections} connections in {elapsed:.2f}s, {len(errors)} errors')
+    print(f'  {len(latencies) / elapsed:8.0f} requests/s  {scans / elapsed:10.0f} scans/s')
+    for label, quantile in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+        print(f'  {label}={latencies[min(len(latencies) - 1, int(len(latencies) * quantile))] * 1e3:7.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
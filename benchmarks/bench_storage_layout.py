@@ -0,0 +1,118 @@
+# File size and scan times of the stored and compact patients layouts (migrations.compact_patients).
+#
+# Loads the same generated scans into a database with the stored layout, copies it, compacts the
+# copy, VACUUMs both and then checks that every row reads back identically before timing:
+#   - bulk insert of the rows into each layout
+#   - a full scan over raw columns, over derived columns, and SELECT * of the whole table
+#   - SELECT * of one patient's history (the fetch_patient_data query)
+#
+#   python benchmarks/bench_storage_layout.py --rows 1000000
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database  # noqa: E402
+import datagen  # noqa: E402
+import migrations  # noqa: E402
+import registry  # noqa: E402
+
+SCANS_PER_PATIENT = 20
+
+QUERIES = (
+    ('scan raw columns', 'SELECT SUM(weight), SUM(height), SUM(body_fat_percentage) FROM patients'),
+    ('scan derived columns', 'SELECT SUM(bmi), SUM(bmr), SUM(muscle_mass) FROM patients'),
+    ('SELECT * whole table', 'SELECT * FROM patients'),
+)
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def load(path, columns, rows, compact):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrations.migrate(conn)
+    if compact:
+        migrations.compact_patients(conn)
+    conn.close()
+    database.DB_PATH = path
+    start = time.perf_counter()
+    database.insert_patient_rows(rows, columns)
+    seconds = time.perf_counter() - start
+    database.close_pools()
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stored vs compact patients layout: size and scan time')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    patients = max(1, args.rows // SCANS_PER_PATIENT)
+    columns, rows = datagen.patient_rows(args.rows, patients, args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {'stored': os.path.join(tmp, 'stored.db'), 'compact': os.path.join(tmp, 'compact.db')}
+        insert_seconds = {layout: load(path, columns, rows, layout == 'compact') for layout, path in paths.items()}
+
+        # The same file converted in place, as an existing deployment would be
+        converted = os.path.join(tmp, 'converted.db')
+        shutil.copy(paths['stored'], converted)
+        conn = sqlite3.connect(converted, isolation_level=None)
+        start = time.perf_counter()
+        stale = migrations.compact_patients(conn)
+        print(f'compact_patients on {args.rows} rows: {time.perf_counter() - start:.2f}s, {stale} stale rows')
+        conn.close()
+
+        connections = {}
+        for layout, path in paths.items():
+            conn = sqlite3.connect(path, isolation_level=None)
+            conn.execute('VACUUM')
+            connections[layout] = conn
+        stored_rows = connections['stored'].execute('SELECT * FROM patients ORDER BY patient_id').fetchall()
+        for path in (paths['compact'], converted):
+            with sqlite3.connect(path) as conn:
+                if conn.execute('SELECT * FROM patients ORDER BY patient_id').fetchall() != stored_rows:
+                    sys.exit(f'{path}: rows differ from the stored layout')
+        del stored_rows
+
+        rng = random.Random(args.seed)
+        names = [f'patient-{rng.randrange(patients)}' for _ in range(200)]
+        results = {}
+        for layout, conn in connections.items():
+            results[layout] = {
+                'file size (MB)': os.path.getsize(paths[layout]) / 1e6,
+                'bulk insert (rows/s)': args.rows / insert_seconds[layout],
+            }
+            for label, query in QUERIES:
+                results[layout][f'{label} (ms)'] = best_of(args.repeat, lambda: conn.execute(query).fetchall()) * 1e3
+            registry_ids = [registry.lookup(conn, name) for name in names]
+            one_patient = f'SELECT * FROM patients WHERE {database.PATIENT_SCANS}'
+            seconds = best_of(args.repeat, lambda: [conn.execute(one_patient, (registry_id,)).fetchall()
+                                                    for registry_id in registry_ids])
+            results[layout]['SELECT * one patient (us)'] = seconds / len(names) * 1e6
+            conn.close()
+
+    print(f'{args.rows} rows, {patients} patients')
+    print(f"{'':28s} {'stored':>12s} {'compact':>12s} {'change':>8s}")
+    for metric in results['stored']:
+        stored, compact = results['stored'][metric], results['compact'][metric]
+        print(f'{metric:28s} {stored:12.2f} {compact:12.2f} {compact / stored - 1:+8.1%}')
+
+
+if __name__ == '__main__':
+    main()
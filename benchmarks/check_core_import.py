@@ -0,0 +1,61 @@
+# Import-time guard for core.py, the formula module batch workers and CLIs import.
+#
+# Imports core in a fresh interpreter and fails (exit status 1) if that takes longer than the
+# budget or drags in a UI, dataframe or database module. numpy alone costs ~100 ms, so a stray
+# top-level import of any of these shows up well above the budget.
+#
+#   python benchmarks/check_core_import.py --budget-ms 20
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules core must not load at import time
+FORBIDDEN_MODULES = ('streamlit', 'pandas', 'numpy', 'sqlite3', 'pyarrow', 'database', 'batch_calculations')
+
+PROBE = '''
+import sys, time
+sys.path.insert(0, {root!r})
+loaded = set(sys.modules)
+start = time.perf_counter()
+import core
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(' '.join(sorted(set(sys.modules) - loaded)))
+'''
+
+
+def measure(runs):
+    timings, imported = [], set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', PROBE.format(root=ROOT)], capture_output=True, text=True,
+                                check=True).stdout.splitlines()
+        timings.append(float(output[0]) * 1e3)
+        imported.update(output[1].split() if len(output) > 1 else ())
+    return min(timings), imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail if importing core.py is slow or pulls in heavy modules')
+    parser.add_argument('--budget-ms', type=float, default=20.0)
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters; the fastest run is compared')
+    args = parser.parse_args()
+
+    elapsed_ms, imported = measure(args.runs)
+    forbidden = sorted({name.split('.')[0] for name in imported} & set(FORBIDDEN_MODULES))
+    print(f'import core: {elapsed_ms:.2f} ms (budget {args.budget_ms:g} ms), {len(imported)} modules loaded')
+    failures = []
+    if elapsed_ms > args.budget_ms:
+        failures.append(f'import took {elapsed_ms:.2f} ms')
+    if forbidden:
+        failures.append(f"heavy modules imported: {', '.join(forbidden)}")
+    if failures:
+        print('FAIL: ' + '; '.join(failures))
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Guard for the analyzer's Download buttons (exporter.export_to_file).
+#
+# Saves generated scans to a temporary database, then passes each export format through the same
+# conversion st.download_button applies to its deferred `data` callable, and fails (exit status 1)
+# if Streamlit rejects the result or the file read back has the wrong number of rows.
+#
+#   python benchmarks/check_export_download.py --rows 20000
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import database  # noqa: E402
+import datagen  # noqa: E402
+import exporter  # noqa: E402
+
+
+def count_rows(data, file_format):
+    if file_format == 'csv':
+        return data.count(b'\n') - 1
+    import pyarrow.parquet as pq
+
+    return pq.read_metadata(io.BytesIO(data)).num_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fail if an export is not accepted by st.download_button')
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+    columns, rows = datagen.patient_rows(args.rows, max(1, args.rows // 20), args.seed)
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_PATH = os.path.join(tmp, 'export.db')
+        database.insert_patient_rows(rows, columns)
+        for file_format in exporter.EXPORT_FORMATS:
+            start = time.perf_counter()
+            try:
+                payload, _ = convert_data_to_bytes_and_infer_mime(exporter.export_to_file(file_format),
+                                                                  TypeError('unsupported download data'))
+            except TypeError as e:
+                failures.append(f'{file_format}: {e}')
+                continue
+            elapsed = time.perf_counter() - start
+            exported = count_rows(payload, file_format)
+            print(f'{file_format}: {len(payload) / 1e6:.1f} MB, {exported} rows in {elapsed:.2f}s')
+            if exported != args.rows:
+                failures.append(f'{file_format}: {exported} rows exported, expected {args.rows}')
+    if failures:
+        print('FAIL: ' + '; '.join(failures))
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Seeded data generators for the benchmark suite. The same seed always yields the same data, so
+# results from different commits are measured on identical inputs.
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core import ACTIVITY_MULTIPLIERS  # noqa: E402
+from meal_catalog import load_catalog  # noqa: E402
+from meal_index import split_ingredients  # noqa: E402
+from meal_solver import MEAL_TYPES  # noqa: E402
+
+
+# Analyzer inputs for n patients, in the ranges the input widgets allow for adults
+def scans(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'age': rng.integers(18, 90, n),
+        'sex': rng.choice(np.array(['Male', 'Female'], dtype=object), n),
+        'weight': rng.uniform(45, 130, n).round(1),
+        'height': rng.uniform(150, 200, n).round(1),
+        'waist_hip_ratio': rng.uniform(0.7, 1.1, n).round(2),
+        'body_fat_percentage': rng.uniform(8, 45, n).round(1),
+        'activity': rng.choice(np.array(list(ACTIVITY_MULTIPLIERS), dtype=object), n),
+        'goal_weight': rng.uniform(45, 130, n).round(1),
+        'rate_of_change': rng.uniform(-1, 1, n).round(2),
+    })
+
+
+# Rows for insert_patient_rows: n scans spread over `patients` names, with derived columns filled
+# in and created_at one day apart per patient
+def patient_rows(n, patients, seed=0):
+    from batch_calculations import calculate_body_composition_frame
+    from database import PATIENT_COLUMNS
+
+    df = calculate_body_composition_frame(scans(n, seed))
+    df['name'] = [f'patient-{i % patients}' for i in range(n)]
+    created_at = pd.Timestamp('2020-01-01') + pd.to_timedelta(np.arange(n) // patients, unit='D')
+    df['created_at'] = created_at.strftime('%Y-%m-%d %H:%M:%S')
+    columns = PATIENT_COLUMNS + ('created_at',)
+    return columns, list(df[list(columns)].itertuples(index=False, name=None))
+
+
+# A meal catalog of n meals, resampled from the shipped catalog with jittered nutrients, unique names
+# and meal types spread evenly
+def meal_catalog(n, seed=0):
+    rng = np.random.default_rng(seed)
+    base = load_catalog()
+    df = base.iloc[rng.integers(0, len(base), n)].reset_index(drop=True)
+    df['وجبة'] = [f'{name} {i}' for i, name in enumerate(df['وجبة'])]
+    df['نوع الوجبة'] = np.array(MEAL_TYPES, dtype=object)[rng.integers(0, len(MEAL_TYPES), n)]
+    for column in ('السعرات الحرارية', 'الدهون (غرام)', 'البروتين (غرام)', 'الكربوهيدرات (غرام)'):
+        df[column] = (df[column].astype(float) * rng.uniform(0.6, 1.4, n)).round()
+    return df
+
+
+# k distinct ingredients of the catalog to exclude
+def exclusions(catalog, k, seed=0):
+    vocabulary = sorted({ingredient for text in catalog['المكونات'] for ingredient in split_ingredients(text)})
+    rng = np.random.default_rng(seed)
+    return [vocabulary[i] for i in rng.choice(len(vocabulary), min(k, len(vocabulary)), replace=False)]
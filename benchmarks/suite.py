@@ -0,0 +1,269 @@
+# Reproducible benchmark suite: calculations, patient storage and meal planning.
+#
+# Every run appends one JSON line per measurement to the results file, tagged with the commit,
+# so runs on different commits can be compared:
+#
+#   python benchmarks/suite.py                        # all groups, default sizes
+#   python benchmarks/suite.py storage --max-rows 10000000
+#   python benchmarks/suite.py --compare HEAD~1       # latest run of HEAD~1 vs this run
+#
+# Inputs come from benchmarks/datagen.py with fixed seeds. Timings are the best of --repeat runs.
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datagen  # noqa: E402
+
+DEFAULT_RESULTS = os.path.join(ROOT, 'benchmarks', 'results.jsonl')
+
+# Row counts for the batch and storage groups; sizes above --max-rows are skipped
+ROW_SIZES = (10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7)
+CATALOG_SIZES = (100, 1000, 10000, 100000)
+EXCLUSION_LENGTHS = (0, 1, 5, 20)
+
+# Meal searches timed per catalog size: (label, query)
+SEARCH_QUERIES = (('word', 'ملوخية'), ('variant', 'الارز'), ('prefix', 'ثو'), ('typo', 'ملوخبة'), ('two words', 'شكشوكه بيض'))
+
+# Scans per patient in the generated storage data
+SCANS_PER_PATIENT = 20
+
+# Scalar functions and the scans columns they take, in argument order (heights in cm except BMI)
+SCALAR_FUNCTIONS = (
+    ('calculate_bmi', ('weight', 'height_m')),
+    ('calculate_ideal_weight', ('height', 'sex')),
+    ('calculate_total_body_water', ('weight', 'height', 'age', 'sex')),
+    ('calculate_bmr', ('weight', 'height', 'age', 'sex')),
+    ('calculate_lean_body_mass', ('weight', 'body_fat_percentage')),
+    ('calculate_body_fat_mass', ('weight', 'body_fat_percentage')),
+    ('calculate_muscle_mass', ('weight', 'body_fat_percentage')),
+    ('calculate_visceral_fat_level', ('waist_hip_ratio', 'sex')),
+    ('calculate_body_water_percentage', ('weight', 'body_fat_percentage', 'sex')),
+    ('calculate_bone_mineral_content', ('weight',)),
+    ('calculate_rmr', ('weight', 'height', 'age', 'sex')),
+    ('calculate_calorie_intake', ('weight', 'height', 'age', 'sex', 'activity', 'goal_weight', 'rate_of_change')),
+)
+
+
+def best_of(repeat, fn):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+# Each group yields (benchmark, params, metric, value, higher_is_better)
+def bench_calculations(args):
+    import core
+    from batch_calculations import calculate_body_composition_batch, calculate_calorie_intake_batch, INPUT_COLUMNS
+    from classification import classify_columns
+
+    df = datagen.scans(10 ** 4, args.seed)
+    columns = {column: df[column].tolist() for column in df.columns}
+    columns['height_m'] = [height / 100 for height in columns['height']]
+    for name, arg_columns in SCALAR_FUNCTIONS:
+        fn = getattr(core, name)
+        rows = list(zip(*(columns[column] for column in arg_columns)))
+        seconds = best_of(args.repeat, lambda: [fn(*row) for row in rows])
+        yield f'calc.scalar.{name}', {'rows': len(rows)}, 'ns_per_row', seconds / len(rows) * 1e9, False
+
+    for rows in (size for size in ROW_SIZES if size <= args.max_rows):
+        df = datagen.scans(rows, args.seed)
+        inputs = [df[column].to_numpy() for column in INPUT_COLUMNS]
+        seconds = best_of(args.repeat, lambda: calculate_body_composition_batch(*inputs))
+        yield 'calc.batch.body_composition', {'rows': rows}, 'ns_per_row', seconds / rows * 1e9, False
+        intake = [df[column].to_numpy() for column in
+                  ('weight', 'height', 'age', 'sex', 'activity', 'goal_weight', 'rate_of_change')]
+        seconds = best_of(args.repeat, lambda: calculate_calorie_intake_batch(*intake))
+        yield 'calc.batch.calorie_intake', {'rows': rows}, 'ns_per_row', seconds / rows * 1e9, False
+        results = calculate_body_composition_batch(*inputs)
+        results['waist_hip_ratio'] = df['waist_hip_ratio'].to_numpy()
+        seconds = best_of(args.repeat, lambda: classify_columns(results, df['sex'].to_numpy(), df['age'].to_numpy()))
+        yield 'calc.batch.classify', {'rows': rows}, 'ns_per_row', seconds / rows * 1e9, False
+
+
+def bench_storage(args):
+    import database
+
+    operations = args.operations
+    for rows in (size for size in ROW_SIZES if size <= args.max_rows):
+        patients = max(1, rows // SCANS_PER_PATIENT)
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DB_PATH = os.path.join(tmp, 'bench.db')
+            columns, data = datagen.patient_rows(rows, patients, args.seed)
+            start = time.perf_counter()
+            database.insert_patient_rows(data, columns)
+            load_seconds = time.perf_counter() - start
+            yield 'storage.bulk_load', {'rows': rows}, 'rows_per_s', rows / load_seconds, True
+
+            rng = random.Random(args.seed)
+            names = [f'patient-{rng.randrange(patients)}' for _ in range(operations)]
+            row = data[0][1:len(database.PATIENT_COLUMNS)]
+            start = time.perf_counter()
+            for name in names:
+                database.insert_patient_data(name, *row)
+            yield ('storage.insert_patient_data', {'rows': rows}, 'inserts_per_s',
+                   operations / (time.perf_counter() - start), True)
+
+            latencies = []
+            for name in names:
+                start = time.perf_counter()
+                database.fetch_patient_data(name)
+                latencies.append(time.perf_counter() - start)
+            yield 'storage.fetch_patient_data', {'rows': rows}, 'p50_ms', percentile(latencies, 0.5) * 1e3, False
+            yield 'storage.fetch_patient_data', {'rows': rows}, 'p99_ms', percentile(latencies, 0.99) * 1e3, False
+            database.close_pools()
+
+
+def load_meal_planner():
+    spec = importlib.util.spec_from_file_location('meal_planner', os.path.join(ROOT, 'pages', 'meal_planner.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_meals(args):
+    from meal_index import IngredientIndex, MealSearchIndex
+
+    planner = load_meal_planner()
+    for size in (size for size in CATALOG_SIZES if size <= args.max_catalog):
+        catalog = datagen.meal_catalog(size, args.seed)
+        seconds = best_of(args.repeat, lambda: planner.filter_meals(catalog, 300, 700, 5, 30))
+        yield 'meals.filter_meals', {'catalog': size}, 'ms', seconds * 1e3, False
+        seconds = best_of(1, lambda: IngredientIndex(catalog['المكونات']))
+        yield 'meals.ingredient_index_build', {'catalog': size}, 'ms', seconds * 1e3, False
+        index = IngredientIndex(catalog['المكونات'])
+        planner.generate_meals(catalog, 1500, 2200, 0, 150, 1, 1, 1, 1, [], '', index)  # Warm-up
+        for length in EXCLUSION_LENGTHS:
+            excluded = ', '.join(datagen.exclusions(catalog, length, args.seed))
+            seconds = best_of(args.repeat, lambda: planner.generate_meals(
+                catalog, 1500, 2200, 0, 150, 1, 1, 1, 1, [], excluded, index))
+            yield 'meals.generate_meals', {'catalog': size, 'exclusions': length}, 'ms', seconds * 1e3, False
+        seconds = best_of(1, lambda: MealSearchIndex(catalog['وجبة'], catalog['المكونات']))
+        yield 'meals.search_index_build', {'catalog': size}, 'ms', seconds * 1e3, False
+        search_index = MealSearchIndex(catalog['وجبة'], catalog['المكونات'])
+        for label, query in SEARCH_QUERIES:
+            seconds = best_of(args.repeat, lambda: search_index.search(query))
+            yield 'meals.search', {'catalog': size, 'query': label}, 'ms', seconds * 1e3, False
+
+
+GROUPS = {'calculations': bench_calculations, 'storage': bench_storage, 'meals': bench_meals}
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+def resolve_commit(ref):
+    try:
+        return subprocess.run(['git', 'rev-parse', ref], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ref
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _key(record):
+    return record['benchmark'], json.dumps(record['params'], sort_keys=True), record['metric']
+
+
+# Compare this run against the latest run recorded for `ref`; returns the number of regressions
+def compare(records, results, ref, threshold):
+    commit = resolve_commit(ref)
+    runs = [record for record in results if (record['commit'] or '').split('-')[0] == commit]
+    if not runs:
+        print(f'No recorded run for {ref} ({commit[:12]}) in the results file')
+        return 0
+    latest_run = runs[-1]['run_id']
+    baseline = {_key(record): record for record in runs if record['run_id'] == latest_run}
+    regressions = 0
+    print(f'\nCompared with {ref} (run {latest_run}), threshold {threshold:.0%}:')
+    for record in records:
+        base = baseline.get(_key(record))
+        if base is None or not base['value']:
+            continue
+        change = record['value'] / base['value'] - 1
+        worse = -change if record['higher_is_better'] else change
+        flag = 'REGRESSION' if worse > threshold else ''
+        regressions += bool(flag)
+        print(f"  {record['benchmark']:34s} {json.dumps(record['params']):32s} {record['metric']:13s} "
+              f"{base['value']:12.3f} -> {record['value']:12.3f} ({change:+7.1%}) {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark calculations, storage and meal planning')
+    parser.add_argument('groups', nargs='*', help=f"groups to run: {', '.join(GROUPS)} (default: all)")
+    parser.add_argument('--max-rows', type=int, default=10 ** 5, help='largest row count for calculations and storage')
+    parser.add_argument('--max-catalog', type=int, default=10 ** 4, help='largest meal catalog size')
+    parser.add_argument('--operations', type=int, default=200, help='single inserts and fetches per storage size')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', default=DEFAULT_RESULTS, help='JSON lines file results are appended to')
+    parser.add_argument('--compare', metavar='REF', help='commit or ref whose latest recorded run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+    unknown = set(args.groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown group: {', '.join(sorted(unknown))}")
+    args.groups = args.groups or list(GROUPS)
+
+    import pandas as pd
+    run = {
+        'run_id': datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': f'{platform.machine()} x{os.cpu_count()}',
+    }
+    previous = load_results(args.results)
+    records = []
+    with open(args.results, 'a') as out:
+        for group in args.groups:
+            for benchmark, params, metric, value, higher_is_better in GROUPS[group](args):
+                record = dict(run, benchmark=benchmark, params=params, metric=metric, value=round(value, 6),
+                              higher_is_better=higher_is_better)
+                records.append(record)
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                print(f'{benchmark:34s} {json.dumps(params):32s} {metric:13s} {value:12.3f}')
+    if args.compare and compare(records, previous, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
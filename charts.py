@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+
+# Upper bound on points sent to the browser per progression chart
+MAX_CHART_POINTS = 500
+
+
+# Shape-preserving min/max bucketing for a time-indexed DataFrame (sorted by time).
+# The time span is cut into equal-width buckets and, for every series, the rows holding the bucket's
+# minimum and maximum are kept, along with the first and last rows. Peaks and troughs survive,
+# all series share the kept timestamps, and the result has at most max_points + 2 rows.
+def minmax_downsample(df, max_points=MAX_CHART_POINTS):
+    if len(df) <= max_points or df.empty:
+        return df
+    buckets = max(1, max_points // (2 * len(df.columns)))
+    times = df.index.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    edges = np.linspace(times[0], times[-1], buckets + 1)
+    bucket = np.clip(np.searchsorted(edges, times, side='right') - 1, 0, buckets - 1)
+    keep = {0, len(df) - 1}
+    for column in df.columns:
+        values = pd.Series(df[column].to_numpy(dtype=float))
+        present = values.notna().to_numpy()
+        grouped = values[present].groupby(bucket[present])
+        keep.update(grouped.idxmin().tolist())
+        keep.update(grouped.idxmax().tolist())
+    return df.iloc[sorted(keep)]
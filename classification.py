@@ -0,0 +1,210 @@
+import math
+
+import numpy as np
+
+
+# Band labels per metric, lowest band first; metrics not listed use Low / Normal / High
+band_labels = {
+    'BMI': ('Underweight', 'Normal weight', 'Overweight', 'Obesity'),
+    'Waist-to-Hip Ratio': ('Normal', 'High'),
+}
+DEFAULT_BAND_LABELS = ('Low', 'Normal', 'High')
+
+# Label of the healthy band, whose bounds are shown as the normal range
+NORMAL_LABELS = {'BMI': 'Normal weight'}
+
+# Cut points between the bands of each metric, as (sex, min age, max age, cuts) rules. The first rule
+# matching a patient applies; None matches any sex or leaves the age band open. The healthy band is
+# closed at both ends (a value on a bound is normal), every other band is half-open away from it.
+# The normal ranges are the app's established ones; add sex- or age-specific rules only from a sourced
+# reference table.
+reference_ranges = {
+    'BMI': [(None, None, None, (18.5, 24.9, 29.9))],  # WHO adult bands
+    'BMR': [(None, None, None, (1200, 2500))],  # Harris-Benedict equation
+    'Lean Body Mass': [(None, None, None, (50, 90))],
+    'Body Fat Mass': [(None, None, None, (10, 30))],
+    'Waist-to-Hip Ratio': [  # WHO abdominal obesity cut-offs, as used by the dietary recommendations
+        ('Male', None, None, (0.9,)),
+        (None, None, None, (0.85,)),
+    ],
+    'Muscle Mass': [(None, None, None, (40, 60))],
+    'Visceral Fat Level': [(None, None, None, (1, 12))],
+    'Body Water Percentage': [(None, None, None, (45, 60))],
+    'Bone Mineral Content': [(None, None, None, (1.5, 3.5))],
+    'Resting Metabolic Rate (RMR)': [(None, None, None, (1200, 2500))],  # Harris-Benedict equation
+}
+
+# Batch engine column (see batch_calculations.DERIVED_COLUMNS) holding each classified metric
+METRIC_COLUMNS = {
+    'BMI': 'bmi',
+    'BMR': 'bmr',
+    'Lean Body Mass': 'lean_body_mass',
+    'Body Fat Mass': 'body_fat_mass',
+    'Waist-to-Hip Ratio': 'waist_hip_ratio',
+    'Muscle Mass': 'muscle_mass',
+    'Visceral Fat Level': 'visceral_fat_level',
+    'Body Water Percentage': 'body_water_percentage',
+    'Bone Mineral Content': 'bone_mineral_content',
+    'Resting Metabolic Rate (RMR)': 'resting_metabolic_rate',
+}
+
+# Define findings for each result
+findings = {
+    'BMI': {
+        'Underweight': 'Your BMI indicates that you are underweight. This may suggest a higher risk of certain health issues such as nutritional deficiencies and osteoporosis.',
+        'Normal weight': 'Your BMI falls within the normal range. This indicates a healthy weight for your height.',
+        'Overweight': 'Your BMI indicates that you are overweight. This may increase your risk of developing various health problems such as heart disease and type 2 diabetes.',
+        'Obesity': 'Your BMI indicates that you are obese. Obesity is associated with an increased risk of several serious health conditions, including heart disease, stroke, type 2 diabetes, and certain cancers.'
+    },
+    'BMR': {
+        'Low': 'Your BMR is lower than normal, which may indicate a slower metabolism. This could be due to various factors such as age, sex, muscle mass, and hormonal imbalances.',
+        'Normal': 'Your BMR falls within the normal range. This suggests that your metabolism is functioning adequately to support basic bodily functions.',
+        'High': 'Your BMR is higher than normal, which may indicate a faster metabolism. Factors such as genetics, physical activity level, and muscle mass can influence your metabolic rate.'
+    },
+    'Lean Body Mass': {
+        'Low': 'Your lean body mass is lower than normal. Lean body mass includes muscles, bones, organs, and water. Increasing muscle mass through resistance training and consuming adequate protein can help improve lean body mass.',
+        'Normal': 'Your lean body mass falls within the normal range. This suggests that you have an appropriate amount of muscle, bone, and other lean tissues for your height and weight.',
+        'High': 'Your lean body mass is higher than normal. Having a higher lean body mass can indicate greater strength, endurance, and overall fitness. However, it\'s important to maintain a balance between muscle mass and body fat.'
+    },
+    'Body Fat Mass': {
+        'Low': 'Your body fat mass is lower than normal. While a low body fat percentage may be desirable for some athletes, it can also indicate inadequate energy reserves and potential health risks. Ensure that you are consuming enough calories and nutrients to support your body\'s needs.',
+        'Normal': 'Your body fat mass falls within the normal range. This suggests a healthy balance between lean tissues and stored fat.',
+        'High': 'Your body fat mass is higher than normal. Excess body fat can increase the risk of various health conditions such as heart disease, diabetes, and certain cancers. Consider adopting a balanced diet and regular exercise routine to reduce body fat.'
+    },
+    'Waist-to-Hip Ratio': {
+        'Normal': 'Your waist-to-hip ratio falls within the normal range. This indicates a healthy distribution of body fat, which may lower the risk of obesity-related health issues such as heart disease and diabetes.',
+        'High': 'Your waist-to-hip ratio indicates higher abdominal fat. Central obesity is associated with an increased risk of heart disease and type 2 diabetes. Consider incorporating more cardiovascular exercises and reducing calorie intake to target abdominal fat.'
+    },
+    'Muscle Mass': {
+        'Low': 'Your muscle mass is lower than normal. Adequate muscle mass is essential for strength, mobility, and overall health. Consider incorporating resistance training exercises and consuming sufficient protein to support muscle growth and maintenance.',
+        'Normal': 'Your muscle mass falls within the normal range. This suggests good muscle development and overall physical fitness.',
+        'High': 'Your muscle mass is higher than normal. Having greater muscle mass can enhance metabolism, strength, and functional capacity. Continue with your current exercise routine to maintain muscle health.'
+    },
+    'Visceral Fat Level': {
+        'Low': 'Your visceral fat level is lower than normal. Visceral fat surrounds organs and can contribute to various health problems when elevated. Maintaining a healthy weight, engaging in regular physical activity, and consuming a balanced diet can help prevent visceral fat accumulation.',
+        'Normal': 'Your visceral fat level falls within the normal range. This suggests a healthy distribution of fat within the body, which may lower the risk of metabolic disorders and cardiovascular disease.',
+        'High': 'Your visceral fat level is higher than normal. Excess visceral fat is associated with an increased risk of metabolic syndrome, heart disease, and type 2 diabetes. Focus on lifestyle modifications such as dietary changes and increased physical activity to reduce visceral fat levels.'
+    },
+    'Body Water Percentage': {
+        'Low': 'Your body water percentage is lower than normal. Adequate hydration is essential for various bodily functions, including temperature regulation, digestion, and nutrient transport. Increase your water intake and consume hydrating foods to maintain optimal hydration levels.',
+        'Normal': 'Your body water percentage falls within the normal range. This suggests adequate hydration, which is crucial for overall health and well-being.',
+        'High': 'Your body water percentage is higher than normal. While hydration is important, excessive water retention may indicate underlying health issues such as kidney dysfunction or hormonal imbalances. Consult with a healthcare professional for further evaluation.'
+    },
+    'Bone Mineral Content': {
+        'Low': 'Your bone mineral content is lower than normal. Adequate bone mineral density is essential for skeletal health and reducing the risk of fractures and osteoporosis. Ensure adequate intake of calcium, vitamin D, and engage in weight-bearing exercises to promote bone health.',
+        'Normal': 'Your bone mineral content falls within the normal range. This suggests good bone density and overall skeletal health. Maintain a balanced diet and engage in regular physical activity to support bone health.',
+        'High': 'Your bone mineral content is higher than normal. While higher bone density is generally beneficial for skeletal strength, excessively high bone mineral content may indicate underlying health conditions such as hyperparathyroidism or certain cancers. Further evaluation may be warranted.'
+    },
+    'Resting Metabolic Rate (RMR)': {
+        'Low': 'Your RMR is lower than normal, which may indicate a slower metabolism. A lower metabolic rate can make it more challenging to maintain or lose weight. Factors such as age, sex, body composition, and medical conditions can influence RMR.',
+        'Normal': 'Your RMR falls within the normal range. This suggests that your metabolism is functioning adequately to support basic bodily functions at rest. Regular physical activity and dietary choices can influence metabolic rate.',
+        'High': 'Your RMR is higher than normal, which may indicate a faster metabolism. A higher metabolic rate can lead to increased calorie burning and easier weight maintenance. Factors such as genetics, muscle mass, and thyroid function can influence RMR.'
+    }
+}
+
+
+_SEX_CODES = {'Male': 1, 'Female': 2}
+
+
+# Compile the rules of one metric into arrays: per rule a sex code (0 = any), an age band and a row of
+# cut points, plus per cut whether a value on it already falls in the upper band
+def _compile_metric(metric, rules):
+    labels = band_labels.get(metric, DEFAULT_BAND_LABELS)
+    normal = labels.index(NORMAL_LABELS.get(metric, 'Normal'))
+    for _, _, _, cuts in rules:
+        if len(cuts) != len(labels) - 1:
+            raise ValueError(f"{metric}: {len(labels)} bands need {len(labels) - 1} cut points, got {cuts}")
+    metric_findings = findings.get(metric, {})
+    return {
+        'labels': np.array(labels, dtype=object),
+        'findings': np.array([metric_findings.get(label, 'No finding available') for label in labels], dtype=object),
+        'normal': normal,
+        'sex': np.array([_SEX_CODES[sex] if sex else 0 for sex, _, _, _ in rules]),
+        'min_age': np.array([-math.inf if low is None else low for _, low, _, _ in rules], dtype=float),
+        'max_age': np.array([math.inf if high is None else high for _, _, high, _ in rules], dtype=float),
+        'cuts': np.array([cuts for _, _, _, cuts in rules], dtype=float),
+        'inclusive': np.arange(len(labels) - 1) < normal,
+    }
+
+
+# Threshold tables for every metric, compiled once at import
+threshold_tables = {metric: _compile_metric(metric, rules) for metric, rules in reference_ranges.items()}
+
+
+def _sex_codes(sex, shape):
+    sex = np.broadcast_to(np.asarray(sex, dtype=object), shape)
+    codes = np.zeros(shape, dtype=int)
+    for sex_name, code in _SEX_CODES.items():
+        codes[sex == sex_name] = code
+    return codes
+
+
+# Band index of every value and the cut points that applied to it. The first matching rule wins;
+# rule lists end in a catch-all, so an unknown sex or an age outside every band falls through to it.
+def _bands(table, values, sex_codes, age):
+    matches = (((table['sex'] == 0) | (table['sex'] == sex_codes[:, None]))
+               & (age[:, None] >= table['min_age']) & (age[:, None] < table['max_age']))
+    cuts = table['cuts'][np.argmax(matches, axis=1)]
+    band = np.where(table['inclusive'], values[:, None] >= cuts, values[:, None] > cuts).sum(axis=1)
+    missing = np.isnan(values) | ~matches.any(axis=1)
+    return band, missing, cuts
+
+
+# Classify an array of values of one metric for patients of the given sex and age (scalars broadcast).
+# Returns arrays of the band label (None for missing values), the finding text, and the bounds of the
+# normal range that applied to each patient (NaN where that side is open).
+def classify(metric, values, sex, age):
+    table = threshold_tables[metric]
+    values = np.atleast_1d(np.asarray(values, dtype=float))
+    age = np.broadcast_to(np.asarray(age, dtype=float), values.shape)
+    band, missing, cuts = _bands(table, values, _sex_codes(sex, values.shape), age)
+
+    normal = table['normal']
+    low = cuts[:, normal - 1] if normal > 0 else np.full(len(values), np.nan)
+    high = cuts[:, normal] if normal < cuts.shape[1] else np.full(len(values), np.nan)
+    return {'status': np.where(missing, None, table['labels'][band]),
+            'finding': np.where(missing, None, table['findings'][band]),
+            'low': low, 'high': high}
+
+
+def _scalar(item):
+    if isinstance(item, float):
+        return None if math.isnan(item) else float(item)
+    return item
+
+
+# Classify one patient's results ({metric: value}, as shown in the analyzer) in the same pass the
+# cohort reports use. Returns {metric: {'status', 'finding', 'low', 'high'}} for the classified metrics.
+def classify_results(results, sex, age):
+    classified = {}
+    for metric, value in results.items():
+        if metric not in threshold_tables:
+            continue
+        classified[metric] = {key: _scalar(array[0]) for key, array in classify(metric, [value], sex, age).items()}
+    return classified
+
+
+# Band labels of every metric in `values` ({METRIC_COLUMNS column: array}) for the same patients,
+# looking up sex and age once for all metrics. Returns {column: array of labels}.
+def classify_columns(values, sex, age):
+    age = np.atleast_1d(np.asarray(age, dtype=float))
+    sex_codes = _sex_codes(sex, age.shape)
+    statuses = {}
+    for metric, column in METRIC_COLUMNS.items():
+        if column in values:
+            table = threshold_tables[metric]
+            band, missing, _ = _bands(table, np.asarray(values[column], dtype=float), sex_codes, age)
+            statuses[column] = np.where(missing, None, table['labels'][band])
+    return statuses
+
+
+# Cohort front-end: returns a copy of df (as produced by calculate_body_composition_frame) with a
+# <column>_status column for each metric present in it
+def classify_frame(df):
+    result_df = df.copy()
+    statuses = classify_columns({column: df[column].to_numpy(dtype=float) for column in df.columns
+                                 if column in METRIC_COLUMNS.values()},
+                                df['sex'].to_numpy(dtype=object), df['age'].to_numpy(dtype=float))
+    for column, status in statuses.items():
+        result_df[f'{column}_status'] = status
+    return result_df
@@ -0,0 +1,172 @@
+import math
+from bisect import bisect_right
+
+import numpy as np
+
+
+# Metrics (patients columns) with a population sketch per stratum
+COHORT_METRICS = ('weight', 'body_fat_percentage', 'waist_hip_ratio', 'bmi', 'bmr', 'lean_body_mass', 'body_fat_mass',
+                  'muscle_mass', 'visceral_fat_level', 'body_water_percentage', 'bone_mineral_content',
+                  'resting_metabolic_rate')
+
+# Strata patients are compared within: sex, and the age bands starting at these ages
+SEXES = ('Male', 'Female', 'Other')
+AGE_BANDS = (0, 18, 30, 40, 50, 60, 70)
+_BAND_LABELS = tuple([f'<{AGE_BANDS[1]}']
+                     + [f'{lower}-{upper - 1}' for lower, upper in zip(AGE_BANDS[1:], AGE_BANDS[2:])]
+                     + [f'{AGE_BANDS[-1]}+'])
+
+# Relative accuracy of the sketches: every value is counted in a logarithmic bucket whose bounds are
+# within 1% of it (the DDSketch construction), so a sketch holds a few hundred buckets at most
+# however many scans it summarizes, and sketches merge by adding bucket counts.
+RELATIVE_ACCURACY = 0.01
+_LN_GAMMA = math.log((1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY))
+
+# Values closer to zero than this share one bucket
+MIN_MAGNITUDE = 1e-9
+
+# Strata smaller than this are compared against every age band of the same sex instead; a sex with
+# fewer scans than this gets no percentiles
+MIN_COHORT_SIZE = 30
+
+# Rows read and bucketed at a time when folding a bulk import into the sketches
+FOLD_CHUNK = 100000
+
+
+def age_band(age):
+    return _BAND_LABELS[max(bisect_right(AGE_BANDS, age) - 1, 0)]
+
+
+def sex_stratum(sex):
+    return sex if sex in SEXES else 'Other'
+
+
+def create_cohort_schema(conn):
+    # One row per sketch bucket: the number of scans of a stratum whose metric value falls in it.
+    # sign is 1 or -1 for positive and negative values and 0 for the zero bucket (bucket 0).
+    # cohort_state records the last patient_id folded in, so updates only read newer rows.
+    conn.execute('''CREATE TABLE IF NOT EXISTS cohort_buckets (
+                        sex TEXT NOT NULL,
+                        age_band TEXT NOT NULL,
+                        metric TEXT NOT NULL,
+                        sign INTEGER NOT NULL,
+                        bucket INTEGER NOT NULL,
+                        count INTEGER NOT NULL,
+                        PRIMARY KEY (sex, age_band, metric, sign, bucket)
+                    ) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS cohort_state (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        last_patient_id INTEGER NOT NULL
+                    )''')
+    conn.execute('INSERT OR IGNORE INTO cohort_state (id, last_patient_id) VALUES (1, 0)')
+
+
+# Percentile rank (0-100) of `value` among (sign, bucket, count) rows: the values in lower buckets
+# plus the part of its own bucket below it, assuming values spread evenly on the log scale within a bucket
+def percentile(buckets, value):
+    total = sum(count for _, _, count in buckets)
+    if not total:
+        return None
+    if abs(value) < MIN_MAGNITUDE:
+        below = sum(count for sign, _, count in buckets if sign < 0)
+        below += sum(count for sign, _, count in buckets if sign == 0) / 2
+        return 100 * below / total
+    position = math.log(abs(value)) / _LN_GAMMA
+    index = math.ceil(position)
+    below = 0
+    for sign, bucket, count in buckets:
+        if value > 0:
+            if sign < 1 or bucket < index:
+                below += count
+            elif bucket == index:
+                below += count * (position - index + 1)
+        elif sign == -1:
+            if bucket > index:
+                below += count
+            elif bucket == index:
+                below += count * (index - position)
+    return 100 * below / total
+
+
+# Bucket counts of one chunk of (sex, age, *COHORT_METRICS) rows as (sex, age_band, metric, sign,
+# bucket, count) rows; missing and non-finite values are left out. Strata and bucket indexes are
+# computed column-wise, and every (stratum, sign, metric, bucket) is packed into one int64 so a
+# single np.unique counts the whole chunk.
+def _fold_chunk(chunk):
+    sexes = np.array([row[0] for row in chunk], dtype=object)
+    sex_codes = np.select([sexes == sex for sex in SEXES[:-1]], range(len(SEXES) - 1), len(SEXES) - 1)
+    ages = np.array([row[1] for row in chunk], dtype=float)
+    strata = sex_codes * len(AGE_BANDS) + np.maximum(np.searchsorted(AGE_BANDS, ages, side='right') - 1, 0)
+    values = np.array([row[2:] for row in chunk], dtype=float)
+    metrics = np.broadcast_to(np.arange(len(COHORT_METRICS)), values.shape)
+    strata = np.broadcast_to(strata[:, None], values.shape)
+    valid = np.isfinite(values)  # NULL reads as NaN; inf comes from e.g. a BMI with height 0
+    values, metrics, strata = values[valid], metrics[valid], strata[valid]
+    signs = np.where(values >= MIN_MAGNITUDE, 1, np.where(values <= -MIN_MAGNITUDE, -1, 0))
+    with np.errstate(divide='ignore'):
+        buckets = np.where(signs != 0, np.ceil(np.log(np.abs(values)) / _LN_GAMMA), 0).astype(np.int64)
+    high = (strata * 3 + signs + 1) * len(COHORT_METRICS) + metrics
+    keys, counts = np.unique((high << 32) | (buckets + (1 << 31)), return_counts=True)
+    rows = []
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        high, metric = divmod(key >> 32, len(COHORT_METRICS))
+        stratum, sign = divmod(high, 3)
+        sex, band = divmod(stratum, len(AGE_BANDS))
+        rows.append((SEXES[sex], _BAND_LABELS[band], COHORT_METRICS[metric], sign - 1,
+                     (key & 0xFFFFFFFF) - (1 << 31), count))
+    return rows
+
+
+# Fold every scan saved since the last update into the sketches, inside the caller's write
+# transaction. Only rows past the cohort_state watermark are read, FOLD_CHUNK at a time, and each
+# chunk's bucket counts are added with one upsert per touched bucket, so a single insert costs
+# one upsert per metric and a bulk import is bucketed in a few vectorized passes.
+def update_cohorts(conn):
+    last = conn.execute('SELECT last_patient_id FROM cohort_state WHERE id = 1').fetchone()[0]
+    high = conn.execute('SELECT MAX(patient_id) FROM patients').fetchone()[0]
+    if high is None or high <= last:
+        return
+    cursor = conn.execute(f'''SELECT sex, age, {', '.join(COHORT_METRICS)} FROM patients
+                              WHERE patient_id > ? AND patient_id <= ? AND age IS NOT NULL''', (last, high))
+    while True:
+        chunk = cursor.fetchmany(FOLD_CHUNK)
+        if not chunk:
+            break
+        conn.executemany('''INSERT INTO cohort_buckets (sex, age_band, metric, sign, bucket, count)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            ON CONFLICT DO UPDATE SET count = count + excluded.count''', _fold_chunk(chunk))
+    conn.execute('UPDATE cohort_state SET last_patient_id = ? WHERE id = 1', (high,))
+
+
+def _group_buckets(rows):
+    grouped = {}
+    for metric, sign, bucket, count in rows:
+        grouped.setdefault(metric, []).append((sign, bucket, count))
+    return grouped
+
+
+# Percentile of each value ({metric column: value}) among scans of the same sex and age band.
+# Reads the stratum's buckets with one primary-key range lookup, whose size depends on the spread
+# of the values and not on how many scans they summarize. Metrics whose stratum has fewer than
+# MIN_COHORT_SIZE scans use all ages of that sex (the sketches merged by summing bucket counts);
+# those without MIN_COHORT_SIZE scans even then are left out.
+# Returns {column: {'percentile', 'cohort', 'size'}}.
+def read_percentiles(conn, values, sex, age):
+    sex, band = sex_stratum(sex), age_band(age)
+    stratum = _group_buckets(conn.execute('''SELECT metric, sign, bucket, count FROM cohort_buckets
+                                             WHERE sex = ? AND age_band = ?''', (sex, band)))
+    merged = None
+    results = {}
+    for metric, value in values.items():
+        if value is None or not math.isfinite(value):
+            continue
+        cohort, buckets = f'{sex} {band}', stratum.get(metric, [])
+        if sum(count for _, _, count in buckets) < MIN_COHORT_SIZE:
+            if merged is None:
+                merged = _group_buckets(conn.execute('''SELECT metric, sign, bucket, SUM(count) FROM cohort_buckets
+                                                        WHERE sex = ? GROUP BY metric, sign, bucket''', (sex,)))
+            cohort, buckets = f'{sex}, all ages', merged.get(metric, [])
+        size = sum(count for _, _, count in buckets)
+        if size >= MIN_COHORT_SIZE:
+            results[metric] = {'percentile': percentile(buckets, value), 'cohort': cohort, 'size': size}
+    return results
@@ -0,0 +1,158 @@
+# Body-composition and calorie formulas shared by the analyzer, the calorie calculator, batch
+# workers and the CLIs. Pure Python with no UI or database side effects, so it imports in
+# milliseconds; the vectorized engine (numpy) is only loaded when one of its names is used.
+
+# Activity level multipliers applied to the BMR
+ACTIVITY_MULTIPLIERS = {'Sedentary': 1.2, 'Lightly active': 1.375, 'Moderately active': 1.55, 'Very active': 1.725,
+                        'Extra active': 1.9}
+
+# Names served lazily from batch_calculations (see __getattr__ below)
+_BATCH_NAMES = ('INPUT_COLUMNS', 'DERIVED_COLUMNS', 'calculate_body_composition_batch',
+                'calculate_body_composition_frame', 'calculate_calorie_intake_batch')
+
+
+# Calculate BMI (height in meters)
+def calculate_bmi(weight, height):
+    return weight / (height * height)
+
+# Calculate weight status based on BMI
+def calculate_weight_status(bmi):
+    if bmi < 18.5:
+        return "Underweight"
+    elif 18.5 <= bmi < 25:
+        return "Normal"
+    elif 25 <= bmi < 30:
+        return "Overweight"
+    else:
+        return "Obese"
+
+# Calculate Ideal Weight (height in cm)
+def calculate_ideal_weight(height, sex):
+    if sex == 'Male':
+        return 50 + 0.91 * (height - 152.4)
+    else:
+        return 45.5 + 0.91 * (height - 152.4)
+
+# Calculate Weight Difference
+def calculate_weight_difference(current_weight, ideal_weight):
+    difference = current_weight - ideal_weight
+    status = "Normal" if difference == 0 else "Underweight" if difference < 0 else "Overweight"
+    return status, abs(difference)
+
+# Calculate Total Body Water (TBW) in liters using the Watson formula
+def calculate_total_body_water(weight, height, age, sex):
+    if sex == 'Male':
+        tbw = 2.447 - 0.09156 * age + 0.1074 * height + 0.3362 * weight
+    else:
+        tbw = -2.097 + 0.1069 * height + 0.2466 * weight
+    return tbw
+
+# Calculate BMR (Basal Metabolic Rate) using the revised Harris-Benedict equation
+def calculate_bmr(weight, height, age, sex):
+    if sex == 'Male':
+        bmr = 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age)
+    else:
+        bmr = 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age)
+    return bmr
+
+# Calculate BMR using the Mifflin-St Jeor equation, the basis of the calorie intake recommendations
+def calculate_bmr_mifflin(weight, height, age, sex):
+    if sex == 'Male':
+        return 10 * weight + 6.25 * height - 5 * age + 5
+    else:
+        return 10 * weight + 6.25 * height - 5 * age - 161
+
+# Calculate Lean Body Mass
+def calculate_lean_body_mass(weight, body_fat_percentage):
+    return weight * (1 - body_fat_percentage / 100)
+
+# Calculate Body Fat Mass
+def calculate_body_fat_mass(weight, body_fat_percentage):
+    return weight * (body_fat_percentage / 100)
+
+# Calculate Body Fat Percentage from the fat mass
+def calculate_body_fat_percentage(weight, body_fat_mass):
+    return (body_fat_mass / weight) * 100
+
+# Calculate Waist-to-Hip Ratio
+def calculate_waist_to_hip_ratio(waist_to_hip_ratio):
+    return waist_to_hip_ratio
+
+# Calculate Muscle Mass
+def calculate_muscle_mass(weight, body_fat_percentage):
+    lean_body_mass = calculate_lean_body_mass(weight, body_fat_percentage)
+    return lean_body_mass * 0.85
+
+# Calculate Visceral Fat Level
+def calculate_visceral_fat_level(waist_hip_ratio, sex):
+    if sex == 'Male':
+        visceral_fat_level = 10 * waist_hip_ratio - 5
+    else:
+        visceral_fat_level = 10 * waist_hip_ratio - 6
+    return visceral_fat_level
+
+# Calculate Body Water Percentage
+def calculate_body_water_percentage(weight, body_fat_percentage, sex):
+    if sex == 'Male':
+        lean_body_mass = weight * (1 - body_fat_percentage / 100)
+        body_water_percentage = 60 + 0.1 * (lean_body_mass - 50)
+    else:
+        lean_body_mass = weight * (1 - body_fat_percentage / 100)
+        body_water_percentage = 50 + 0.1 * (lean_body_mass - 45)
+    return body_water_percentage
+
+# Calculate Bone Mineral Content
+def calculate_bone_mineral_content(weight):
+    return weight * 0.03
+
+# Calculate Resting Metabolic Rate (RMR)
+def calculate_rmr(weight, height, age, sex):
+    return calculate_bmr(weight, height, age, sex)
+
+# Calculate TDEE (Total Daily Energy Expenditure) from the BMR and activity level
+def calculate_tdee(bmr, activity):
+    return bmr * ACTIVITY_MULTIPLIERS[activity]
+
+# Daily (min, max) calorie intake for reaching goal_weight at rate_of_change kg/week
+def calculate_calorie_intake(weight, height, age, sex, activity, goal_weight, rate_of_change):
+    bmr = calculate_tdee(calculate_bmr_mifflin(weight, height, age, sex), activity)
+
+    # Calculate calorie intake based on goal (assuming 0.45 kg of weight loss/gain per week equals 500 kcal deficit/surplus per day)
+    if goal_weight > weight:
+        min_calorie_intake = bmr + (rate_of_change * 500)
+        max_calorie_intake = bmr + ((rate_of_change + 0.45) * 500)
+    elif goal_weight < weight:
+        min_calorie_intake = bmr - ((-rate_of_change + 0.45) * 500)
+        max_calorie_intake = bmr - (-rate_of_change * 500)
+    else:
+        min_calorie_intake = bmr - 500
+        max_calorie_intake = bmr + 500
+
+    return min_calorie_intake, max_calorie_intake
+
+# Daily calorie target for a set of dietary goals ("Weight loss", "Rapid Weight Loss", "Weight gain",
+# "Maintenance", "Fitness"); Fitness resolves to loss or gain depending on the ideal weight
+def calculate_goal_calorie_intake(tdee, goals, weight, ideal_weight):
+    goals = list(goals)
+    if "Fitness" in goals:
+        if weight < ideal_weight:
+            goals.append("Weight gain")
+        elif weight > ideal_weight:
+            goals.append("Weight loss")
+    if "Weight loss" in goals:
+        if "Rapid Weight Loss" in goals:
+            return tdee - 1000  # Subtract 1000 kcal/day for rapid weight loss
+        else:
+            return tdee - 500
+    elif "Weight gain" in goals:
+        return tdee + 500
+    else:
+        return tdee
+
+
+# The vectorized engine lives in batch_calculations and needs numpy; load it on first use only
+def __getattr__(name):
+    if name in _BATCH_NAMES:
+        import batch_calculations
+        return getattr(batch_calculations, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
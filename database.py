@@ -0,0 +1,576 @@
+import atexit
+import csv
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from operator import itemgetter
+
+import cohorts
+import migrations
+import registry
+import trends
+
+
+logger = logging.getLogger(__name__)
+
+# Location of the patient store; override with GEBODY_DB_PATH (benchmarks, tests, deployments)
+DB_PATH = os.environ.get('GEBODY_DB_PATH', 'new_patient_data.db')
+
+# Number of connections kept open per database file
+POOL_SIZE = int(os.environ.get('GEBODY_DB_POOL_SIZE', '4'))
+
+# Applied to every pooled connection. WAL lets readers run alongside the single writer,
+# synchronous=NORMAL is durable in WAL mode except for the last commits on power loss,
+# and busy_timeout makes writers wait for the lock instead of failing with "database is locked".
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+)
+
+PATIENT_COLUMNS = ('name', 'age', 'sex', 'weight', 'height', 'waist_hip_ratio', 'body_fat_percentage',
+                   'bmi', 'bmr', 'lean_body_mass', 'body_fat_mass', 'muscle_mass', 'visceral_fat_level',
+                   'body_water_percentage', 'bone_mineral_content', 'resting_metabolic_rate')
+
+# Columns shown in the patient history view
+HISTORY_COLUMNS = ('patient_id', 'created_at', 'age', 'sex', 'weight', 'height', 'waist_hip_ratio',
+                   'body_fat_percentage')
+
+# Columns a scan is stored with. A patient's scans, trend and history are keyed by their registry id;
+# the name is only the registry's label for them (rows from before migration 6 still carry it too).
+# PATIENT_COLUMNS rows start with the name, which is replaced by the registry id when they are saved.
+SCAN_COLUMNS = PATIENT_COLUMNS[1:] + ('registry_id',)
+
+# Condition selecting one patient's scans, served by the (registry_id, created_at) index. One
+# parameter, the registry id (see registry.lookup).
+PATIENT_SCANS = 'registry_id = ?'
+
+# Rows per page of patient history
+HISTORY_PAGE_SIZE = 50
+
+# Patients whose history pages are kept in the process-wide cache (least recently used are evicted)
+HISTORY_CACHE_SIZE = 256
+
+# Optional write-behind: insert_patient_data queues the row and returns, and one background thread per
+# database commits queued rows from all sessions in a single transaction per batch.
+# Off by default; enable with GEBODY_DB_WRITE_BEHIND=1.
+WRITE_BEHIND = os.environ.get('GEBODY_DB_WRITE_BEHIND') == '1'
+
+# Rows waiting for the writer; when full, insert_patient_data blocks for up to WRITE_QUEUE_TIMEOUT
+# seconds (backpressure) and then raises. Reads of a patient wait as long at most for their queued rows.
+WRITE_QUEUE_SIZE = int(os.environ.get('GEBODY_DB_WRITE_QUEUE_SIZE', '1000'))
+WRITE_QUEUE_TIMEOUT = 30.0
+
+# Most rows committed per transaction; a batch is whatever queued up while the previous one committed
+WRITE_BATCH_SIZE = 256
+
+# Attempts per batch before its rows are retried one by one, and failed rows in a row after which the
+# rest of the batch is not tried (e.g. disk full), so shutdown never hangs
+WRITE_RETRIES = 5
+
+# Where rows the writer could not commit are appended as CSV (importable with importer.py);
+# {path} is the database file
+WRITE_SPILL_PATH = os.environ.get('GEBODY_DB_SPILL_PATH', '{path}.unsaved.csv')
+
+
+# A fixed-size pool of SQLite connections shared by every Streamlit session and rerun.
+# Connections are opened lazily, configured once, and handed to one thread at a time.
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _open(self):
+        # isolation_level=None: transactions are managed explicitly by transaction()
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        try:
+            # Schema first, so an unreadable file fails with DatabaseCorruptError rather than on a pragma
+            if self._opened == 0:
+                migrations.ensure_migrated(conn, self.path)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Connection pool is closed')
+            if self._opened < self.size:
+                conn = self._open()
+                self._opened += 1
+                return conn
+        return self._idle.get()
+
+    def _release(self, conn):
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    # Borrow a connection in autocommit mode (reads, or statements that manage their own transaction)
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    # Borrow a connection inside a write transaction. BEGIN IMMEDIATE takes the write lock up front,
+    # so concurrent writers queue on busy_timeout instead of failing on a read-to-write upgrade.
+    @contextmanager
+    def transaction(self):
+        with self.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+# Return the process-wide pool for a database file. Imported modules survive Streamlit reruns,
+# so the pool (and its open connections) is created once per process.
+def get_pool(path=None):
+    path = path or DB_PATH
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = ConnectionPool(path)
+                _pools[path] = pool
+    return pool
+
+
+@atexit.register
+def close_pools():
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+# Background group-commit writer for one database file. Queued rows stay visible to
+# fetch_patient_data through `pending` until their transaction has committed, and the other
+# per-patient reads wait for them (wait_for) so a session always sees its own saves.
+class WriteBehindQueue:
+    def __init__(self, path, size=WRITE_QUEUE_SIZE):
+        self.path = path
+        self._queue = queue.Queue(maxsize=size)
+        self._pending = {}  # name -> entries not yet committed, in queue order (new patients have no id yet)
+        self._pending_lock = threading.Lock()
+        self._committed = threading.Condition(self._pending_lock)
+        self._thread = threading.Thread(target=self._run, name='patient-writer', daemon=True)
+        self._thread.start()
+
+    # Queue a PATIENT_COLUMNS row. created_at is fixed now, so the committed row equals the pending one.
+    def put(self, row):
+        entry = {'row': tuple(row) + (datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),),
+                 'patient_id': None, 'registry_id': None}
+        with self._pending_lock:
+            self._pending.setdefault(entry['row'][0], []).append(entry)
+        try:
+            self._queue.put(entry, timeout=WRITE_QUEUE_TIMEOUT)
+        except queue.Full:
+            self._discard([entry])
+            raise RuntimeError(f'Write queue for {self.path} is full') from None
+
+    # Uncommitted entries for a patient
+    def pending(self, name):
+        with self._pending_lock:
+            return list(self._pending.get(name, ()))
+
+    # Block until none of the patient's rows is waiting to be committed; False if `timeout` ran out first
+    def wait_for(self, name, timeout=WRITE_QUEUE_TIMEOUT):
+        with self._committed:
+            return self._committed.wait_for(lambda: name not in self._pending, timeout)
+
+    def _discard(self, batch):
+        with self._committed:
+            for entry in batch:
+                entries = self._pending.get(entry['row'][0])
+                if entries is not None:
+                    entries.remove(entry)
+                    if not entries:
+                        del self._pending[entry['row'][0]]
+            self._committed.notify_all()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    # Insert entries in one transaction, retrying with backoff; raises the last error after `attempts` tries
+    def _insert(self, entries, attempts):
+        names = {entry['row'][0] for entry in entries}
+        columns = SCAN_COLUMNS[:-1] + ('created_at', 'registry_id')
+        for attempt in range(1, attempts + 1):
+            try:
+                with get_pool(self.path).transaction() as conn:
+                    registry_ids = {name: registry.resolve(conn, name) for name in names}
+                    positions = _stored_positions(conn, self.path, columns)
+                    statement = _insert_statement([columns[i] for i in positions])
+                    # Ids are known before COMMIT, so a reader that already sees a row never also returns it as pending
+                    for entry in entries:
+                        entry['registry_id'] = registry_ids[entry['row'][0]]
+                        values = entry['row'][1:] + (entry['registry_id'],)
+                        entry['patient_id'] = conn.execute(statement, [values[i] for i in positions]).lastrowid
+                    trends.update_trends(conn, registry_ids.values())
+                    cohorts.update_cohorts(conn)
+                return
+            except Exception:
+                for entry in entries:
+                    entry['patient_id'] = entry['registry_id'] = None
+                if attempt == attempts:
+                    raise
+                time.sleep(0.1 * 2 ** attempt)
+
+    # Commit a batch. If it keeps failing, its rows are retried one per transaction so a bad row only
+    # fails itself; once WRITE_RETRIES rows in a row have failed the cause is taken to be the database,
+    # not the rows, and the rest are not tried. Rows that were not saved are spilled to a CSV.
+    def _commit(self, batch):
+        try:
+            self._insert(batch, WRITE_RETRIES)
+        except Exception as e:
+            logger.warning('Committing %d queued rows to %s failed (%s); retrying them one by one',
+                           len(batch), self.path, e)
+            failed = []
+            consecutive_failures = 0
+            for entry in batch:
+                if consecutive_failures >= WRITE_RETRIES:
+                    failed.append((entry, None))
+                    continue
+                try:
+                    self._insert([entry], 1)
+                    consecutive_failures = 0
+                except Exception as row_error:
+                    failed.append((entry, row_error))
+                    consecutive_failures += 1
+            if failed:
+                self._spill(failed)
+        # Invalidate first: a reader released by _discard must not get a cached page from before the commit
+        invalidate_patient_history({entry['registry_id'] for entry in batch if entry['registry_id'] is not None})
+        self._discard(batch)
+
+    # Append rows that could not be committed to WRITE_SPILL_PATH, a CSV `importer.py` can load once
+    # the cause is fixed; if even that fails, the rows go to the log
+    def _spill(self, failed):
+        spill_path = WRITE_SPILL_PATH.format(path=self.path)
+        errors = sorted({str(e) for _, e in failed if e is not None})
+        try:
+            is_new = not os.path.exists(spill_path) or os.path.getsize(spill_path) == 0
+            with open(spill_path, 'a', newline='', encoding='utf-8') as spill:
+                writer = csv.writer(spill)
+                if is_new:
+                    writer.writerow(PATIENT_COLUMNS + ('created_at',))
+                writer.writerows(entry['row'] for entry, _ in failed)
+        except OSError:
+            logger.exception('Could not save %d rows for %s (%s) nor write them to %s: %r', len(failed), self.path,
+                             '; '.join(errors), spill_path, [entry['row'] for entry, _ in failed])
+        else:
+            logger.error('Could not save %d rows for %s (%s); they were written to %s', len(failed), self.path,
+                         '; '.join(errors), spill_path)
+
+    # Block until every row queued so far has been committed (or spilled)
+    def flush(self):
+        self._queue.join()
+
+
+_writers = {}
+
+
+def get_writer(path=None):
+    path = path or DB_PATH
+    writer = _writers.get(path)
+    if writer is None:
+        with _pools_lock:
+            writer = _writers.get(path)
+            if writer is None:
+                writer = WriteBehindQueue(path)
+                _writers[path] = writer
+    return writer
+
+
+# Registered after close_pools, so it runs first at exit: queued rows are committed before pools close
+@atexit.register
+def flush_writers():
+    for writer in list(_writers.values()):
+        writer.flush()
+
+
+def _insert_statement(columns):
+    return f"INSERT INTO patients ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+# Generated columns per database file, looked up once: files converted with `migrations.py --compact`
+# compute the derived metrics themselves, so inserts leave them out
+_generated = {}
+
+
+# Positions in `columns` that are stored (all of them, unless the file uses the compact layout)
+def _stored_positions(conn, path, columns):
+    generated = _generated.get(path)
+    if generated is None:
+        generated = _generated[path] = migrations.generated_columns(conn)
+    return [i for i, column in enumerate(columns) if column not in generated]
+
+
+# Insert rows into the table, dropping values for columns the table generates itself
+def _insert_rows(conn, path, columns, rows):
+    positions = _stored_positions(conn, path, columns)
+    if len(positions) == len(columns):
+        return conn.executemany(_insert_statement(columns), rows).rowcount
+    stored = itemgetter(*positions)
+    return conn.executemany(_insert_statement(stored(columns)), map(stored, rows)).rowcount
+
+
+# Function to insert patient data into the database
+def insert_patient_data(name, age, sex, weight, height, waist_hip_ratio, body_fat_percentage,
+                        bmi, bmr, lean_body_mass, body_fat_mass, muscle_mass,
+                        visceral_fat_level, body_water_percentage, bone_mineral_content, resting_metabolic_rate):
+    if name is None:
+        raise ValueError('A patient name is required')
+    row = (name, age, sex, weight, height, waist_hip_ratio, body_fat_percentage,
+           bmi, bmr, lean_body_mass, body_fat_mass, muscle_mass, visceral_fat_level,
+           body_water_percentage, bone_mineral_content, resting_metabolic_rate)
+    if WRITE_BEHIND:
+        get_writer().put(row)
+        return
+    pool = get_pool()
+    with pool.transaction() as conn:
+        registry_id = registry.resolve(conn, name)
+        _insert_rows(conn, pool.path, SCAN_COLUMNS, (row[1:] + (registry_id,),))
+        trends.update_trends(conn, (registry_id,))
+        cohorts.update_cohorts(conn)
+    invalidate_patient_history((registry_id,))
+
+
+# Insert many rows in a single transaction. `rows` may be any iterable of tuples matching `columns`
+# (PATIENT_COLUMNS, optionally followed by created_at); it is consumed lazily by executemany. Each
+# name is resolved to its registry id (registering new patients) when its first row is read, and the
+# rows are stored under the id. A row without a name raises ValueError and nothing is saved.
+def insert_patient_rows(rows, columns=PATIENT_COLUMNS):
+    registry_ids = {}
+    earliest = {}
+    name_index = columns.index('name')
+    created_at_index = columns.index('created_at') if 'created_at' in columns else None
+
+    def linked_rows(conn):
+        for row in rows:
+            name = row[name_index]
+            if name is None:
+                raise ValueError('Every row needs a patient name')
+            registry_id = registry_ids.get(name)
+            if registry_id is None:
+                registry_id = registry_ids[name] = registry.resolve(conn, name)
+            if created_at_index is not None and row[created_at_index] is not None:
+                created_at = str(row[created_at_index])
+                if registry_id not in earliest or created_at < earliest[registry_id]:
+                    earliest[registry_id] = created_at
+            yield tuple(row[:name_index]) + tuple(row[name_index + 1:]) + (registry_id,)
+
+    try:
+        pool = get_pool()
+        with pool.transaction() as conn:
+            scan_columns = columns[:name_index] + columns[name_index + 1:] + ('registry_id',)
+            count = _insert_rows(conn, pool.path, scan_columns, linked_rows(conn))
+            trends.update_trends(conn, registry_ids.values(), earliest)
+            cohorts.update_cohorts(conn)
+            return count
+    finally:
+        invalidate_patient_history(registry_ids.values())
+
+
+# Function to fetch patient data for the current user. With write-behind, rows still in the queue
+# are appended (patient_id and registry_id None until committed, name None as stored), so a session
+# always sees its own saves.
+def fetch_patient_data(name):
+    writer = _writers.get(DB_PATH)
+    pending = writer.pending(name) if writer is not None else []
+    with get_pool().connection() as conn:
+        cursor = conn.execute(f'SELECT * FROM patients WHERE {PATIENT_SCANS}', (registry.lookup(conn, name),))
+        rows = cursor.fetchall()
+    if not pending:
+        return rows
+    # Entries committed since the snapshot above already carry their id and may be among `rows`
+    table_columns = [column[0] for column in cursor.description]
+    id_index = table_columns.index('patient_id')
+    committed = {row[id_index] for row in rows}
+    for entry in pending:
+        if entry['patient_id'] not in committed:
+            values = dict(zip(PATIENT_COLUMNS + ('created_at',), entry['row']), patient_id=entry['patient_id'],
+                          name=None)
+            rows.append(tuple(values.get(column) for column in table_columns))
+    return rows
+
+
+# Patient history cache shared by all sessions: registry id -> {(before, limit): (rows, cursor)}.
+# Every write for a patient bumps that patient's version and drops its cached pages, so a cached
+# page is never older than the last insert. A fetch only stores its result if no write for the
+# patient happened while it ran.
+_history_cache = OrderedDict()
+_history_versions = {}
+_history_cache_lock = threading.Lock()
+_history_cache_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+# With write-behind, wait for the patient's queued rows to commit, so a read right after a save includes it
+def _await_writes(name):
+    writer = _writers.get(DB_PATH)
+    if writer is not None:
+        writer.wait_for(name)
+
+
+# Registry id of the patient registered under `name` (the label the pages pass around), once their
+# queued saves have committed; None if they have neither been saved nor registered
+def _registry_id(name):
+    _await_writes(name)
+    with get_pool().connection() as conn:
+        return registry.lookup(conn, name)
+
+
+# Number of writes seen for a patient; sessions compare it to decide whether their copy is stale.
+# Counts the patient's queued rows once they commit, so a session that just saved sees a new version.
+def history_version(name):
+    return _history_versions.get(_registry_id(name), 0)
+
+
+def invalidate_patient_history(registry_ids):
+    with _history_cache_lock:
+        for registry_id in registry_ids:
+            _history_versions[registry_id] = _history_versions.get(registry_id, 0) + 1
+            if _history_cache.pop(registry_id, None) is not None:
+                _history_cache_stats['invalidations'] += 1
+
+
+def history_cache_stats():
+    with _history_cache_lock:
+        return dict(_history_cache_stats, patients=len(_history_cache))
+
+
+def _query_patient_history(registry_id, before, limit):
+    query = f"SELECT {', '.join(HISTORY_COLUMNS)} FROM patients WHERE {PATIENT_SCANS}"
+    params = [registry_id]
+    if before is not None:
+        query += ' AND (created_at, patient_id) < (?, ?)'
+        params.extend(before)
+    query += ' ORDER BY created_at DESC, patient_id DESC LIMIT ?'
+    params.append(limit + 1)
+    with get_pool().connection() as conn:
+        rows = conn.execute(query, params).fetchall()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (rows[-1][1], rows[-1][0])
+
+
+# Fetch one page of a patient's history, newest first, using keyset pagination.
+# `before` is the (created_at, patient_id) of the last row of the previous page, or None for the
+# first page. Returns (rows, next_cursor); next_cursor is None once the history is exhausted.
+def fetch_patient_history(name, before=None, limit=HISTORY_PAGE_SIZE):
+    key = (tuple(before) if before is not None else None, limit)
+    registry_id = _registry_id(name)
+    if registry_id is None:
+        return [], None
+    with _history_cache_lock:
+        pages = _history_cache.get(registry_id)
+        if pages is not None and key in pages:
+            _history_cache.move_to_end(registry_id)
+            _history_cache_stats['hits'] += 1
+            return pages[key]
+        _history_cache_stats['misses'] += 1
+        version = _history_versions.get(registry_id, 0)
+    result = _query_patient_history(registry_id, before, limit)
+    with _history_cache_lock:
+        if _history_versions.get(registry_id, 0) == version:
+            _history_cache.setdefault(registry_id, {})[key] = result
+            _history_cache.move_to_end(registry_id)
+            while len(_history_cache) > HISTORY_CACHE_SIZE:
+                _history_cache.popitem(last=False)
+    return result
+
+
+# Latest values, deltas, rolling means and weekly change rates for a patient (see trends.read_trend)
+def fetch_patient_trend(name):
+    _await_writes(name)
+    with get_pool().connection() as conn:
+        registry_id = registry.lookup(conn, name)
+        return trends.read_trend(conn, registry_id) if registry_id is not None else None
+
+
+# Registered patients matching a name prefix, for autocomplete (see registry.search)
+def search_patients(query, limit=registry.SEARCH_LIMIT):
+    with get_pool().connection() as conn:
+        return registry.search(conn, query, limit)
+
+
+# Register a new patient; returns the name they are registered under (numbered if it was taken)
+def register_patient(name):
+    with get_pool().transaction() as conn:
+        return registry.register(conn, name)[1]
+
+
+# Percentile of each value ({patients column: value}) among scans of the same sex and age band
+# (see cohorts.read_percentiles)
+def fetch_cohort_percentiles(values, sex, age):
+    with get_pool().connection() as conn:
+        return cohorts.read_percentiles(conn, values, sex, age)
+
+
+# Raw progression points for a patient in time order, optionally limited to an inclusive created_at
+# range; served by the (registry_id, created_at) index
+def fetch_progression_series(name, start=None, end=None):
+    query = f'SELECT created_at, weight, body_fat_percentage, muscle_mass FROM patients WHERE {PATIENT_SCANS}'
+    params = [_registry_id(name)]
+    if start is not None:
+        query += ' AND created_at >= ?'
+        params.append(str(start))
+    if end is not None:
+        query += ' AND created_at <= ?'
+        params.append(str(end))
+    query += ' ORDER BY created_at, patient_id'
+    with get_pool().connection() as conn:
+        return conn.execute(query, params).fetchall()
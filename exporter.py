@@ -0,0 +1,127 @@
+import argparse
+import csv
+import io
+import os
+import tempfile
+
+import database
+import registry
+
+
+# Rows fetched from SQLite and written per chunk
+EXPORT_CHUNK_SIZE = 5000
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+EXPORT_COLUMNS = ('patient_id',) + database.PATIENT_COLUMNS + ('created_at',)
+
+# Exports larger than this spill from memory to a temporary file
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+# Yield the patients table as lists of row tuples, optionally filtered by patient name and by an
+# inclusive created_at range ('YYYY-MM-DD' dates or full timestamps). The name column is the patient's
+# registry label. A single cursor is read with fetchmany, so only one chunk is in memory; in WAL mode
+# the export sees a consistent snapshot without blocking writers.
+def iter_patient_chunks(name=None, start=None, end=None, chunksize=EXPORT_CHUNK_SIZE):
+    with database.get_pool().connection() as conn:
+        conditions, params = [], []
+        if name is not None:
+            conditions.append(f'p.{database.PATIENT_SCANS}')
+            params.append(registry.lookup(conn, name))
+        if start is not None:
+            conditions.append('p.created_at >= ?')
+            params.append(str(start))
+        if end is not None:
+            end = str(end)
+            if len(end) == 10:  # A bare date includes the whole day
+                conditions.append("p.created_at < date(?, '+1 day')")
+            else:
+                conditions.append('p.created_at <= ?')
+            params.append(end)
+        columns = ', '.join('r.name' if column == 'name' else f'p.{column}' for column in EXPORT_COLUMNS)
+        query = f'SELECT {columns} FROM patients p LEFT JOIN patient_registry r ON r.registry_id = p.registry_id'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY p.created_at, p.patient_id' if name is not None else ' ORDER BY p.patient_id'
+        cursor = conn.execute(query, params)
+        try:
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+
+# Yield the export as encoded CSV chunks (header first)
+def iter_csv_chunks(name=None, start=None, end=None, chunksize=EXPORT_CHUNK_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in iter_patient_chunks(name, start, end, chunksize):
+        writer.writerows(rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+# Measurements, age included, are float64: the importer and the INTEGER-affinity age column both
+# keep fractional ages, which an int64 column would truncate or reject depending on the pyarrow version
+def _parquet_schema():
+    import pyarrow as pa
+
+    types = {'patient_id': pa.int64(), 'name': pa.string(), 'sex': pa.string(), 'created_at': pa.string()}
+    return pa.schema([(column, types.get(column, pa.float64())) for column in EXPORT_COLUMNS])
+
+
+# Write the export to a binary file object. Each chunk becomes one Parquet row group.
+def write_export(out, file_format='csv', name=None, start=None, end=None, chunksize=EXPORT_CHUNK_SIZE):
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{file_format}', expected one of: {', '.join(EXPORT_FORMATS)}")
+    if file_format == 'csv':
+        for data in iter_csv_chunks(name, start, end, chunksize):
+            out.write(data)
+        return
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _parquet_schema()
+    with pq.ParquetWriter(out, schema) as writer:
+        for rows in iter_patient_chunks(name, start, end, chunksize):
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+
+
+# Build an export as bytes, for st.download_button's deferred `data` callable. Streamlit only
+# accepts bytes, str or plain io objects there and holds the whole payload in memory anyway; large
+# exports are still written to disk first, through the spooled file.
+def export_to_file(file_format='csv', name=None, start=None, end=None):
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as out:
+        write_export(out, file_format, name, start, end)
+        out.seek(0)
+        return out.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the patients table to CSV or Parquet')
+    parser.add_argument('output', help='output file; the format follows the extension (.csv or .parquet)')
+    parser.add_argument('--db', default=database.DB_PATH, help='patient database (default: %(default)s)')
+    parser.add_argument('--name', help='only export this patient')
+    parser.add_argument('--start', help='first scan date or timestamp to include')
+    parser.add_argument('--end', help='last scan date or timestamp to include')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, help='override format detection by extension')
+    parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    database.DB_PATH = args.db
+    with open(args.output, 'wb') as out:
+        write_export(out, file_format, args.name, args.start, args.end, args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
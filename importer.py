@@ -0,0 +1,96 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+
+import database
+from batch_calculations import INPUT_COLUMNS, calculate_body_composition_frame
+
+
+# Rows read, scored and committed per transaction
+IMPORT_CHUNK_SIZE = 5000
+
+IMPORT_FORMATS = ('csv', 'parquet')
+
+
+def _detect_format(source, file_format):
+    if file_format is None:
+        name = source if isinstance(source, str) else getattr(source, 'name', '')
+        file_format = os.path.splitext(name)[1].lstrip('.').lower()
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f"Unsupported import format '{file_format}', expected one of: {', '.join(IMPORT_FORMATS)}")
+    return file_format
+
+
+# Stream a device export as DataFrame chunks without reading the whole file into memory.
+# `source` is a path or a binary file object (e.g. a Streamlit upload).
+def iter_scan_chunks(source, chunksize=IMPORT_CHUNK_SIZE, file_format=None):
+    file_format = _detect_format(source, file_format)
+    if file_format == 'csv':
+        yield from pd.read_csv(source, chunksize=chunksize)
+    else:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+
+
+# Scan times in the 'YYYY-MM-DD HH:MM:SS' UTC form CURRENT_TIMESTAMP stores, so imported scans sort
+# with saved ones by string comparison. Accepts ISO 8601 text (with 'T' or an offset) and timestamp
+# columns; naive times are taken as UTC and missing ones get the import time.
+def _scan_times(values):
+    parsed = pd.to_datetime(values, utc=True, format='ISO8601', errors='coerce')
+    invalid = parsed.isna() & values.notna()
+    if invalid.any():
+        raise ValueError(f"Invalid created_at value: {values[invalid].iloc[0]!r}")
+    return parsed.fillna(pd.Timestamp.now(tz='UTC')).dt.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _chunk_rows(chunk, columns):
+    # .tolist() converts NumPy scalars to the Python types sqlite3 can bind; NaN becomes NULL
+    values = [chunk[column].astype(object).where(chunk[column].notna(), None).tolist() for column in columns]
+    return zip(*values)
+
+
+# Import a device export: derive the stored metrics in batch for each chunk and write the chunk
+# with executemany inside one transaction. A created_at column in the export is kept as the scan
+# time; otherwise rows get the import time. Returns row count, elapsed seconds and rows per second.
+def import_scans(source, chunksize=IMPORT_CHUNK_SIZE, file_format=None, progress=None):
+    start = time.perf_counter()
+    imported = 0
+    for chunk in iter_scan_chunks(source, chunksize, file_format):
+        missing = [column for column in ('name',) + tuple(INPUT_COLUMNS) if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"Import file is missing columns: {', '.join(missing)}")
+        unnamed = chunk['name'].isna().to_numpy()
+        if unnamed.any():
+            raise ValueError(f'Row {imported + int(unnamed.argmax()) + 1} has no patient name')
+        chunk = calculate_body_composition_frame(chunk)
+        columns = database.PATIENT_COLUMNS
+        if 'created_at' in chunk.columns:
+            chunk['created_at'] = _scan_times(chunk['created_at'])
+            columns += ('created_at',)
+        imported += database.insert_patient_rows(_chunk_rows(chunk, columns), columns)
+        if progress is not None:
+            progress(imported)
+    elapsed = time.perf_counter() - start
+    return {'rows': imported, 'seconds': elapsed, 'rows_per_second': imported / elapsed if elapsed else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import body-composition device exports (CSV or Parquet)')
+    parser.add_argument('files', nargs='+', help='export files to import')
+    parser.add_argument('--db', default=database.DB_PATH, help='patient database (default: %(default)s)')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    parser.add_argument('--format', choices=IMPORT_FORMATS, help='override format detection by extension')
+    args = parser.parse_args()
+
+    database.DB_PATH = args.db
+    for path in args.files:
+        result = import_scans(path, args.chunk_size, args.format)
+        print(f"{path}: {result['rows']} rows in {result['seconds']:.2f}s ({result['rows_per_second']:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from batch_calculations import calculate_calorie_intake_batch
+from meal_catalog import load_catalog, load_ingredient_index
+from meal_solver import plan_meals, MEAL_TYPES
+
+
+# Meals per day for each patient unless the caseload file says otherwise
+DEFAULT_MEAL_COUNTS = {"فطور": 1, "غداء": 1, "عشاء": 1, "وجبة خفيفة": 1}
+
+# Caseload columns holding per-patient meal counts
+MEAL_COUNT_COLUMNS = dict(zip(MEAL_TYPES, ('num_breakfast', 'num_lunch', 'num_dinner', 'num_snacks')))
+
+# A meal is not repeated within this many days, unless no plan fits otherwise
+DEFAULT_VARIETY_WINDOW = 3
+
+# Solver time budget per patient-day, in seconds
+DEFAULT_DAY_TIME_BUDGET = 0.5
+
+# Inputs calculate_calorie_intake needs when a caseload row has no explicit calorie window
+INTAKE_COLUMNS = ('weight', 'height', 'age', 'sex', 'activity', 'goal_weight', 'rate_of_change')
+
+# Worker pools by max_workers, created on first use and shared by every caller in the process. Workers
+# are spawned, not forked: the Streamlit server is multi-threaded, and a child forked while another
+# thread holds a lock (the catalog cache, a database pool, logging) would block on it forever.
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+# Turn a caseload DataFrame into per-patient planning targets. Rows either carry min_calories and
+# max_calories directly or the analyzer inputs, from which the window is computed in batch exactly
+# as calculate_calorie_intake does. Optional columns: min_fat, max_fat, protein, carbohydrates,
+# excluded_ingredients and the MEAL_COUNT_COLUMNS.
+def caseload_targets(df):
+    df = df.copy()
+    if 'min_calories' not in df.columns or 'max_calories' not in df.columns:
+        missing = [column for column in INTAKE_COLUMNS if column not in df.columns]
+        if missing:
+            raise ValueError(f"Caseload needs min_calories/max_calories or these columns: {', '.join(missing)}")
+        df['min_calories'], df['max_calories'] = calculate_calorie_intake_batch(*(df[column] for column in INTAKE_COLUMNS))
+    targets = []
+    for row in df.to_dict('records'):
+        def value(column, default=None):
+            item = row.get(column)
+            return default if item is None or (isinstance(item, float) and np.isnan(item)) else item
+
+        targets.append({
+            'patient': str(row['name']),
+            'min_calories': float(row['min_calories']),
+            'max_calories': float(row['max_calories']),
+            'min_fat': float(value('min_fat', 0)),
+            'max_fat': float(value('max_fat', float('inf'))),
+            'targets': {'protein': value('protein'), 'carbohydrates': value('carbohydrates')},
+            'excluded_ingredients': [term.strip() for term in str(value('excluded_ingredients', '')).split(',') if term.strip()],
+            'meal_counts': {meal_type: int(value(column, DEFAULT_MEAL_COUNTS[meal_type]))
+                            for meal_type, column in MEAL_COUNT_COLUMNS.items()},
+        })
+    return targets
+
+
+# Plan `days` consecutive days for one patient. Meals eaten in the previous `variety_window` days
+# are excluded; when that leaves no feasible plan the window is shrunk day by day down to zero.
+# Runs in a worker process, which loads (and caches) the catalog once.
+def plan_patient_days(target, days, variety_window=DEFAULT_VARIETY_WINDOW, time_budget=DEFAULT_DAY_TIME_BUDGET,
+                      seed=None, catalog_path=None):
+    df = load_catalog(catalog_path)
+    allowed = np.ones(len(df), dtype=bool)
+    if target['excluded_ingredients']:
+        allowed = load_ingredient_index(catalog_path).without(target['excluded_ingredients'])
+    rng = np.random.default_rng(seed)
+    names = df['وجبة'].tolist()
+    history = []
+    plan_days = []
+    for day in range(1, days + 1):
+        for window in range(min(variety_window, len(history)), -1, -1):
+            day_allowed = allowed.copy()
+            for positions in history[len(history) - window:] if window else []:
+                day_allowed[positions] = False
+            plan = plan_meals(df, target['meal_counts'], target['min_calories'], target['max_calories'],
+                              target['min_fat'], target['max_fat'], target['targets'], day_allowed,
+                              time_budget, int(rng.integers(2 ** 32)))
+            if plan['status'] in ('optimal', 'feasible'):
+                break
+        positions = [position for meal_positions in plan['meals'].values() for position in meal_positions]
+        history.append(positions)
+        plan_days.append({
+            'day': day,
+            'status': plan['status'],
+            'variety_window': window,
+            'meals': {meal_type: [names[position] for position in meal_positions]
+                      for meal_type, meal_positions in plan['meals'].items()},
+            'totals': {nutrient: round(float(total), 1) for nutrient, total in (plan['totals'] or {}).items()},
+            'shortfalls': plan['shortfalls'],
+        })
+    return {'patient': target['patient'], 'days': plan_days}
+
+
+def _executor(max_workers):
+    with _executors_lock:
+        if max_workers not in _executors:
+            _executors[max_workers] = ProcessPoolExecutor(max_workers=max_workers,
+                                                          mp_context=multiprocessing.get_context('spawn'))
+        return _executors[max_workers]
+
+
+# A pool whose worker died cannot take new tasks; the next caller gets a new one
+def _discard_executor(max_workers, executor):
+    with _executors_lock:
+        if _executors.get(max_workers) is executor:
+            del _executors[max_workers]
+    executor.shutdown(wait=False)
+
+
+# Plan a whole caseload across the shared process pool, yielding each patient's plan as soon as it
+# completes. Patients not started yet are cancelled if the caller stops early (e.g. a Streamlit rerun).
+def plan_caseload(targets, days=7, variety_window=DEFAULT_VARIETY_WINDOW, max_workers=None,
+                  time_budget=DEFAULT_DAY_TIME_BUDGET, seed=None, catalog_path=None):
+    seeds = np.random.SeedSequence(seed).spawn(len(targets))
+    executor = _executor(max_workers)
+    futures = []
+    try:
+        futures = [executor.submit(plan_patient_days, target, days, variety_window, time_budget,
+                                   int(patient_seed.generate_state(1)[0]), catalog_path)
+                   for target, patient_seed in zip(targets, seeds)]
+        for future in as_completed(futures):
+            yield future.result()
+    except BrokenProcessPool:
+        _discard_executor(max_workers, executor)
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate multi-day meal plans for a caseload of patients')
+    parser.add_argument('caseload', help='CSV with one row per patient (see caseload_targets for the columns)')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--variety-window', type=int, default=DEFAULT_VARIETY_WINDOW)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--time-budget', type=float, default=DEFAULT_DAY_TIME_BUDGET, help='seconds per patient-day')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--catalog', help='meal catalog database (default: the shipped catalog)')
+    args = parser.parse_args()
+
+    targets = caseload_targets(pd.read_csv(args.caseload))
+    # One JSON line per patient, printed as each plan completes
+    for result in plan_caseload(targets, args.days, args.variety_window, args.workers, args.time_budget, args.seed,
+                                 args.catalog):
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+
+
+if __name__ == '__main__':
+    main()
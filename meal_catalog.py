@@ -0,0 +1,132 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+
+import pandas as pd
+
+from meal_index import IngredientIndex, MealSearchIndex
+
+
+# Shipped catalog next to this module; point GEBODY_MEAL_CATALOG at an institutional recipe database
+CATALOG_PATH = os.environ.get('GEBODY_MEAL_CATALOG',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'meal_catalog.db'))
+
+# Bytes of the catalog file SQLite may memory-map while reading it, instead of copying pages through
+# read(). This only speeds up the read: the rows are still copied into the DataFrame.
+CATALOG_MMAP_SIZE = 256 * 1024 * 1024
+
+# (SQL column, DataFrame column used by the meal planner, SQL type)
+CATALOG_COLUMNS = (
+    ('name', 'وجبة', 'TEXT'),
+    ('ingredients', 'المكونات', 'TEXT'),
+    ('ingredient_weights', 'وزن المكونات (غرام)', 'TEXT'),
+    ('meal_type', 'نوع الوجبة', 'TEXT'),
+    ('calories', 'السعرات الحرارية', 'NUMERIC'),
+    ('fat', 'الدهون (غرام)', 'NUMERIC'),
+    ('carbohydrates', 'الكربوهيدرات (غرام)', 'NUMERIC'),
+    ('protein', 'البروتين (غرام)', 'NUMERIC'),
+    ('calcium', 'الكالسيوم (ملغ)', 'NUMERIC'),
+    ('vitamin_c', 'فيتامين C (ملغ)', 'NUMERIC'),
+    ('goal', 'النوع', 'TEXT'),
+)
+
+_cache = {'key': None, 'df': None, 'index': None, 'search': None}
+_cache_lock = threading.Lock()
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return path, stat.st_mtime_ns, stat.st_size
+
+
+def _read_catalog(path):
+    # Read-only URI connection. The whole table is read into pandas, so the catalog is held in memory
+    # by every process that plans meals.
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        conn.execute(f'PRAGMA mmap_size={CATALOG_MMAP_SIZE}')
+        df = pd.read_sql_query(f"SELECT {', '.join(column for column, _, _ in CATALOG_COLUMNS)} FROM meals ORDER BY meal_id", conn)
+    finally:
+        conn.close()
+    return df.rename(columns={column: label for column, label, _ in CATALOG_COLUMNS})
+
+
+# The meal catalog as a DataFrame with the planner's Arabic column names.
+# Loaded fully into memory on first use, shared by every session of the process, and reloaded when the file changes
+# (checked with one stat() per call), so nothing is read at import time or on pages that never plan.
+def load_catalog(path=None):
+    path = path or CATALOG_PATH
+    key = _file_key(path)
+    with _cache_lock:
+        if _cache['key'] != key:
+            _cache.update(key=key, df=_read_catalog(path), index=None, search=None)
+        return _cache['df']
+
+
+# An index over the loaded catalog kept in _cache[slot], built on first use and rebuilt after a reload
+def _load_index(slot, build, path):
+    df = load_catalog(path)
+    with _cache_lock:
+        if _cache['df'] is not df:  # Reloaded by another session in the meantime
+            return build(df)
+        if _cache[slot] is None:
+            _cache[slot] = build(df)
+        return _cache[slot]
+
+
+# Ingredient index over the loaded catalog, for excluding meals
+def load_ingredient_index(path=None):
+    return _load_index('index', lambda df: IngredientIndex(df['المكونات']), path)
+
+
+# Full-text search index over the loaded catalog's meal names and ingredients
+def load_search_index(path=None):
+    return _load_index('search', lambda df: MealSearchIndex(df['وجبة'], df['المكونات']), path)
+
+
+# Build a catalog database from a DataFrame with the planner's column names. The file is written
+# next to the target and swapped in with os.replace, so running apps pick it up atomically.
+def write_catalog(df, path=None):
+    path = path or CATALOG_PATH
+    missing = [label for _, label, _ in CATALOG_COLUMNS if label not in df.columns]
+    if missing:
+        raise ValueError(f"Catalog is missing columns: {', '.join(missing)}")
+    fd, tmp_path = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(path)))
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        columns = ', '.join(f'{column} {sql_type}' for column, _, sql_type in CATALOG_COLUMNS)
+        conn.execute(f'CREATE TABLE meals (meal_id INTEGER PRIMARY KEY, {columns})')
+        conn.execute('CREATE INDEX idx_meals_type_calories ON meals (meal_type, calories)')
+        selected = df[[label for _, label, _ in CATALOG_COLUMNS]]
+        rows = selected.astype(object).where(selected.notna(), None)
+        conn.executemany(f"INSERT INTO meals ({', '.join(column for column, _, _ in CATALOG_COLUMNS)}) "
+                         f"VALUES ({', '.join('?' * len(CATALOG_COLUMNS))})", rows.itertuples(index=False, name=None))
+        conn.commit()
+        conn.execute('VACUUM')
+        conn.close()
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the meal catalog from a CSV or JSON recipe export')
+    parser.add_argument('source', help='CSV or JSON (list of records) with the meal planner column names')
+    parser.add_argument('--catalog', default=CATALOG_PATH, help='catalog database to write (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.source.lower().endswith('.json'):
+        df = pd.read_json(args.source)
+    else:
+        df = pd.read_csv(args.source)
+    write_catalog(df, args.catalog)
+    print(f'{args.catalog}: {len(df)} meals')
+
+
+if __name__ == '__main__':
+    main()
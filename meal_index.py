@@ -0,0 +1,233 @@
+import re
+from bisect import bisect_left
+from functools import lru_cache
+
+import numpy as np
+
+from text_search import search_key
+
+
+# Arabic letter variants written one way: taa marbuta as haa, alef maqsura and Persian yeh as yaa,
+# alef wasla as alef, Persian kaf as kaf; tatweel (the elongation stroke) dropped. Hamza and madda
+# forms (أ إ آ ؤ ئ) and diacritics are already reduced to their base letters by search_key.
+_LETTER_FOLDS = str.maketrans({'ة': 'ه', 'ى': 'ي', 'ی': 'ي', 'ٱ': 'ا', 'ک': 'ك', 'ـ': None})
+
+# Definite article, alone or after و ف ب, dropped from the start of a word of at least three more letters
+_ARTICLE = re.compile(r'^(?:[وف]?ب?ال|لل)(?=\w{3})')
+
+# Ranking weight of a query word found in a meal: as a whole word, as the start of a longer word,
+# and within a few edits (divided by the number of edits). Words in the meal name count NAME_WEIGHT times.
+EXACT_WEIGHT = 1.0
+PREFIX_WEIGHT = 0.6
+TYPO_WEIGHT = 0.4
+NAME_WEIGHT = 2.0
+
+# Shortest query word matched as a prefix, and with one edit (two edits from TWO_TYPO_LENGTH letters)
+MIN_PREFIX_LENGTH = 2
+MIN_TYPO_LENGTH = 4
+TWO_TYPO_LENGTH = 8
+
+# Most meals returned by a search
+SEARCH_LIMIT = 20
+
+# Sorts after every character a search term can contain, closing a prefix range
+_PREFIX_END = '\U0010ffff'
+
+# Distinct words whose normalized form is kept for reuse
+WORD_CACHE_SIZE = 1 << 16
+
+
+# Normalized form of one whitespace-separated word (several words if it contains punctuation).
+# Cached: a catalog repeats a small vocabulary across its meals, and normalizing is the bulk of
+# building an index.
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def _normalize_word(word):
+    return ' '.join(search_key(word).translate(_LETTER_FOLDS).split())
+
+
+# Normalize an ingredient or search term for lookup: case, accents, Arabic diacritics and hamza
+# marks, punctuation and brackets as in text_search.search_key, then Arabic letter variants folded
+def normalize_ingredient(text):
+    return ' '.join(filter(None, map(_normalize_word, str(text).split())))
+
+
+# Split a comma-separated المكونات value into normalized ingredient names
+def split_ingredients(text):
+    return [ingredient for ingredient in (normalize_ingredient(part) for part in str(text).split(',')) if ingredient]
+
+
+# The word with a leading definite article removed (الأرز -> ارز), or the word itself
+def _strip_article(word):
+    return _ARTICLE.sub('', word)
+
+
+# Key an ingredient is indexed and excluded by: normalize_ingredient with each word's definite
+# article removed, as search does, so excluding الدجاج drops the meals with دجاج and the other way round
+def _ingredient_key(text):
+    return ' '.join(map(_strip_article, normalize_ingredient(text).split()))
+
+
+# Inverted index from ingredient to the sorted row positions of the meals that contain it.
+# Each ingredient is indexed under its full key and under each of its words, so excluding "فول"
+# also drops meals with "فول مدمس", while "ملح" no longer matches "سمك مملح" the way substring
+# search did. Exclusions become a union of posting lists instead of one full scan per term.
+class IngredientIndex:
+    def __init__(self, ingredients_column):
+        postings = {}
+        size = 0
+        for row, text in enumerate(ingredients_column):
+            for ingredient in map(_ingredient_key, split_ingredients(text)):
+                for key in {ingredient, *ingredient.split()}:
+                    postings.setdefault(key, []).append(row)
+            size = row + 1
+        self.size = size
+        self._postings = {key: np.array(rows, dtype=np.int64) for key, rows in postings.items()}
+
+    def __contains__(self, term):
+        return _ingredient_key(term) in self._postings
+
+    # Sorted row positions of the meals containing any of the terms
+    def containing(self, terms):
+        found = [self._postings[key] for key in map(_ingredient_key, terms) if key in self._postings]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    # Boolean mask (aligned with the indexed rows) of the meals containing none of the terms
+    def without(self, terms):
+        mask = np.ones(self.size, dtype=bool)
+        mask[self.containing(terms)] = False
+        return mask
+
+
+# Search terms of one whitespace-separated word: its normalized words and their forms without the article
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def _word_terms(word):
+    words = _normalize_word(word).split()
+    return frozenset((*words, *map(_strip_article, words)))
+
+
+# Words a name or ingredient list is found by
+def _search_terms(text):
+    return set().union(*map(_word_terms, str(text).split()))
+
+
+# Padded character bigrams of a word, compared to find the vocabulary words a typo could stand for
+def _bigrams(word):
+    padded = f' {word} '
+    return {padded[i:i + 2] for i in range(len(padded) - 1)}
+
+
+# Edit distance (insertions, deletions, substitutions and adjacent transpositions) between two
+# words, or limit + 1 as soon as it is known to exceed limit
+def _edit_distance(a, b, limit):
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+# Ranked full-text search over meal names and ingredients. Both are indexed by their normalized
+# words (normalize_ingredient, so أرز, ارز and الأرز or ملوخية and ملوخيه are the same word), with
+# the posting lists of the sorted vocabulary stored back to back per field, so all the words
+# starting with a prefix share one contiguous slice. Query words are also matched with up to one or
+# two typos through a bigram index of the vocabulary. A meal matches when each query word is found
+# in its name or ingredients; exact words rank above prefixes and prefixes above typos, so a query
+# for ملوخية lists the ملوخية meals before ملوكية.
+class MealSearchIndex:
+    def __init__(self, names, ingredients_column):
+        vocabulary = {}
+        fields = []
+        for column in (names, ingredients_column):
+            term_ids, rows = [], []
+            for row, text in enumerate(column):
+                for term in _search_terms(text):
+                    term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                    rows.append(row)
+            fields.append((term_ids, rows))
+        self.size = len(names)
+        self._terms = sorted(vocabulary)
+        rank = np.empty(len(vocabulary), dtype=np.int64)
+        rank[[vocabulary[term] for term in self._terms]] = np.arange(len(self._terms))
+        self._fields = []
+        for (term_ids, rows), weight in zip(fields, (NAME_WEIGHT, 1.0)):
+            term_ids = rank[np.array(term_ids, dtype=np.int64)]
+            order = np.argsort(term_ids, kind='stable')
+            offsets = np.zeros(len(self._terms) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(self._terms)))
+            self._fields.append((np.array(rows, dtype=np.int64)[order], offsets, weight))
+        self._lengths = np.array([len(term) for term in self._terms], dtype=np.int64)
+        grams = {}
+        for term_id, term in enumerate(self._terms):
+            if len(term) >= MIN_TYPO_LENGTH - 1 and not term.isdigit():
+                for gram in _bigrams(term):
+                    grams.setdefault(gram, []).append(term_id)
+        self._grams = {gram: np.array(term_ids, dtype=np.int64) for gram, term_ids in grams.items()}
+
+    # (first term id, end term id, weight) ranges of the vocabulary matching one query word
+    def _matches(self, word):
+        start = end = bisect_left(self._terms, word)
+        ranges = []
+        if start < len(self._terms) and self._terms[start] == word:
+            ranges.append((start, start + 1, EXACT_WEIGHT))
+            end = start + 1
+        if len(word) >= MIN_PREFIX_LENGTH:
+            prefix_end = bisect_left(self._terms, word + _PREFIX_END, end)
+            if prefix_end > end:
+                ranges.append((end, prefix_end, PREFIX_WEIGHT))
+            end = prefix_end
+        if len(word) >= MIN_TYPO_LENGTH and not word.isdigit():
+            limit = 2 if len(word) >= TWO_TYPO_LENGTH else 1
+            grams = _bigrams(word)
+            found = [self._grams[gram] for gram in grams if gram in self._grams]
+            if found:
+                # An edit changes at most three bigrams of a word (two, or three for a transposition)
+                shared = np.bincount(np.concatenate(found), minlength=len(self._terms))
+                candidates = np.flatnonzero((shared >= len(grams) - 3 * limit)
+                                            & (np.abs(self._lengths - len(word)) <= limit))
+                for term_id in candidates.tolist():
+                    if start <= term_id < end:
+                        continue
+                    distance = _edit_distance(word, self._terms[term_id], limit)
+                    if distance <= limit:
+                        ranges.append((term_id, term_id + 1, TYPO_WEIGHT / distance))
+        return ranges
+
+    # Row positions of the best `limit` meals for `query` and their scores, best first, ties in
+    # catalog order. Each query word scores a meal by its best match in the name (times NAME_WEIGHT)
+    # plus its best match in the ingredients, and a meal's score is the sum over the query words.
+    def search(self, query, limit=SEARCH_LIMIT):
+        words = normalize_ingredient(query).split()
+        if not words:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        total = np.zeros(self.size)
+        matched = np.ones(self.size, dtype=bool)
+        for word in words:
+            ranges = self._matches(word)
+            if _strip_article(word) != word:
+                ranges += self._matches(_strip_article(word))
+            scores = np.zeros(self.size)
+            for rows, offsets, weight in self._fields:
+                best = np.zeros(self.size)
+                for first, end, word_weight in ranges:
+                    hits = rows[offsets[first]:offsets[end]]
+                    best[hits] = np.maximum(best[hits], word_weight)
+                scores += weight * best
+            total += scores
+            matched &= scores > 0
+        candidates = np.flatnonzero(matched)
+        if len(candidates) > limit:
+            # Keep the top `limit` without sorting every match: those above the limit-th best
+            # score, then the earliest of those tied with it
+            ranked = total[candidates]
+            threshold = np.partition(ranked, len(ranked) - limit)[len(ranked) - limit]
+            above = candidates[ranked > threshold]
+            candidates = np.concatenate([above, candidates[ranked == threshold][:limit - len(above)]])
+        rows = candidates[np.lexsort((candidates, -total[candidates]))]
+        return rows, total[rows]
@@ -0,0 +1,175 @@
+import math
+import time
+
+import numpy as np
+
+
+MEAL_TYPES = ("فطور", "غداء", "عشاء", "وجبة خفيفة")
+
+# Nutrients the solver works with, mapped to catalog columns
+NUTRIENT_COLUMNS = {
+    'calories': 'السعرات الحرارية',
+    'fat': 'الدهون (غرام)',
+    'protein': 'البروتين (غرام)',
+    'carbohydrates': 'الكربوهيدرات (غرام)',
+}
+NUTRIENTS = tuple(NUTRIENT_COLUMNS)
+
+# Seconds a single solve may search before returning the best plan found so far
+DEFAULT_TIME_BUDGET = 1.0
+
+# Candidate meals tried between clock checks
+_CLOCK_INTERVAL = 4096
+
+
+class _Timeout(Exception):
+    pass
+
+
+def _distance(target, low, high):
+    # How far target lies outside [low, high], relative to the target
+    if target < low:
+        return (low - target) / target
+    if target > high:
+        return (target - high) / target
+    return 0.0
+
+
+# Pick meals_counts[meal_type] distinct meals of each type so that the day's total calories fall in
+# [min_calories, max_calories] and total fat in [min_fat, max_fat], minimizing the summed relative
+# deviation from the optional gram targets ({'protein': .., 'carbohydrates': .., 'fat': ..}).
+#
+# Depth-first branch and bound: meals are tried best-fitting first, and a branch is cut as soon as
+# the cheapest or richest completion (sums of the k smallest / largest values left per type) cannot
+# reach the calorie or fat window, or cannot beat the best plan's score. If the search finishes, the
+# plan is optimal, or no plan exists; if time_budget runs out, the best plan so far is returned.
+#
+# Returns a dict with status ('optimal', 'feasible' = best within budget, 'infeasible' = proven
+# impossible, 'unknown' = no plan found within budget), meals ({meal_type: [row positions in df]}),
+# totals, score, shortfalls ({meal_type: meals missing from the catalog}) and candidates tried (nodes).
+def plan_meals(df, meal_counts, min_calories, max_calories, min_fat=0, max_fat=math.inf, targets=None,
+               allowed=None, time_budget=DEFAULT_TIME_BUDGET, seed=None):
+    targets = {nutrient: value for nutrient, value in (targets or {}).items() if value}
+    rng = np.random.default_rng(seed)
+    windows = {'calories': (min_calories, max_calories), 'fat': (min_fat, max_fat)}
+    values = np.array([df[column].to_numpy(dtype=float) for column in NUTRIENT_COLUMNS.values()])
+    meal_type_values = df['نوع الوجبة'].to_numpy()
+    if allowed is None:
+        allowed = np.ones(len(df), dtype=bool)
+
+    types, counts, candidates, candidate_arrays, shortfalls = [], [], [], [], {}
+    total_slots = sum(meal_counts.values()) or 1
+    for meal_type, count in meal_counts.items():
+        positions = np.flatnonzero(allowed & (meal_type_values == meal_type))
+        if count > len(positions):
+            shortfalls[meal_type] = count - len(positions)
+            count = len(positions)
+        if count <= 0:
+            continue
+        # Best-fitting meals first: closest to an even share of each target per meal. Shuffling first
+        # breaks ties randomly, so equally good plans vary between runs like the old random sample.
+        positions = rng.permutation(positions)
+        fit = np.zeros(len(positions))
+        for nutrient, target in targets.items():
+            fit += np.abs(values[NUTRIENTS.index(nutrient)][positions] - target / total_slots) / target
+        positions = positions[np.argsort(fit, kind='stable')]
+        types.append(meal_type)
+        counts.append(count)
+        # Column view of each type's candidates, used to settle the last pick in one vectorized step
+        candidate_arrays.append(values[:, positions])
+        candidates.append(list(zip(positions.tolist(), *candidate_arrays[-1].tolist())))
+
+    # min_sums[t][n][k] / max_sums[t][n][k]: smallest / largest total of nutrient n over k meals of type t
+    min_sums, max_sums = [], []
+    for arrays, count in zip(candidate_arrays, counts):
+        ordered = np.sort(arrays, axis=1)
+        min_sums.append([[0.0] + np.cumsum(row[:count]).tolist() for row in ordered])
+        max_sums.append([[0.0] + np.cumsum(row[::-1][:count]).tolist() for row in ordered])
+    # suffix_min[t][n] / suffix_max[t][n]: bounds contributed by every type after t
+    suffix_min = [[0.0] * len(NUTRIENTS) for _ in range(len(types) + 1)]
+    suffix_max = [[0.0] * len(NUTRIENTS) for _ in range(len(types) + 1)]
+    for t in range(len(types) - 1, -1, -1):
+        for n in range(len(NUTRIENTS)):
+            suffix_min[t][n] = suffix_min[t + 1][n] + min_sums[t][n][counts[t]]
+            suffix_max[t][n] = suffix_max[t + 1][n] + max_sums[t][n][counts[t]]
+
+    checks = [(NUTRIENTS.index(nutrient), low, high) for nutrient, (low, high) in windows.items()]
+    objective = [(NUTRIENTS.index(nutrient), target) for nutrient, target in targets.items() if nutrient in NUTRIENTS]
+    best = {'score': math.inf, 'picks': None, 'totals': None}
+    state = {'nodes': 0, 'next_check': _CLOCK_INTERVAL, 'deadline': time.perf_counter() + time_budget}
+    picks = []
+
+    def search(t, start, left, totals):
+        if t == len(types):
+            score = sum(abs(totals[n] - target) / target for n, target in objective)
+            if score < best['score']:
+                best.update(score=score, picks=list(picks), totals=list(totals))
+            return
+        if left == 0:
+            search(t + 1, 0, counts[t + 1] if t + 1 < len(types) else 0, totals)
+            return
+        type_candidates = candidates[t]
+        if t == len(types) - 1 and left == 1:
+            # Last pick: score every remaining candidate at once and keep the best feasible one
+            state['nodes'] += len(type_candidates) - start
+            if state['nodes'] >= state['next_check']:
+                state['next_check'] = state['nodes'] + _CLOCK_INTERVAL
+                if time.perf_counter() > state['deadline']:
+                    raise _Timeout
+            final = np.asarray(totals)[:, None] + candidate_arrays[t][:, start:]
+            feasible = np.ones(final.shape[1], dtype=bool)
+            for n, low, high in checks:
+                feasible &= (final[n] >= low) & (final[n] <= high)
+            if not feasible.any():
+                return
+            scores = np.zeros(final.shape[1])
+            for n, target in objective:
+                scores += np.abs(final[n] - target) / target
+            index = int(np.argmin(np.where(feasible, scores, np.inf)))
+            if scores[index] < best['score']:
+                best.update(score=float(scores[index]), picks=picks + [(t, type_candidates[start + index][0])],
+                            totals=final[:, index].tolist())
+            return
+        # Bounds on what the meals still to be picked after this one can add
+        low_rest = [min_sums[t][n][left - 1] + suffix_min[t + 1][n] for n in range(len(NUTRIENTS))]
+        high_rest = [max_sums[t][n][left - 1] + suffix_max[t + 1][n] for n in range(len(NUTRIENTS))]
+        for index in range(start, len(type_candidates) - left + 1):
+            state['nodes'] += 1
+            if state['nodes'] >= state['next_check']:
+                state['next_check'] = state['nodes'] + _CLOCK_INTERVAL
+                if time.perf_counter() > state['deadline']:
+                    raise _Timeout
+            candidate = type_candidates[index]
+            new_totals = [total + value for total, value in zip(totals, candidate[1:])]
+            if any(new_totals[n] + low_rest[n] > high or new_totals[n] + high_rest[n] < low for n, low, high in checks):
+                continue
+            bound = sum(_distance(target, new_totals[n] + low_rest[n], new_totals[n] + high_rest[n])
+                        for n, target in objective)
+            if bound >= best['score']:
+                continue
+            picks.append((t, candidate[0]))
+            search(t, index + 1, left - 1, new_totals)
+            picks.pop()
+            if best['score'] == 0:
+                return
+
+    status = None
+    if any(suffix_min[0][n] > high or suffix_max[0][n] < low for n, low, high in checks):
+        status = 'infeasible'  # Even the most extreme selections miss a window
+    elif types:
+        try:
+            search(0, 0, counts[0], [0.0] * len(NUTRIENTS))
+        except _Timeout:
+            status = 'feasible' if best['picks'] is not None else 'unknown'
+    else:
+        search(0, 0, 0, [0.0] * len(NUTRIENTS))
+    if status is None:
+        status = 'optimal' if best['picks'] is not None else 'infeasible'
+
+    meals = {meal_type: [] for meal_type in types}
+    for t, position in best['picks'] or []:
+        meals[types[t]].append(position)
+    totals = dict(zip(NUTRIENTS, best['totals'])) if best['totals'] is not None else None
+    return {'status': status, 'meals': meals, 'totals': totals,
+            'score': best['score'] if best['picks'] is not None else None,
+            'shortfalls': shortfalls, 'nodes': state['nodes']}
@@ -0,0 +1,168 @@
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the span histogram buckets, the Prometheus client defaults plus 1 ms
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+# Most recent durations kept per span for the rolling percentiles
+ROLLING_WINDOW = 1024
+
+# Optional exports: a Prometheus text file (e.g. for node_exporter's textfile collector), rewritten at
+# most every GEBODY_METRICS_INTERVAL seconds, and/or a /metrics endpoint on GEBODY_METRICS_PORT
+METRICS_FILE = os.environ.get('GEBODY_METRICS_FILE')
+METRICS_PORT = os.environ.get('GEBODY_METRICS_PORT')
+METRICS_INTERVAL = float(os.environ.get('GEBODY_METRICS_INTERVAL', '15'))
+
+# Span name -> {'buckets': per-bucket counts (last one is +Inf), 'sum', 'count', 'last', 'recent'}.
+# Module level, so every session and rerun of the process records into the same series.
+_series = {}
+_lock = threading.Lock()
+_last_export = 0.0
+_server = None
+
+
+def _new_series():
+    return {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0, 'last': None,
+            'recent': deque(maxlen=ROLLING_WINDOW)}
+
+
+def observe(name, seconds):
+    with _lock:
+        series = _series.get(name)
+        if series is None:
+            series = _series[name] = _new_series()
+        series['buckets'][bisect_left(BUCKETS, seconds)] += 1
+        series['sum'] += seconds
+        series['count'] += 1
+        series['last'] = seconds
+        series['recent'].append(seconds)
+
+
+# Time the enclosed block and record it under `name`, also when the block raises (or st.stop()s)
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+# Time a rerun under `name` and then export(). Wraps the page's main() for full reruns, and decorates each
+# st.fragment function (beneath @st.fragment): a fragment rerun runs only that function, so without it
+# those reruns would be neither timed nor exported.
+@contextmanager
+def rerun(name):
+    try:
+        with span(name):
+            yield
+    finally:
+        export()
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# Per-span summary: totals since start plus percentiles over the last ROLLING_WINDOW durations (seconds)
+def snapshot():
+    with _lock:
+        copies = [(name, series['count'], series['sum'], series['last'], sorted(series['recent']))
+                  for name, series in _series.items()]
+    return [{'span': name, 'count': count, 'mean': total / count, 'last': last,
+             'p50': _percentile(recent, 0.5), 'p95': _percentile(recent, 0.95), 'p99': _percentile(recent, 0.99),
+             'max': recent[-1]}
+            for name, count, total, last, recent in sorted(copies)]
+
+
+def reset():
+    with _lock:
+        _series.clear()
+
+
+# All spans as a Prometheus histogram plus a summary of the rolling window, in the text exposition format
+def prometheus_text():
+    with _lock:
+        copies = [(name, list(series['buckets']), series['sum'], series['count'], sorted(series['recent']))
+                  for name, series in sorted(_series.items())]
+    lines = ['# HELP gebody_span_seconds Duration of instrumented page sections.',
+             '# TYPE gebody_span_seconds histogram']
+    for name, buckets, total, count, _ in copies:
+        cumulative = 0
+        for bound, bucket_count in zip(BUCKETS + (float('inf'),), buckets):
+            cumulative += bucket_count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'gebody_span_seconds_bucket{{span="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'gebody_span_seconds_sum{{span="{name}"}} {total!r}')
+        lines.append(f'gebody_span_seconds_count{{span="{name}"}} {count}')
+    lines += [f'# HELP gebody_span_recent_seconds Duration percentiles over the last {ROLLING_WINDOW} runs of each span.',
+              '# TYPE gebody_span_recent_seconds summary']
+    for name, _, _, _, recent in copies:
+        for quantile in (0.5, 0.95, 0.99):
+            lines.append(f'gebody_span_recent_seconds{{span="{name}",quantile="{quantile}"}} '
+                         f'{_percentile(recent, quantile)!r}')
+        lines.append(f'gebody_span_recent_seconds_sum{{span="{name}"}} {sum(recent)!r}')
+        lines.append(f'gebody_span_recent_seconds_count{{span="{name}"}} {len(recent)}')
+    return '\n'.join(lines) + '\n'
+
+
+# Write the exposition atomically, so a scraper never reads a half-written file
+def write_prometheus(path):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(temporary, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve /metrics from a daemon thread; started at most once per process
+def serve(port, host='127.0.0.1'):
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='metrics-http', daemon=True).start()
+    return _server
+
+
+# Called at the end of every rerun and fragment rerun (see rerun): starts the endpoint and refreshes the
+# metrics file if configured. Failures are logged, never raised, so metrics cannot take the page down
+# or mask the rerun's own exception; an unwritable file is retried every METRICS_INTERVAL.
+def export():
+    global _last_export, METRICS_PORT
+    if METRICS_PORT and _server is None:
+        try:
+            serve(METRICS_PORT)
+        except OSError as e:  # Port taken (e.g. by another app process); keep the page working
+            logger.warning('Cannot serve metrics on port %s: %s', METRICS_PORT, e)
+            METRICS_PORT = None
+    if METRICS_FILE and time.monotonic() - _last_export >= METRICS_INTERVAL:
+        _last_export = time.monotonic()
+        try:
+            write_prometheus(METRICS_FILE)
+        except OSError as e:
+            logger.warning('Cannot write metrics to %s: %s', METRICS_FILE, e)
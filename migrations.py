@@ -0,0 +1,414 @@
+import argparse
+import json
+import math
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+
+from core import (calculate_bmi, calculate_bmr, calculate_lean_body_mass, calculate_body_fat_mass,
+                  calculate_muscle_mass, calculate_visceral_fat_level, calculate_body_water_percentage,
+                  calculate_bone_mineral_content, calculate_rmr)
+
+
+class DatabaseCorruptError(sqlite3.DatabaseError):
+    pass
+
+
+# Columns of the patients table as step 1 creates them. Frozen: a later column is added by its own
+# step with ALTER TABLE ... ADD COLUMN, which only rewrites the schema, not the rows.
+_PATIENTS_V1_COLUMNS = (
+    ('patient_id', 'INTEGER PRIMARY KEY'),
+    ('name', 'TEXT'),
+    ('age', 'INTEGER'),
+    ('sex', 'TEXT'),
+    ('weight', 'REAL'),
+    ('height', 'REAL'),
+    ('waist_hip_ratio', 'REAL'),
+    ('body_fat_percentage', 'REAL'),
+    ('bmi', 'REAL'),
+    ('bmr', 'REAL'),
+    ('lean_body_mass', 'REAL'),
+    ('body_fat_mass', 'REAL'),
+    ('muscle_mass', 'REAL'),
+    ('visceral_fat_level', 'REAL'),
+    ('body_water_percentage', 'REAL'),
+    ('bone_mineral_content', 'REAL'),
+    ('resting_metabolic_rate', 'REAL'),
+    ('created_at', 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP'),
+)
+
+# Columns of the patients table in their current form (compact_patients rebuilds it from these):
+# step 1's plus those added by later steps, in the order they were added
+PATIENT_TABLE_COLUMNS = _PATIENTS_V1_COLUMNS + (
+    ('registry_id', 'INTEGER REFERENCES patient_registry (registry_id)'),
+)
+
+# Derived columns the legacy patient_data.db schema lacks, filled from the raw measurements
+_DERIVED_COLUMNS = ('bmi', 'bmr', 'lean_body_mass', 'body_fat_mass', 'muscle_mass', 'visceral_fat_level',
+                    'body_water_percentage', 'bone_mineral_content', 'resting_metabolic_rate')
+
+# The core.py formulas in SQL, operation for operation, so SQLite's doubles match the Python values
+# bit for bit. The compact layout (see compact_patients) computes the derived columns from these.
+_MALE = "sex = 'Male'"
+DERIVED_EXPRESSIONS = {
+    'bmi': 'weight / ((height / 100) * (height / 100))',
+    'bmr': f'CASE WHEN {_MALE} THEN 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age) '
+           f'ELSE 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age) END',
+    'lean_body_mass': 'weight * (1 - body_fat_percentage / 100)',
+    'body_fat_mass': 'weight * (body_fat_percentage / 100)',
+    'muscle_mass': 'weight * (1 - body_fat_percentage / 100) * 0.85',
+    'visceral_fat_level': f'CASE WHEN {_MALE} THEN 10 * waist_hip_ratio - 5 ELSE 10 * waist_hip_ratio - 6 END',
+    'body_water_percentage': f'CASE WHEN {_MALE} THEN 60 + 0.1 * (weight * (1 - body_fat_percentage / 100) - 50) '
+                             f'ELSE 50 + 0.1 * (weight * (1 - body_fat_percentage / 100) - 45) END',
+    'bone_mineral_content': 'weight * 0.03',
+    'resting_metabolic_rate': f'CASE WHEN {_MALE} THEN 88.362 + (13.397 * weight) + (4.799 * height) - (5.677 * age) '
+                              f'ELSE 447.593 + (9.247 * weight) + (3.098 * height) - (4.330 * age) END',
+}
+
+
+# Column names including generated ones (PRAGMA table_info leaves those out)
+def _table_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_xinfo({table})')]
+
+
+# Columns of the patients table computed by SQLite; empty unless the file uses the compact layout
+def generated_columns(conn):
+    return {row[1] for row in conn.execute('PRAGMA table_xinfo(patients)') if row[6] in (2, 3)}
+
+
+# 1: the patients table. Databases from the first releases (patient_data.db) only have the raw
+# measurement columns; the derived ones are added in place.
+def _create_patients(conn):
+    columns = ',\n'.join(f'{name} {sql_type}' for name, sql_type in _PATIENTS_V1_COLUMNS)
+    conn.execute(f'CREATE TABLE IF NOT EXISTS patients ({columns})')
+    existing = set(_table_columns(conn, 'patients'))
+    for name, sql_type in _PATIENTS_V1_COLUMNS:
+        if name not in existing:
+            conn.execute(f'ALTER TABLE patients ADD COLUMN {name} {sql_type}')
+
+
+# 2: compute the derived metrics of rows saved without them, with the same formulas the analyzer uses.
+# The first releases stored height in meters; those rows are converted to centimeters first.
+def _backfill_derived_metrics(conn):
+    conn.execute('UPDATE patients SET height = height * 100 WHERE bmi IS NULL AND height > 0 AND height < 3')
+    rows = conn.execute('''SELECT patient_id, age, sex, weight, height, waist_hip_ratio, body_fat_percentage
+                           FROM patients
+                           WHERE bmi IS NULL AND age IS NOT NULL AND weight IS NOT NULL AND height > 0
+                             AND waist_hip_ratio IS NOT NULL AND body_fat_percentage IS NOT NULL''').fetchall()
+    updates = []
+    for patient_id, age, sex, weight, height, waist_hip_ratio, body_fat_percentage in rows:
+        updates.append((
+            calculate_bmi(weight, height / 100),
+            calculate_bmr(weight, height, age, sex),
+            calculate_lean_body_mass(weight, body_fat_percentage),
+            calculate_body_fat_mass(weight, body_fat_percentage),
+            calculate_muscle_mass(weight, body_fat_percentage),
+            calculate_visceral_fat_level(waist_hip_ratio, sex),
+            calculate_body_water_percentage(weight, body_fat_percentage, sex),
+            calculate_bone_mineral_content(weight),
+            calculate_rmr(weight, height, age, sex),
+            patient_id,
+        ))
+    conn.executemany(f"UPDATE patients SET {', '.join(f'{column} = ?' for column in _DERIVED_COLUMNS)} "
+                     f"WHERE patient_id = ?", updates)
+
+
+# 3: per-patient history in time order; patient_id (the rowid) is implicitly the last key
+def _index_patient_history(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_patients_name_created_at ON patients (name, created_at)')
+
+
+# 4: the trend store, folded forward from every patient's existing scans. The table and the fold are
+# written out here as they stood in this version (trends.py maintains the store from then on); one
+# pass over the (name, created_at) index, one row per patient.
+def _create_trends(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS patient_trends (
+                        name TEXT PRIMARY KEY,
+                        scan_count INTEGER NOT NULL,
+                        first_scan_at TIMESTAMP,
+                        previous_scan_at TIMESTAMP,
+                        last_scan_at TIMESTAMP,
+                        last_patient_id INTEGER,
+                        state TEXT NOT NULL
+                    )''')
+    metrics, window = ('weight', 'body_fat_percentage', 'muscle_mass', 'bmi'), 4
+    trends = {}
+    for name, patient_id, created_at, *values in conn.execute(
+            f'''SELECT name, patient_id, created_at, {', '.join(metrics)} FROM patients
+                WHERE name IS NOT NULL ORDER BY name, created_at, patient_id'''):
+        trend = trends.get(name)
+        if trend is None:
+            trend = trends[name] = [0, created_at, None, None, None,
+                                    {metric: {'first': None, 'previous': None, 'latest': None, 'recent': []}
+                                     for metric in metrics}]
+        trend[0] += 1
+        trend[2], trend[3], trend[4] = trend[3], created_at, patient_id
+        for metric, value in zip(metrics, values):
+            if value is None:
+                continue
+            metric_state = trend[5][metric]
+            if metric_state['first'] is None:
+                metric_state['first'] = value
+            metric_state['previous'] = metric_state['latest']
+            metric_state['latest'] = value
+            metric_state['recent'] = (metric_state['recent'] + [value])[-window:]
+    conn.executemany('''INSERT OR REPLACE INTO patient_trends
+                            (name, scan_count, first_scan_at, previous_scan_at, last_scan_at, last_patient_id, state)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     ((name, *trend[:5], json.dumps(trend[5])) for name, trend in trends.items()))
+
+
+# 5: per-stratum percentile sketches, folded from every existing scan. Strata, metrics and the
+# bucket scheme (1% relative accuracy) are this version's, written out here; cohorts.py keeps the
+# sketches up to date from the cohort_state watermark on. numpy and pandas are imported here, so
+# opening an up-to-date database does not load them.
+def _create_cohorts(conn):
+    import numpy as np
+    import pandas as pd
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS cohort_buckets (
+                        sex TEXT NOT NULL,
+                        age_band TEXT NOT NULL,
+                        metric TEXT NOT NULL,
+                        sign INTEGER NOT NULL,
+                        bucket INTEGER NOT NULL,
+                        count INTEGER NOT NULL,
+                        PRIMARY KEY (sex, age_band, metric, sign, bucket)
+                    ) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS cohort_state (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        last_patient_id INTEGER NOT NULL
+                    )''')
+    conn.execute('INSERT OR IGNORE INTO cohort_state (id, last_patient_id) VALUES (1, 0)')
+    metrics = ('weight', 'body_fat_percentage', 'waist_hip_ratio', 'bmi', 'bmr', 'lean_body_mass', 'body_fat_mass',
+               'muscle_mass', 'visceral_fat_level', 'body_water_percentage', 'bone_mineral_content',
+               'resting_metabolic_rate')
+    bands, labels = (0, 18, 30, 40, 50, 60, 70), ('<18', '18-29', '30-39', '40-49', '50-59', '60-69', '70+')
+    ln_gamma, min_magnitude = math.log(1.01 / 0.99), 1e-9
+    high = conn.execute('SELECT COALESCE(MAX(patient_id), 0) FROM patients').fetchone()[0]
+    for chunk in pd.read_sql_query(f'''SELECT sex, age, {', '.join(metrics)} FROM patients
+                                        WHERE patient_id <= ? AND age IS NOT NULL''', conn, params=(high,),
+                                   chunksize=100000):
+        chunk['sex'] = chunk['sex'].where(chunk['sex'].isin(('Male', 'Female')), 'Other')
+        chunk['age_band'] = np.array(labels)[np.maximum(np.searchsorted(bands, chunk['age'], side='right') - 1, 0)]
+        scans = chunk.melt(id_vars=['sex', 'age_band'], value_vars=list(metrics), var_name='metric')
+        values = pd.to_numeric(scans['value']).to_numpy(dtype=float)
+        scans, values = scans[np.isfinite(values)], values[np.isfinite(values)]
+        scans['sign'] = np.where(values >= min_magnitude, 1, np.where(values <= -min_magnitude, -1, 0))
+        with np.errstate(divide='ignore'):
+            scans['bucket'] = np.where(scans['sign'] != 0, np.ceil(np.log(np.abs(values)) / ln_gamma), 0).astype(int)
+        counts = scans.groupby(['sex', 'age_band', 'metric', 'sign', 'bucket']).size()
+        conn.executemany('''INSERT INTO cohort_buckets (sex, age_band, metric, sign, bucket, count)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            ON CONFLICT DO UPDATE SET count = count + excluded.count''',
+                         (key + (count,) for key, count in counts.items()))
+    conn.execute('UPDATE cohort_state SET last_patient_id = ? WHERE id = 1', (high,))
+
+
+# Scans by registry id in time order, for the per-patient reads
+def _index_patient_registry(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_patients_registry_id_created_at ON patients (registry_id, created_at)')
+
+
+# 6: the patient registry, with one entry per name saved so far (scans saved under one name before
+# this version belong to one patient), every word of each name in registry_terms in this version's
+# search form (case-folded, diacritics removed, punctuation as spaces), and every scan linked to its entry
+def _create_registry(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS patient_registry (
+                        registry_id INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL UNIQUE,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS registry_terms (
+                        term TEXT NOT NULL,
+                        registry_id INTEGER NOT NULL,
+                        PRIMARY KEY (term, registry_id)
+                    ) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_registry_terms_registry_id ON registry_terms (registry_id, term)')
+    if 'registry_id' not in _table_columns(conn, 'patients'):
+        conn.execute('ALTER TABLE patients ADD COLUMN registry_id INTEGER REFERENCES patient_registry (registry_id)')
+    conn.execute('''INSERT OR IGNORE INTO patient_registry (name)
+                    SELECT DISTINCT name FROM patients WHERE name IS NOT NULL''')
+
+    def terms(name):
+        stripped = ''.join(char for char in unicodedata.normalize('NFKD', name) if not unicodedata.combining(char))
+        return re.sub(r'[\W_]+', ' ', stripped.casefold()).split()
+
+    conn.executemany('INSERT OR IGNORE INTO registry_terms (term, registry_id) VALUES (?, ?)',
+                     ((term, registry_id) for registry_id, name in conn.execute(
+                         'SELECT registry_id, name FROM patient_registry').fetchall() for term in terms(name)))
+    conn.execute('''UPDATE patients
+                    SET registry_id = (SELECT registry_id FROM patient_registry r WHERE r.name = patients.name)
+                    WHERE registry_id IS NULL''')
+    _index_patient_registry(conn)
+
+
+# 7: the trend store keyed by registry id rather than name, so a patient's trend follows their registry
+# entry. Every name in patient_trends has had an entry since step 6; the name-keyed table is dropped.
+def _key_trends_by_registry(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS registry_trends (
+                        registry_id INTEGER PRIMARY KEY REFERENCES patient_registry (registry_id),
+                        scan_count INTEGER NOT NULL,
+                        first_scan_at TIMESTAMP,
+                        previous_scan_at TIMESTAMP,
+                        last_scan_at TIMESTAMP,
+                        last_patient_id INTEGER,
+                        state TEXT NOT NULL
+                    )''')
+    conn.execute('''INSERT OR REPLACE INTO registry_trends
+                        (registry_id, scan_count, first_scan_at, previous_scan_at, last_scan_at, last_patient_id, state)
+                    SELECT r.registry_id, t.scan_count, t.first_scan_at, t.previous_scan_at, t.last_scan_at,
+                           t.last_patient_id, t.state
+                    FROM patient_trends t JOIN patient_registry r ON r.name = t.name''')
+    conn.execute('DROP TABLE patient_trends')
+
+
+# Ordered schema versions; PRAGMA user_version records the last one applied to a database.
+# Never edit an applied step, append a new one. A step carries its own DDL and backfill instead of
+# calling the modules that maintain those tables later, so changes to them leave old steps as they were.
+# Steps must stay online: ADD COLUMN, CREATE INDEX, new tables and batched UPDATEs, never a
+# copy-and-rename rebuild of a populated table.
+MIGRATIONS = (
+    (1, 'create patients table', _create_patients),
+    (2, 'backfill derived metrics', _backfill_derived_metrics),
+    (3, 'index patient history', _index_patient_history),
+    (4, 'create trend store', _create_trends),
+    (5, 'create cohort sketches', _create_cohorts),
+    (6, 'create patient registry', _create_registry),
+    (7, 'key trends by registry id', _key_trends_by_registry),
+)
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+_migrated = set()
+_migrated_lock = threading.Lock()
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+# Raise DatabaseCorruptError unless SQLite's structural check passes
+def check_integrity(conn, path=None):
+    try:
+        result = [row[0] for row in conn.execute('PRAGMA quick_check')]
+    except sqlite3.DatabaseError as e:
+        raise DatabaseCorruptError(f'{path or "database"} is corrupt: {e}') from e
+    if result != ['ok']:
+        raise DatabaseCorruptError(f'{path or "database"} is corrupt: {"; ".join(result[:5])}')
+
+
+# Bring a database up to LATEST_VERSION. Each pending step runs in its own write transaction
+# together with its user_version bump, so a failed step leaves the database at the previous
+# version, and a second process racing on the same file re-reads the version under the lock.
+# Databases that predate versioning are integrity-checked first. Returns the versions applied.
+def migrate(conn, path=None):
+    try:
+        current = schema_version(conn)
+    except sqlite3.DatabaseError as e:  # Unreadable header
+        raise DatabaseCorruptError(f'{path or "database"} is corrupt: {e}') from e
+    if current >= LATEST_VERSION:
+        return []
+    check_integrity(conn, path)
+    applied = []
+    for version, _, step in MIGRATIONS:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if schema_version(conn) < version:
+                step(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+                applied.append(version)
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+    return applied
+
+
+# Migrate a database file at most once per process (Streamlit reruns and new pools skip the check)
+def ensure_migrated(conn, path):
+    if path in _migrated:
+        return
+    with _migrated_lock:
+        if path not in _migrated:
+            migrate(conn, path)
+            _migrated.add(path)
+
+
+# Switch the patients table to the compact layout: only the raw measurements are stored and the
+# derived metrics become VIRTUAL generated columns, computed on read from DERIVED_EXPRESSIONS, so a
+# corrected formula applies to every row. Unlike the MIGRATIONS steps this rebuilds the table
+# (copy, drop, rename) under the write lock and then VACUUMs, so run it with the app stopped:
+#   python migrations.py --compact new_patient_data.db
+# Column order, patient ids and the trend store are unchanged. Returns the number of rows whose
+# stored derived values differed from the current formulas, or None if the table was already compact.
+def compact_patients(conn):
+    migrate(conn)
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if generated_columns(conn):
+            conn.execute('ROLLBACK')
+            return None
+        stale = conn.execute('SELECT COUNT(*) FROM patients WHERE '
+                             + ' OR '.join(f'{column} IS NOT ({expression})'
+                                           for column, expression in DERIVED_EXPRESSIONS.items())).fetchone()[0]
+        columns = ',\n'.join(f'{name} REAL GENERATED ALWAYS AS ({DERIVED_EXPRESSIONS[name]}) VIRTUAL'
+                              if name in DERIVED_EXPRESSIONS else f'{name} {sql_type}'
+                              for name, sql_type in PATIENT_TABLE_COLUMNS)
+        stored = ', '.join(name for name, _ in PATIENT_TABLE_COLUMNS if name not in DERIVED_EXPRESSIONS)
+        conn.execute(f'CREATE TABLE patients_compact ({columns})')
+        conn.execute(f'INSERT INTO patients_compact ({stored}) SELECT {stored} FROM patients')
+        conn.execute('DROP TABLE patients')
+        conn.execute('ALTER TABLE patients_compact RENAME TO patients')
+        _index_patient_history(conn)
+        _index_patient_registry(conn)
+    except BaseException:
+        conn.execute('ROLLBACK')
+        raise
+    conn.execute('COMMIT')
+    conn.execute('VACUUM')
+    return stale
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bring patient databases up to the current schema')
+    parser.add_argument('databases', nargs='+', help='SQLite files to migrate')
+    parser.add_argument('--check', action='store_true', help='only report versions and integrity')
+    parser.add_argument('--compact', action='store_true',
+                        help='also switch to the compact layout (derived metrics computed on read); app must be stopped')
+    args = parser.parse_args()
+
+    failed = False
+    for path in args.databases:
+        try:
+            conn = sqlite3.connect(f'file:{path}?mode={"ro" if args.check else "rw"}', uri=True,
+                                   isolation_level=None)
+        except sqlite3.OperationalError as e:
+            print(f'{path}: cannot open ({e})')
+            failed = True
+            continue
+        try:
+            if args.check:
+                check_integrity(conn, path)
+                print(f'{path}: version {schema_version(conn)} of {LATEST_VERSION}, integrity ok')
+            else:
+                before = schema_version(conn)
+                applied = migrate(conn, path)
+                print(f'{path}: version {before} -> {schema_version(conn)}'
+                      + (f" (applied {', '.join(map(str, applied))})" if applied else ''))
+                if args.compact:
+                    stale = compact_patients(conn)
+                    print(f'{path}: already compact' if stale is None
+                          else f'{path}: compact layout, {stale} rows had derived values from older formulas')
+        except sqlite3.DatabaseError as e:
+            print(f'{path}: {e}')
+            failed = True
+        finally:
+            conn.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,315 +1,169 @@
-import pandas as pd
-import streamlit as st
-
-# Define the data
-data = [
-    {
-        "وجبة": "شوفان",
-        "المكونات": "شوفان, حليب, موز, عسل, قرفة",
-        "وزن المكونات (غرام)": "50, 100, 50, 10, 2",
-        "نوع الوجبة": "فطور",
-        "السعرات الحرارية": 250,
-        "الدهون (غرام)": 4,
-        "الكربوهيدرات (غرام)": 45,
-        "البروتين (غرام)": 8,
-        "الكالسيوم (ملغ)": 150,
-        "فيتامين C (ملغ)": 5,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "ساندويتش سلطة البيض",
-        "المكونات": "بيض, خبز, مايونيز, خردل, خس, طماطم",
-        "وزن المكونات (غرام)": "100, 50, 20, 10, 20, 20",
-        "نوع الوجبة": "غداء",
-        "السعرات الحرارية": 320,
-        "الدهون (غرام)": 18,
-        "الكربوهيدرات (غرام)": 25,
-        "البروتين (غرام)": 14,
-        "الكالسيوم (ملغ)": 90,
-        "فيتامين C (ملغ)": 8,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "كاري الدجاج مع الأرز",
-        "المكونات": "دجاج, بصل, طماطم, حليب جوز الهند, مسحوق كاري, أرز",
-        "وزن المكونات (غرام)": "100, 50, 50, 100, 10, 150",
-        "نوع الوجبة": "عشاء",
-        "السعرات الحرارية": 400,
-        "الدهون (غرام)": 20,
-        "الكربوهيدرات (غرام)": 35,
-        "البروتين (غرام)": 22,
-        "الكالسيوم (ملغ)": 60,
-        "فيتامين C (ملغ)": 10,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "زبادي يوناني مع عسل ومكسرات",
-        "المكونات": "زبادي يوناني, عسل, لوز, جوز",
-        "وزن المكونات (غرام)": "150, 20, 15, 15",
-        "نوع الوجبة": "وجبة خفيفة",
-        "السعرات الحرارية": 200,
-        "الدهون (غرام)": 10,
-        "الكربوهيدرات (غرام)": 15,
-        "البروتين (غرام)": 15,
-        "الكالسيوم (ملغ)": 200,
-        "فيتامين C (ملغ)": 0,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "فطور البيض بالشاكشوكة",
-        "المكونات": "طماطم, فلفل حلو, بصل, بيض, ثوم, كمون, فلفل حار مجفف",
-        "وزن المكونات (غرام)": "200, 100, 50, 4, 5, 2, 2",
-        "نوع الوجبة": "فطور",
-        "السعرات الحرارية": 320,
-        "الدهون (غرام)": 18,
-        "الكربوهيدرات (غرام)": 15,
-        "البروتين (غرام)": 15,
-        "الكالسيوم (ملغ)": 80,
-        "فيتامين C (ملغ)": 30,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "فول مدمس",
-        "المكونات": "فول, زيت زيتون, ثوم, عصير ليمون, كمون, ملح",
-        "وزن المكونات (غرام)": "100, 10, 5, 10, 2, 2",
-        "نوع الوجبة": "فطور",
-        "السعرات الحرارية": 300,
-        "الدهون (غرام)": 8,
-        "الكربوهيدرات (غرام)": 45,
-        "البروتين (غرام)": 15,
-        "الكالسيوم (ملغ)": 100,
-        "فيتامين C (ملغ)": 4,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "محشي",
-        "المكونات": "كوسة, باذنجان, فلفل ألوان, طماطم, أرز, بصل, ثوم, بقدونس, شبت, صلصة طماطم",
-        "وزن المكونات (غرام)": "100, 100, 50, 100, 50, 50, 10, 10, 10, 100",
-        "نوع الوجبة": "عشاء",
-        "السعرات الحرارية": 350,
-        "الدهون (غرام)": 7,
-        "الكربوهيدرات (غرام)": 60,
-        "البروتين (غرام)": 10,
-        "الكالسيوم (ملغ)": 80,
-        "فيتامين C (ملغ)": 25,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "ملوخية",
-        "المكونات": "ورق ملوخية, ثوم, كزبرة, مرقة دجاج, زيت زيتون, عصير ليمون",
-        "وزن المكونات (غرام)": "100, 5, 5, 200, 10, 10",
-        "نوع الوجبة": "عشاء",
-        "السعرات الحرارية": 250,
-        "الدهون (غرام)": 15,
-        "الكربوهيدرات (غرام)": 10,
-        "البروتين (غرام)": 20,
-        "الكالسيوم (ملغ)": 150,
-        "فيتامين C (ملغ)": 30,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "كبدة إسكندراني",
-        "المكونات": "كبدة, بصل, ثوم, خل, كمون, كزبرة, زبدة",
-        "وزن المكونات (غرام)": "100, 50, 5, 10, 2, 2, 10",
-        "نوع الوجبة": "عشاء",
-        "السعرات الحرارية": 280,
-        "الدهون (غرام)": 12,
-        "الكربوهيدرات (غرام)": 5,
-        "البروتين (غرام)": 25,
-        "الكالسيوم (ملغ)": 30,
-        "فيتامين C (ملغ)": 2,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "ملوكية",
-        "المكونات": "ورق ملوكية, دجاج, ثوم, كزبرة, زيت زيتون, عصير ليمون",
-        "وزن المكونات (غرام)": "100, 100, 5, 5, 10, 10",
-        "نوع الوجبة": "عشاء",
-        "السعرات الحرارية": 320,
-        "الدهون (غرام)": 18,
-        "الكربوهيدرات (غرام)": 10,
-        "البروتين (غرام)": 28,
-        "الكالسيوم (ملغ)": 150,
-        "فيتامين C (ملغ)": 30,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "رز باللبن",
-        "المكونات": "أرز, حليب, سكر, فانيليا",
-        "وزن المكونات (غرام)": "100, 150, 30, 2",
-        "نوع الوجبة": "حلوى",
-        "السعرات الحرارية": 280,
-        "الدهون (غرام)": 5,
-        "الكربوهيدرات (غرام)": 55,
-        "البروتين (غرام)": 6,
-        "الكالسيوم (ملغ)": 200,
-        "فيتامين C (ملغ)": 0,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "شكشوكة",
-        "المكونات": "طماطم, فلفل حلو, بصل, بيض, ثوم, كمون, بابريكا, فلفل حار مجفف",
-        "وزن المكونات (غرام)": "200, 100, 50, 4, 5, 2, 2, 2",
-        "نوع الوجبة": "فطور",
-        "السعرات الحرارية": 320,
-        "الدهون (غرام)": 18,
-        "الكربوهيدرات (غرام)": 15,
-        "البروتين (غرام)": 15,
-        "الكالسيوم (ملغ)": 80,
-        "فيتامين C (ملغ)": 30,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "فسيخ",
-        "المكونات": "سمك مملح, خبز",
-        "وزن المكونات (غرام)": "150, 100",
-        "نوع الوجبة": "فطور",
-        "السعرات الحرارية": 220,
-        "الدهون (غرام)": 10,
-        "الكربوهيدرات (غرام)": 15,
-        "البروتين (غرام)": 20,
-        "الكالسيوم (ملغ)": 100,
-        "فيتامين C (ملغ)": 2,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "تعمية (فلافل)",
-        "المكونات": "فول مدمس, كزبرة, بقدونس, ثوم, بصل, كمون, دقيق",
-        "وزن المكونات (غرام)": "100, 20, 20, 5, 50, 2, 20",
-        "نوع الوجبة": "غداء",
-        "السعرات الحرارية": 250,
-        "الدهون (غرام)": 10,
-        "الكربوهيدرات (غرام)": 35,
-        "البروتين (غرام)": 10,
-        "الكالسيوم (ملغ)": 60,
-        "فيتامين C (ملغ)": 6,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "مكرونة بالبشاميل",
-        "المكونات": "مكرونة, صلصة بشاميل (زبدة, دقيق, حليب), لحم مفروم, صلصة طماطم",
-        "وزن المكونات (غرام)": "100, 150, 100, 50",
-        "نوع الوجبة": "عشاء",
-        "السعرات الحرارية": 450,
-        "الدهون (غرام)": 20,
-        "الكربوهيدرات (غرام)": 40,
-        "البروتين (غرام)": 25,
-        "الكالسيوم (ملغ)": 150,
-        "فيتامين C (ملغ)": 8,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "كنافة",
-        "المكونات": "عجينة كنافة, جبنة, شراب سكر, زبدة",
-        "وزن المكونات (غرام)": "100, 100, 50, 20",
-        "نوع الوجبة": "حلوى",
-        "السعرات الحرارية": 400,
-        "الدهون (غرام)": 22,
-        "الكربوهيدرات (غرام)": 40,
-        "البروتين (غرام)": 10,
-        "الكالسيوم (ملغ)": 200,
-        "فيتامين C (ملغ)": 0,
-        "النوع": "الحفاظ على الوزن"
-    },
-    {
-        "وجبة": "خبز بلدي مع فول",
-        "المكونات": "خبز بلدي, فول, زيت زيتون, عصير ليمون, ملح",
-        "وزن المكونات (غرام)": "100, 100, 10, 5, 2",
-        "نوع الوجبة": "فطور",
-        "السعرات الحرارية": 300,
-        "الدهون (غرام)": 7,
-        "الكربوهيدرات (غرام)": 45,
-        "البروتين (غرام)": 15,
-        "الكالسيوم (ملغ)": 100,
-        "فيتامين C (ملغ)": 4,
-        "النوع": "الحفاظ على الوزن"
-    }
-]
-
-# Create DataFrame
-df = pd.DataFrame(data)
-
-# Define color mappings for each meal type
-color_mapping = {
-    "فطور": "#FFA07A",  # Light Salmon
-    "غداء": "#87CEEB",      # Sky Blue
-    "عشاء": "#90EE90",     # Light Green
-    "وجبة خفيفة": "#FFD700"       # Gold
-}
-
-# Filter meals based on user preferences
-def filter_meals(df, min_calories, max_calories, min_fat, max_fat):
-    filtered_df = df[(df['السعرات الحرارية'] > min_calories) & (df['السعرات الحرارية'] < max_calories)
-                     & (df['الدهون (غرام)'] > min_fat) & (df['الدهون (غرام)'] < max_fat)]
-    return filtered_df
-
-def generate_meals(df, min_calories, max_calories, min_fat, max_fat, num_breakfast, num_lunch, num_dinner, num_snacks, dietary_restrictions, excluded_ingredients):
-    st.write("Input values:")
-    st.write(f"min_calories: {min_calories}, max_calories: {max_calories}, min_fat: {min_fat}, max_fat: {max_fat}")
-    
-    # Filter meals based on calorie and fat restrictions
-    filtered_df = df[(df['السعرات الحرارية'] >= min_calories) & (df['السعرات الحرارية'] <= max_calories) & (df['الدهون (غرام)'] >= min_fat) & (df['الدهون (غرام)'] <= max_fat)]
-    
-    # Filter out meals based on dietary restrictions
-    for restriction in dietary_restrictions:
-        filtered_df = filtered_df[~filtered_df['المكونات'].str.contains(restriction, case=False)]
-    
-    # Exclude meals based on specified ingredients
-    if excluded_ingredients:
-        excluded_ingredients_list = [ingredient.strip().lower() for ingredient in excluded_ingredients.split(',')]
-        for ingredient in excluded_ingredients_list:
-            filtered_df = filtered_df[~filtered_df['المكونات'].str.contains(ingredient, case=False)]
-    
-    suggested_meals = {}
-    for meal_type, num_meals in zip(["فطور", "غداء", "عشاء", "وجبة خفيفة"], [num_breakfast, num_lunch, num_dinner, num_snacks]):
-        meals_available = filtered_df[filtered_df['نوع الوجبة'] == meal_type]
-        if len(meals_available) > 0:
-            if len(meals_available) >= num_meals:
-                suggested_meals[meal_type] = meals_available.sample(n=num_meals, replace=False)
-            else:
-                st.warning(f"Not enough {meal_type} meals available. Showing all available.")
-                suggested_meals[meal_type] = meals_available
-        else:
-            st.warning(f"No {meal_type} meals available.")
-            suggested_meals[meal_type] = pd.DataFrame(columns=df.columns)  # Empty DataFrame
-    return suggested_meals
-
-def main():
-    st.title("مخطط الوجبات اليومي")
-
-    min_calories = st.sidebar.number_input("السعرات الحرارية الدنيا", min_value=0, value=0)
-    max_calories = st.sidebar.number_input("السعرات الحرارية القصوى", min_value=0, value=2500)
-    num_breakfast = st.sidebar.number_input("عدد وجبات الفطور", min_value=0, value=2)
-    num_lunch = st.sidebar.number_input("عدد وجبات الغداء", min_value=0, value=2)
-    num_dinner = st.sidebar.number_input("عدد وجبات العشاء", min_value=0, value=3)
-    num_snacks = st.sidebar.number_input("عدد وجبات الوجبات الخفيفة", min_value=0, value=1)
-    
-    min_fat = st.sidebar.number_input("الدهون الدنيا (غرام)", min_value=0, value=0)
-    max_fat = st.sidebar.number_input("الدهون القصوى (غرام)", min_value=0, value=100)
-
-    dietary_restrictions = st.sidebar.multiselect("القيود الغذائية", ["نباتي", "نباتي", "خالي من الجلوتين"])
-    
-    excluded_ingredients = st.sidebar.text_input("المكونات المستبعدة (مفصولة بفاصلة)")
-
-    if min_calories > max_calories:
-        st.warning("السعرات الحرارية الدنيا لا يمكن أن تكون أكبر من السعرات الحرارية القصوى. يرجى ضبط القيم.")
-        return
-
-    if st.button("إنشاء الوجبات"):
-        suggested_meals = generate_meals(df, min_calories, max_calories, min_fat, max_fat, num_breakfast, num_lunch, num_dinner, num_snacks, dietary_restrictions, excluded_ingredients)
-        total_calories = sum(meal['السعرات الحرارية'].sum() for meal in suggested_meals.values())
-        if total_calories > max_calories:
-            st.warning("إجمالي السعرات الحرارية للوجبات المختارة يتجاوز السعرات الحرارية القصوى. يرجى ضبط كمية الوجبات.")
-            return
-
-        st.info(f"Total calories of selected meals: {total_calories} kcal (Maximum: {max_calories} kcal)")
-
-
-        st.subheader("الوجبات المُنشأة")
-        for meal_type, meal_data in suggested_meals.items():
-            st.subheader(meal_type)
-            meal_data_styled = meal_data.style.apply(lambda row: [f"background-color: {color_mapping.get(meal_type, '#FFFFFF')}" for _ in row], axis=1)
-            st.write(meal_data_styled)
-
-if __name__ == "__main__":
-    main()
+import pandas as pd
+import streamlit as st
+
+import metrics
+from meal_batch import caseload_targets, plan_caseload
+from meal_catalog import load_catalog, load_ingredient_index, load_search_index
+from meal_index import IngredientIndex
+from meal_solver import plan_meals, MEAL_TYPES
+
+# Ingredients excluded by each dietary restriction (matched as whole ingredients or words)
+restriction_ingredients = {
+    "نباتي": ["دجاج", "لحم", "كبدة", "سمك"],
+    "خالي من الجلوتين": ["خبز", "دقيق", "مكرونة", "شوفان", "كنافة"],
+}
+
+# Define color mappings for each meal type
+color_mapping = {
+    "فطور": "#FFA07A",  # Light Salmon
+    "غداء": "#87CEEB",      # Sky Blue
+    "عشاء": "#90EE90",     # Light Green
+    "وجبة خفيفة": "#FFD700"       # Gold
+}
+
+# Filter meals based on user preferences
+def filter_meals(df, min_calories, max_calories, min_fat, max_fat):
+    filtered_df = df[(df['السعرات الحرارية'] > min_calories) & (df['السعرات الحرارية'] < max_calories)
+                     & (df['الدهون (غرام)'] > min_fat) & (df['الدهون (غرام)'] < max_fat)]
+    return filtered_df
+
+def generate_meals(df, min_calories, max_calories, min_fat, max_fat, num_breakfast, num_lunch, num_dinner, num_snacks, dietary_restrictions, excluded_ingredients, ingredient_index=None, targets=None):
+    st.write("Input values:")
+    st.write(f"min_calories: {min_calories}, max_calories: {max_calories}, min_fat: {min_fat}, max_fat: {max_fat}")
+    
+    # Exclude meals based on dietary restrictions and specified ingredients, as one set operation on the ingredient index
+    allowed = None
+    excluded_terms = [term for restriction in dietary_restrictions for term in restriction_ingredients.get(restriction, [restriction])]
+    if excluded_ingredients:
+        excluded_terms += [ingredient.strip() for ingredient in excluded_ingredients.split(',') if ingredient.strip()]
+    if excluded_terms:
+        if ingredient_index is None:
+            ingredient_index = IngredientIndex(df['المكونات'])
+        allowed = ingredient_index.without(excluded_terms)
+    
+    # Pick the whole day's meals in one solve so the calorie and fat totals land inside their windows
+    meal_counts = dict(zip(MEAL_TYPES, [num_breakfast, num_lunch, num_dinner, num_snacks]))
+    plan = plan_meals(df, meal_counts, min_calories, max_calories, min_fat, max_fat, targets, allowed)
+    
+    suggested_meals = {}
+    for meal_type, num_meals in meal_counts.items():
+        missing = plan['shortfalls'].get(meal_type, 0)
+        if missing == num_meals and num_meals > 0:
+            st.warning(f"No {meal_type} meals available.")
+        elif missing:
+            st.warning(f"Not enough {meal_type} meals available. Showing all available.")
+        suggested_meals[meal_type] = df.iloc[plan['meals'].get(meal_type, [])]
+    return suggested_meals, plan
+
+# Catalog search by meal name or ingredient, best matches first. A fragment, so typing a query reruns
+# only this section.
+@st.fragment
+@metrics.rerun('meals.search_view')
+def show_meal_search():
+    query = st.text_input("ابحث عن وجبة أو مكون",
+                          help="Matches meal names and ingredients; Arabic spelling variants and small typos are tolerated")
+    if not query.strip():
+        return
+    with metrics.span('meals.search'):
+        df = load_catalog()
+        rows, _ = load_search_index().search(query)
+    if not len(rows):
+        st.info("لا توجد وجبات مطابقة")
+        return
+    st.dataframe(df.iloc[rows], hide_index=True)
+
+
+# Multi-day plans for a whole caseload, computed in a process pool and shown per patient as each completes.
+# A fragment, so its inputs rerun only this section.
+@st.fragment
+@metrics.rerun('meals.caseload_view')
+def show_caseload_planner():
+    with st.expander("خطط متعددة الأيام لعدة مرضى"):
+        caseload_file = st.file_uploader("Caseload CSV", type=["csv"],
+                                         help="One row per patient: name plus min_calories/max_calories, or the analyzer inputs (weight, height, age, sex, activity, goal_weight, rate_of_change)")
+        days = st.number_input("عدد الأيام", min_value=1, max_value=28, value=7)
+        variety_window = st.number_input("عدم تكرار الوجبة خلال (أيام)", min_value=0, max_value=14, value=3)
+        if caseload_file is None or not st.button("إنشاء الخطط"):
+            return
+        try:
+            targets = caseload_targets(pd.read_csv(caseload_file))
+        except (ValueError, KeyError) as e:
+            st.error(f"Invalid caseload file: {e}")
+            return
+        progress = st.progress(0.0)
+        with metrics.span('meals.caseload'):
+            for done, result in enumerate(plan_caseload(targets, days, variety_window), start=1):
+                progress.progress(done / len(targets), text=f"{done} / {len(targets)} patients")
+                with st.expander(result['patient']):
+                    for day in result['days']:
+                        if day['status'] in ('infeasible', 'unknown'):
+                            st.warning(f"Day {day['day']}: no plan fits the calorie and fat limits.")
+                            continue
+                        st.markdown(f"**Day {day['day']}** — {day['totals']['calories']:.0f} kcal")
+                        st.write({meal_type: ", ".join(names) for meal_type, names in day['meals'].items()})
+
+
+# The generate button and the day's plan. A fragment: pressing the button reruns only this section with the
+# sidebar settings of the last full run, not the sidebar or the caseload planner.
+@st.fragment
+@metrics.rerun('meals.plan_view')
+def show_meal_plan(min_calories, max_calories, min_fat, max_fat, num_breakfast, num_lunch, num_dinner, num_snacks, dietary_restrictions, excluded_ingredients, targets):
+    if st.button("إنشاء الوجبات"):
+        # The catalog is read from disk on first use and cached for the whole process
+        with metrics.span('meals.load_catalog'):
+            df = load_catalog()
+            ingredient_index = load_ingredient_index()
+        with metrics.span('meals.generate'):
+            suggested_meals, plan = generate_meals(df, min_calories, max_calories, min_fat, max_fat, num_breakfast, num_lunch, num_dinner, num_snacks, dietary_restrictions, excluded_ingredients, ingredient_index, targets)
+        if plan['status'] == 'infeasible':
+            st.warning("No combination of the available meals fits the calorie and fat limits. Please adjust the limits or the number of meals.")
+            return
+        if plan['status'] == 'unknown':
+            st.warning("No plan fitting the calorie and fat limits was found in time. Please try again or relax the limits.")
+            return
+        if plan['status'] == 'feasible':
+            st.caption("Best plan found within the time limit.")
+        total_calories = sum(meal['السعرات الحرارية'].sum() for meal in suggested_meals.values())
+
+        st.info(f"Total calories of selected meals: {total_calories} kcal (Maximum: {max_calories} kcal)")
+
+
+        st.subheader("الوجبات المُنشأة")
+        with metrics.span('meals.render'):
+            for meal_type, meal_data in suggested_meals.items():
+                st.subheader(meal_type)
+                meal_data_styled = meal_data.style.apply(lambda row: [f"background-color: {color_mapping.get(meal_type, '#FFFFFF')}" for _ in row], axis=1)
+                st.write(meal_data_styled)
+
+
+def main():
+    st.title("مخطط الوجبات اليومي")
+    show_meal_search()
+    show_caseload_planner()
+
+    min_calories = st.sidebar.number_input("السعرات الحرارية الدنيا", min_value=0, value=0, help="Daily total")
+    max_calories = st.sidebar.number_input("السعرات الحرارية القصوى", min_value=0, value=2500, help="Daily total")
+    num_breakfast = st.sidebar.number_input("عدد وجبات الفطور", min_value=0, value=2)
+    num_lunch = st.sidebar.number_input("عدد وجبات الغداء", min_value=0, value=2)
+    num_dinner = st.sidebar.number_input("عدد وجبات العشاء", min_value=0, value=3)
+    num_snacks = st.sidebar.number_input("عدد وجبات الوجبات الخفيفة", min_value=0, value=1)
+    
+    min_fat = st.sidebar.number_input("الدهون الدنيا (غرام)", min_value=0, value=0, help="Daily total")
+    max_fat = st.sidebar.number_input("الدهون القصوى (غرام)", min_value=0, value=150, help="Daily total")
+    protein_target = st.sidebar.number_input("هدف البروتين (غرام)", min_value=0, value=0, help="Daily target; 0 for none")
+    carbohydrates_target = st.sidebar.number_input("هدف الكربوهيدرات (غرام)", min_value=0, value=0, help="Daily target; 0 for none")
+
+    dietary_restrictions = st.sidebar.multiselect("القيود الغذائية", ["نباتي", "نباتي", "خالي من الجلوتين"])
+    
+    excluded_ingredients = st.sidebar.text_input("المكونات المستبعدة (مفصولة بفاصلة)")
+
+    if min_calories > max_calories:
+        st.warning("السعرات الحرارية الدنيا لا يمكن أن تكون أكبر من السعرات الحرارية القصوى. يرجى ضبط القيم.")
+        return
+
+    targets = {'protein': protein_target, 'carbohydrates': carbohydrates_target}
+    show_meal_plan(min_calories, max_calories, min_fat, max_fat, num_breakfast, num_lunch, num_dinner, num_snacks, dietary_restrictions, excluded_ingredients, targets)
+
+if __name__ == "__main__":
+    with metrics.rerun('meals.rerun'):
+        main()
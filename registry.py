@@ -0,0 +1,114 @@
+from text_search import search_key
+
+
+# Most matches returned by a search
+SEARCH_LIMIT = 10
+
+# Matching terms counted per word of a multi-word query (at most) to pick the one to walk the index by
+SELECTIVITY_SAMPLE = 1000
+
+# Sorts after every character a search term can contain, closing a prefix range
+_PREFIX_END = '\U0010ffff'
+
+
+def create_registry_schema(conn):
+    # One row per patient; `name` is unique, so a namesake is registered under a numbered label.
+    # registry_terms indexes every word of every name (search_key form) for prefix lookups, and by
+    # patient for checking the other words of a multi-word query.
+    conn.execute('''CREATE TABLE IF NOT EXISTS patient_registry (
+                        registry_id INTEGER PRIMARY KEY,
+                        name TEXT NOT NULL UNIQUE,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS registry_terms (
+                        term TEXT NOT NULL,
+                        registry_id INTEGER NOT NULL,
+                        PRIMARY KEY (term, registry_id)
+                    ) WITHOUT ROWID''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_registry_terms_registry_id ON registry_terms (registry_id, term)')
+
+
+def _index_terms(conn, entries):
+    conn.executemany('INSERT OR IGNORE INTO registry_terms (term, registry_id) VALUES (?, ?)',
+                     ((term, registry_id) for registry_id, name in entries for term in search_key(name).split()))
+
+
+def _add(conn, name, registry_id=None):
+    registry_id = conn.execute('INSERT INTO patient_registry (registry_id, name) VALUES (?, ?)',
+                               (registry_id, name)).lastrowid
+    _index_terms(conn, ((registry_id, name),))
+    return registry_id
+
+
+# Id of the patient registered under exactly `name`, or None
+def lookup(conn, name):
+    row = conn.execute('SELECT registry_id FROM patient_registry WHERE name = ?', (name,)).fetchone()
+    return row[0] if row is not None else None
+
+
+# Id of the patient registered under exactly `name`, registering them if there is none.
+# Used by the insert paths, which receive names; runs inside the caller's write transaction.
+def resolve(conn, name):
+    registry_id = lookup(conn, name)
+    return registry_id if registry_id is not None else _add(conn, name)
+
+
+def _taken(conn, name):
+    return lookup(conn, name) is not None
+
+
+# Register a new patient and return (registry_id, name). If the name is taken, the namesake is
+# registered as 'name #id' instead of being merged with the existing patient, with the next unused
+# id if a patient was already saved under that label.
+def register(conn, name):
+    if not _taken(conn, name):
+        return _add(conn, name), name
+    registry_id = conn.execute('SELECT COALESCE(MAX(registry_id), 0) + 1 FROM patient_registry').fetchone()[0]
+    while _taken(conn, f'{name} #{registry_id}'):
+        registry_id += 1
+    label = f'{name} #{registry_id}'
+    return _add(conn, label, registry_id), label
+
+
+def _matching_terms(conn, word):
+    return conn.execute('SELECT COUNT(*) FROM (SELECT 1 FROM registry_terms WHERE term >= ? AND term < ? LIMIT ?)',
+                        (word, word + _PREFIX_END, SELECTIVITY_SAMPLE)).fetchone()[0]
+
+
+# Patients whose name has a word starting with each word of `query`, best match first: the patient
+# registered under exactly `query`, then by the matching word of the query's most selective word,
+# then by registration. Walks the registry_terms index from that prefix, checks the other words per
+# patient, and stops after `limit` patients, so the cost does not grow with the registry.
+# Returns dicts with registry_id, name, scan_count and last_scan_at (None without scans).
+def search(conn, query, limit=SEARCH_LIMIT):
+    words = search_key(query).split()
+    if not words:
+        return []
+    if len(words) > 1:
+        words.sort(key=lambda word: _matching_terms(conn, word))
+    sql = 'SELECT registry_id FROM registry_terms m WHERE term >= ? AND term < ?'
+    params = [words[0], words[0] + _PREFIX_END]
+    for word in words[1:]:
+        sql += ''' AND EXISTS (SELECT 1 FROM registry_terms o
+                               WHERE o.registry_id = m.registry_id AND o.term >= ? AND o.term < ?)'''
+        params += [word, word + _PREFIX_END]
+    exact = lookup(conn, query)
+    ids = [exact] if exact is not None else []
+    cursor = conn.execute(sql + ' ORDER BY term, registry_id', params)
+    try:
+        for (registry_id,) in cursor:
+            if len(ids) == limit:
+                break
+            if registry_id not in ids:
+                ids.append(registry_id)
+    finally:
+        cursor.close()
+    if not ids:
+        return []
+    rows = conn.execute(f'''SELECT r.registry_id, r.name, t.scan_count, t.last_scan_at
+                            FROM patient_registry r LEFT JOIN registry_trends t ON t.registry_id = r.registry_id
+                            WHERE r.registry_id IN ({', '.join('?' * len(ids))})''', ids).fetchall()
+    by_id = {row[0]: row for row in rows}
+    return [{'registry_id': registry_id, 'name': by_id[registry_id][1], 'scan_count': by_id[registry_id][2] or 0,
+             'last_scan_at': by_id[registry_id][3]}
+            for registry_id in ids]
@@ -0,0 +1,152 @@
+import argparse
+import json
+import math
+import os
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from batch_calculations import (calculate_body_composition_batch, calculate_calorie_intake_batch, INPUT_COLUMNS,
+                                DERIVED_COLUMNS)
+from classification import classify_columns
+
+
+# Largest batch accepted in one request
+MAX_BATCH_ROWS = 10000
+
+# Batches at least this large are computed on a worker thread so they do not stall other requests
+THREADPOOL_MIN_ROWS = 2000
+
+# Inputs of the calorie intake endpoints, in calculate_calorie_intake argument order
+CALORIE_INPUTS = ('weight', 'height', 'age', 'sex', 'activity', 'goal_weight', 'rate_of_change')
+
+# Inputs that are labels rather than numbers
+TEXT_INPUTS = ('sex', 'activity')
+
+# Inputs that must be greater than zero: BMI divides by height, and no formula means anything for a
+# zero or negative body size
+POSITIVE_INPUTS = ('weight', 'height')
+
+
+class RequestError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# A JSON number as a finite float, or None. Integers too large for a float count as invalid.
+def _finite_number(value):
+    if not isinstance(value, (int, float)) or isinstance(value, bool):
+        return None
+    try:
+        value = float(value)
+    except OverflowError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+# Turn a list of JSON records into one column per field, rejecting missing or non-numeric values
+def _columns(records, fields):
+    if not isinstance(records, list) or not records:
+        raise RequestError('Expected a non-empty list of records')
+    if len(records) > MAX_BATCH_ROWS:
+        raise RequestError(f'At most {MAX_BATCH_ROWS} records per request', 413)
+    columns = {field: [] for field in fields}
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise RequestError(f'Record {index} is not an object')
+        for field in fields:
+            value = record.get(field)
+            if field not in TEXT_INPUTS:
+                value = _finite_number(value)
+            if not isinstance(value, str if field in TEXT_INPUTS else float):
+                raise RequestError(f'Record {index}: missing or invalid {field!r}')
+            if field in POSITIVE_INPUTS and value <= 0:
+                raise RequestError(f'Record {index}: {field!r} must be positive')
+            columns[field].append(value)
+    return columns
+
+
+# A result as JSON allows it: NaN and infinities (from inputs no formula is defined for) become null
+def _json_values(array):
+    return [None if isinstance(value, float) and not math.isfinite(value) else value for value in array.tolist()]
+
+
+def _score_scans(columns):
+    results = calculate_body_composition_batch(*(columns[column] for column in INPUT_COLUMNS))
+    results['waist_hip_ratio'] = columns['waist_hip_ratio']
+    statuses = {column: labels.tolist()
+                for column, labels in classify_columns(results, columns['sex'], columns['age']).items()}
+    values = {column: _json_values(results[column]) for column in DERIVED_COLUMNS}
+    return [{**{column: values[column][row] for column in DERIVED_COLUMNS},
+             'status': {column: statuses[column][row] for column in statuses}}
+            for row in range(len(columns['sex']))]
+
+
+def _calorie_intake(columns):
+    min_intake, max_intake = calculate_calorie_intake_batch(*(columns[column] for column in CALORIE_INPUTS))
+    return [{'min_calorie_intake': low, 'max_calorie_intake': high}
+            for low, high in zip(_json_values(min_intake), _json_values(max_intake))]
+
+
+async def _read_json(request):
+    try:
+        return await request.json()
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise RequestError('Request body is not valid JSON')
+
+
+# Run a batch computation, moving large ones off the event loop
+async def _compute(compute, columns, rows):
+    if rows >= THREADPOOL_MIN_ROWS:
+        return await run_in_threadpool(compute, columns)
+    return compute(columns)
+
+
+def _endpoint(compute, fields, batch_key=None):
+    async def endpoint(request):
+        try:
+            payload = await _read_json(request)
+            if not isinstance(payload, dict):
+                raise RequestError(f'Expected an object with a {batch_key!r} list of records' if batch_key
+                                   else 'Expected an object with the record fields')
+            records = payload.get(batch_key) if batch_key else [payload]
+            columns = _columns(records, fields)
+            results = await _compute(compute, columns, len(records))
+        except RequestError as e:
+            return JSONResponse({'error': str(e)}, status_code=e.status_code)
+        except ValueError as e:  # e.g. an unknown activity level
+            return JSONResponse({'error': str(e)}, status_code=400)
+        return JSONResponse({batch_key: results} if batch_key else results[0])
+    return endpoint
+
+
+async def health(request):
+    return JSONResponse({'status': 'ok'})
+
+
+app = Starlette(routes=[
+    Route('/healthz', health),
+    Route('/v1/body-composition', _endpoint(_score_scans, INPUT_COLUMNS), methods=['POST']),
+    Route('/v1/body-composition/batch', _endpoint(_score_scans, INPUT_COLUMNS, 'scans'), methods=['POST']),
+    Route('/v1/calorie-intake', _endpoint(_calorie_intake, CALORIE_INPUTS), methods=['POST']),
+    Route('/v1/calorie-intake/batch', _endpoint(_calorie_intake, CALORIE_INPUTS, 'patients'), methods=['POST']),
+])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP service for body-composition and calorie calculations')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--workers', type=int, default=1, help='worker processes')
+    args = parser.parse_args()
+
+    uvicorn.run('service:app', host=args.host, port=args.port, workers=args.workers,
+                app_dir=os.path.dirname(os.path.abspath(__file__)), access_log=False, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
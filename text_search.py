@@ -0,0 +1,10 @@
+import re
+import unicodedata
+
+
+# Searchable form of a name: case-folded, accents and Arabic diacritics (harakat, hamza marks)
+# removed, punctuation turned into spaces. Shared by the patient registry and the meal indexes.
+def search_key(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(re.sub(r'[\W_]+', ' ', stripped.casefold()).split())
@@ -0,0 +1,110 @@
+import json
+from datetime import datetime
+
+
+# Per-patient metrics tracked by the trend store
+TREND_METRICS = ('weight', 'body_fat_percentage', 'muscle_mass', 'bmi')
+
+# Number of most recent scans averaged for the rolling mean
+ROLLING_WINDOW = 4
+
+# A patient's trend as stored in registry_trends (migration 7): one row per patient keyed by registry id,
+# folded forward scan by scan. `state` holds, per metric, the first, previous and latest values plus
+# the last ROLLING_WINDOW values as JSON.
+def _empty_trend(registry_id):
+    return {'registry_id': registry_id, 'scan_count': 0, 'first_scan_at': None, 'previous_scan_at': None,
+            'last_scan_at': None, 'last_patient_id': None,
+            'state': {metric: {'first': None, 'previous': None, 'latest': None, 'recent': []}
+                      for metric in TREND_METRICS}}
+
+
+def _load_trend(conn, registry_id):
+    row = conn.execute('''SELECT scan_count, first_scan_at, previous_scan_at, last_scan_at, last_patient_id, state
+                          FROM registry_trends WHERE registry_id = ?''', (registry_id,)).fetchone()
+    if row is None:
+        return _empty_trend(registry_id)
+    return {'registry_id': registry_id, 'scan_count': row[0], 'first_scan_at': row[1], 'previous_scan_at': row[2],
+            'last_scan_at': row[3], 'last_patient_id': row[4], 'state': json.loads(row[5])}
+
+
+def _save_trend(conn, trend):
+    conn.execute('''INSERT OR REPLACE INTO registry_trends
+                        (registry_id, scan_count, first_scan_at, previous_scan_at, last_scan_at, last_patient_id, state)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                 (trend['registry_id'], trend['scan_count'], trend['first_scan_at'], trend['previous_scan_at'],
+                  trend['last_scan_at'], trend['last_patient_id'], json.dumps(trend['state'])))
+
+
+# Fold one scan (in time order) into a patient's trend
+def _apply_scan(trend, patient_id, created_at, values):
+    if trend['first_scan_at'] is None:
+        trend['first_scan_at'] = created_at
+    trend['previous_scan_at'] = trend['last_scan_at']
+    trend['last_scan_at'] = created_at
+    trend['last_patient_id'] = patient_id
+    trend['scan_count'] += 1
+    for metric, value in zip(TREND_METRICS, values):
+        if value is None:
+            continue
+        metric_state = trend['state'][metric]
+        if metric_state['first'] is None:
+            metric_state['first'] = value
+        metric_state['previous'] = metric_state['latest']
+        metric_state['latest'] = value
+        metric_state['recent'] = (metric_state['recent'] + [value])[-ROLLING_WINDOW:]
+
+
+# Bring the trends of the patients `registry_ids` up to date inside the caller's write transaction.
+# Only scans after the last one folded in are read, through the (registry_id, created_at) index.
+# `earliest` maps a registry id to the oldest created_at just written for it; if that is older than
+# the trend's last scan (a backfilled import), the patient's trend is rebuilt from full history instead.
+def update_trends(conn, registry_ids, earliest=None):
+    earliest = earliest or {}
+    for registry_id in registry_ids:
+        trend = _load_trend(conn, registry_id)
+        backfilled = (trend['last_scan_at'] is not None and earliest.get(registry_id) is not None
+                      and str(earliest[registry_id]) < trend['last_scan_at'])
+        query = f"SELECT patient_id, created_at, {', '.join(TREND_METRICS)} FROM patients WHERE registry_id = ?"
+        params = [registry_id]
+        if backfilled:
+            trend = _empty_trend(registry_id)
+        elif trend['last_scan_at'] is not None:
+            query += ' AND (created_at, patient_id) > (?, ?)'
+            params.extend((trend['last_scan_at'], trend['last_patient_id']))
+        query += ' ORDER BY created_at, patient_id'
+        for row in conn.execute(query, params):
+            _apply_scan(trend, row[0], row[1], row[2:])
+        if trend['scan_count']:
+            _save_trend(conn, trend)
+
+
+def _days_between(start, end):
+    if start is None or end is None:
+        return None
+    days = (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds() / 86400
+    return days if days > 0 else None
+
+
+# Read a patient's trend summary: latest values, delta since the previous scan, rolling mean over
+# the last ROLLING_WINDOW scans, and change per week since the previous scan and since the first
+# scan. Returns None for patients without scans. One primary-key lookup regardless of history size.
+def read_trend(conn, registry_id):
+    trend = _load_trend(conn, registry_id)
+    if not trend['scan_count']:
+        return None
+    last_interval = _days_between(trend['previous_scan_at'], trend['last_scan_at'])
+    whole_interval = _days_between(trend['first_scan_at'], trend['last_scan_at'])
+    metrics = {}
+    for metric in TREND_METRICS:
+        metric_state = trend['state'][metric]
+        latest, previous, first = metric_state['latest'], metric_state['previous'], metric_state['first']
+        delta = latest - previous if latest is not None and previous is not None else None
+        metrics[metric] = {
+            'latest': latest,
+            'delta': delta,
+            'rolling_mean': sum(metric_state['recent']) / len(metric_state['recent']) if metric_state['recent'] else None,
+            'weekly_change': delta / last_interval * 7 if delta is not None and last_interval else None,
+            'overall_weekly_change': (latest - first) / whole_interval * 7 if latest is not None and whole_interval else None,
+        }
+    return {'scan_count': trend['scan_count'], 'first_scan_at': trend['first_scan_at'],
+            'last_scan_at': trend['last_scan_at'], 'metrics': metrics}